@@ -0,0 +1 @@
+""" here we serve the headless JSON/SSE API for programmatic clients """
\ No newline at end of file
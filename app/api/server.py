@@ -0,0 +1,149 @@
+import os
+import json
+import queue
+import threading
+from app.core.chat import ChatError, load_user, end_session, chat_turn, run_memory_update
+from app.db.coach_state_repo import get_or_create_coach_state, is_fallback_state
+from app.db.recent_turns_repo import load_turns_before
+from app.db.usage_repo import top_consumers, daily_totals
+from app.core.history import CHAT_WINDOW_MESSAGES
+from app.utils.admission import admission
+from app.utils.circuit_breaker import render_breaker_metrics
+from app.utils.ledger import usage_ledger
+
+# "ui": Gradio demo plus the JSON API; "api": JSON API only (no Gradio)
+APP_MODE = os.getenv("APP_MODE", "ui")
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def stream_chat_events(user_id: str, message: str):
+    """
+    Runs a chat turn in a background thread and yields it as Server-Sent Events:
+    `token` events with text chunks, then `done` with the full reply, or `error`.
+    The turn is saved even if the client disconnects mid-stream.
+    """
+    events = queue.Queue()
+
+    def run():
+        try:
+            reply = chat_turn(user_id, message, on_token=lambda text: events.put(_sse("token", {"text": text})))
+            events.put(_sse("done", {"reply": reply}))
+        except ChatError as e:
+            events.put(_sse("error", {"error": e.message, "status": e.status}))
+        finally:
+            events.put(None)
+
+    threading.Thread(target=run, name="sse-chat", daemon=True).start()
+    while True:
+        item = events.get()
+        if item is None:
+            return
+        yield item
+
+
+def _encode_cursor(cursor: tuple[str, int] | None) -> str | None:
+    return f"{cursor[1]}:{cursor[0]}" if cursor else None
+
+
+def _decode_cursor(value: str | None) -> tuple[str, int] | None:
+    if not value:
+        return None
+    row_id, _, created_at = value.partition(":")
+    return created_at, int(row_id)
+
+
+def create_api_app():
+    """
+    Lean JSON/SSE API over the shared chat pipeline, plus Prometheus /metrics.
+    Clients send only the new message; history lives server-side.
+    """
+    from fastapi import FastAPI, HTTPException
+    from fastapi.responses import PlainTextResponse, StreamingResponse
+    from pydantic import BaseModel
+
+    class MessageRequest(BaseModel):
+        message: str
+        stream: bool = False
+
+    app = FastAPI()
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    def metrics():
+        return admission.render_metrics() + render_breaker_metrics()
+
+    # Sync handlers run in the threadpool; admission control bounds LLM concurrency
+    @app.post("/api/users/{user_id}/load")
+    def load(user_id: str):
+        try:
+            state = load_user(user_id)
+        except ChatError as e:
+            raise HTTPException(status_code=e.status, detail=e.message)
+        return {"user_id": user_id, "state": state, "degraded": is_fallback_state(state)}
+
+    @app.get("/api/users/{user_id}/state")
+    def state(user_id: str):
+        state = get_or_create_coach_state(user_id)
+        return {"user_id": user_id, "state": state, "degraded": is_fallback_state(state)}
+
+    @app.post("/api/users/{user_id}/messages")
+    def send_message(user_id: str, body: MessageRequest):
+        if body.stream:
+            return StreamingResponse(
+                stream_chat_events(user_id, body.message),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
+        try:
+            reply = chat_turn(user_id, body.message)
+        except ChatError as e:
+            raise HTTPException(status_code=e.status, detail=e.message)
+        return {"reply": reply}
+
+    @app.get("/api/users/{user_id}/history")
+    def history(user_id: str, before: str = None, limit: int = None):
+        # Newest page first; pass `before` back to page further into the past
+        limit = max(1, min(limit or CHAT_WINDOW_MESSAGES, 200))
+        try:
+            turns, cursor = load_turns_before(user_id, limit, _decode_cursor(before))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        except Exception as e:
+            raise HTTPException(status_code=503, detail=f"History unavailable: {e}")
+        return {"messages": [{"role": t["role"], "content": t["content"], "created_at": t["created_at"]} for t in turns],
+                "before": _encode_cursor(cursor)}
+
+    @app.post("/api/users/{user_id}/memory-update")
+    def memory_update(user_id: str):
+        success, message = run_memory_update(user_id)
+        return {"success": success, "message": message}
+
+    @app.get("/api/usage/top")
+    def usage_top(days: int = 7, limit: int = 10, call_type: str = None):
+        # Include this worker's unflushed counts
+        usage_ledger.flush()
+        return {"days": days, "users": top_consumers(days, limit, call_type)}
+
+    @app.get("/api/usage/daily")
+    def usage_daily(days: int = 30, user_id: str = None):
+        usage_ledger.flush()
+        return {"days": days, "totals": daily_totals(days, user_id)}
+
+    @app.post("/api/users/{user_id}/session/end")
+    def session_end(user_id: str):
+        end_session(user_id)
+        return {"ok": True}
+
+    return app
+
+
+def create_server(mode: str = None):
+    """
+    The ASGI app for APP_MODE: Gradio demo plus API ("ui") or API only ("api").
+    """
+    if (mode or APP_MODE) == "api":
+        return create_api_app()
+    from app.ui.gradio_app import create_app
+    return create_app()
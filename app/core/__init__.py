@@ -0,0 +1 @@
+""" here we keep the chat pipeline shared by the Gradio UI and the JSON API """
\ No newline at end of file
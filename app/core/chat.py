@@ -0,0 +1,191 @@
+import json
+import os
+from app.db.coach_state_repo import get_or_create_coach_state
+from app.db.recent_turns_repo import save_turn_pair, load_recent_turns
+from app.db.emotion_series_repo import get_trend_summary
+from app.llm.prompts import COACH_SYSTEM_PROMPT, FUSED_STATE_DELTA_INSTRUCTIONS
+from app.llm.responder import get_message_completion, get_fused_completion, stream_message_completion
+from app.memory.updater import perform_memory_update
+from app.memory.autosave import autosave_policy, AUTOSAVE_FUSED_TOKEN_WEIGHT
+from app.memory.delta import apply_delta_async
+from app.memory.episodic import episodic_memory
+from app.utils.admission import admission, AdmissionRejected
+from app.utils.circuit_breaker import CircuitOpenError
+from app.utils.ledger import usage_context
+from app.utils.profiling import profiled
+from app.utils.tracing import traced
+
+# COACH_FUSED_MODE=1: the reply call also returns a state delta (one LLM call per turn)
+COACH_FUSED_MODE = os.getenv("COACH_FUSED_MODE", "0") == "1"
+
+
+class ChatError(Exception):
+    """
+    A chat request that could not be served. message is safe to show to the
+    user; status is the matching HTTP status for the API.
+    """
+
+    def __init__(self, message: str, status: int = 500):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+@traced("load_user_state")
+def load_user(user_id: str) -> dict:
+    """
+    Loads (or creates) the user's coach_state.
+    """
+    if not user_id or not user_id.strip():
+        raise ChatError("Please enter a User ID to start.", 400)
+    return get_or_create_coach_state(user_id.strip())
+
+
+def end_session(user_id: str) -> None:
+    """
+    Lets the autosave policy flush the user's pending turns.
+    """
+    autosave_policy.end_session(user_id)
+
+
+def build_messages(user_id: str, user_message: str) -> list[dict]:
+    """
+    Prompt for one coach turn: system prompt, COACH_STATE, optional
+    EMOTIONAL_TRENDS, RECENT_TURNS, optional RELEVANT_PAST_TURNS, then the
+    user's message.
+    """
+    coach_state = get_or_create_coach_state(user_id)
+    system_prompt = COACH_SYSTEM_PROMPT + FUSED_STATE_DELTA_INSTRUCTIONS if COACH_FUSED_MODE else COACH_SYSTEM_PROMPT
+    messages = [{"role": "system", "content": system_prompt}]
+    messages.append({"role": "user", "content": f"COACH_STATE:\n{json.dumps(coach_state, indent=2)}"})
+    messages.append({"role": "assistant", "content": "I've reviewed the COACH_STATE."})
+    
+    # Emotional trends from the pre-aggregated rollups (cached; empty for new users)
+    trends = get_trend_summary(user_id)
+    if trends:
+        messages.append({"role": "user", "content": f"EMOTIONAL_TRENDS:\n{trends}"})
+        messages.append({"role": "assistant", "content": "I have reviewed the EMOTIONAL_TRENDS."})
+    
+    # PHASE 2: Load recent turns from DB for context
+    # User Requirement: Inject RECENT_TURNS as a separate context message
+    db_history = load_recent_turns(user_id, limit=20)
+    if db_history:
+        recent_turns_json = json.dumps(db_history, indent=2)
+        messages.append({"role": "user", "content": f"RECENT_TURNS:\n{recent_turns_json}"})
+        messages.append({"role": "assistant", "content": "I have reviewed the RECENT_TURNS."})
+    else:
+        messages.append({"role": "user", "content": "RECENT_TURNS: []"})
+        messages.append({"role": "assistant", "content": "I have reviewed the RECENT_TURNS."})
+    
+    # Episodic memory: older turns relevant to this message, beyond the recent window
+    if episodic_memory:
+        try:
+            recalled = episodic_memory.retrieve(
+                user_id, user_message, exclude={t["content"] for t in db_history}
+            )
+        except Exception as e:
+            print(f"[Episodic] ✗ Retrieval failed: {e}")
+            recalled = []
+        if recalled:
+            past_turns = [{"role": t["role"], "content": t["content"]} for t in recalled]
+            messages.append({"role": "user", "content": f"RELEVANT_PAST_TURNS:\n{json.dumps(past_turns, indent=2)}"})
+            messages.append({"role": "assistant", "content": "I have reviewed the RELEVANT_PAST_TURNS."})
+    
+    messages.append({"role": "user", "content": user_message})
+    return messages
+
+
+def record_turn(user_id: str, user_message: str, response: str, state_delta: dict | None) -> None:
+    """
+    Persists the exchange and feeds it to episodic memory and the autosave policy.
+    """
+    # PHASE 2: Save turns to DB
+    # Pruned turns are indexed before deletion, in case they predate episodic memory
+    archive = (lambda rows: episodic_memory.add_turns(user_id, rows, skip_indexed=True)) if episodic_memory else None
+    save_turn_pair(user_id, user_message, response, archive=archive)
+    if episodic_memory:
+        try:
+            episodic_memory.add_turns(user_id, [
+                {"role": "user", "content": user_message},
+                {"role": "assistant", "content": response}
+            ])
+        except Exception as e:
+            print(f"[Episodic] ✗ Indexing failed: {e}")
+    
+    # Auto-trigger memory update on unprocessed token volume
+    if state_delta is not None:
+        # Fused mode: the delta is applied off the request path; a full update
+        # only runs now and then, to consolidate what the deltas cannot
+        apply_delta_async(user_id, state_delta)
+        autosave_policy.record_turn(user_id, user_message, response,
+                                    token_weight=AUTOSAVE_FUSED_TOKEN_WEIGHT, covered=True)
+    else:
+        autosave_policy.record_turn(user_id, user_message, response)
+
+
+def _describe_turn(arguments, result) -> dict:
+    """
+    Trace payload sizes of a chat turn (sizes only, never content).
+    """
+    return {"in": len(arguments.get("user_message") or ""), "out": len(result or "")}
+
+
+@traced("process_message", describe=_describe_turn)
+@profiled("process_message", trace_allocations=True)
+def chat_turn(user_id: str, user_message: str, on_token=None) -> str:
+    """
+    Runs one coach turn and returns the reply.
+    on_token(text) receives the reply incrementally as it is generated
+    (in fused mode the reply arrives in one piece).
+    Raises ChatError with a user-facing message.
+    """
+    if not user_id:
+        raise ChatError("⚠ Please load a User ID first.", 400)
+    if not user_message or user_message.strip() == "":
+        raise ChatError("⚠ Message is empty.", 400)
+
+    messages = build_messages(user_id, user_message)
+    try:
+        # Shed load instead of queueing forever when the LLM is slow
+        with admission.admit(user_id), usage_context(user_id, "fused_chat" if COACH_FUSED_MODE else "chat"):
+            if COACH_FUSED_MODE:
+                response, state_delta = get_fused_completion(messages)
+                if on_token:
+                    on_token(response)
+            elif on_token:
+                parts = []
+                for text in stream_message_completion(messages):
+                    parts.append(text)
+                    on_token(text)
+                response, state_delta = "".join(parts), None
+            else:
+                response, state_delta = get_message_completion(messages), None
+    except AdmissionRejected as e:
+        if e.reason == "rate_limited":
+            raise ChatError("⚠ You're sending messages too quickly. Please wait a moment.", 429)
+        raise ChatError("⚠ The coach is busy right now. Please try again shortly.", 503)
+    except CircuitOpenError:
+        raise ChatError("⚠ The coach is temporarily unavailable. Please try again in a minute.", 503)
+    except Exception as e:
+        raise ChatError(f"Error: {str(e)}", 502)
+
+    record_turn(user_id, user_message, response, state_delta)
+    return response
+
+
+@traced("update_memory")
+def run_memory_update(user_id: str) -> tuple[bool, str]:
+    """
+    Manual memory update ('Update Memory' button / API).
+    Claims the user's pending turns first, waiting briefly if an autosave or
+    batch update is running, so two full updates never run for one user.
+    """
+    if not autosave_policy.wait_for_claim(user_id):
+        return False, "⚠ A memory update is already in progress; try again shortly."
+    success = False
+    try:
+        # An explicit request always runs, even if the change detector sees nothing new
+        success, message = perform_memory_update(user_id, force=True, interactive=True)
+    finally:
+        autosave_policy.release(user_id, processed=success)
+    return success, message
@@ -0,0 +1,115 @@
+import os
+import time
+import threading
+from collections import OrderedDict, deque
+
+# Messages rendered in the chat window; older ones load on demand
+CHAT_WINDOW_MESSAGES = int(os.getenv("CHAT_WINDOW_MESSAGES", "40"))
+# Messages kept per browser session (recent_turns holds the full history)
+SESSION_HISTORY_MAX_MESSAGES = int(os.getenv("SESSION_HISTORY_MAX_MESSAGES", "1000"))
+# Sessions kept in memory at most; the least recently used one is evicted first
+SESSION_STORE_MAX_SESSIONS = int(os.getenv("SESSION_STORE_MAX_SESSIONS", "10000"))
+# Sessions untouched for this long are evicted (closed tabs, script callers keyed by user_id)
+SESSION_IDLE_SECONDS = float(os.getenv("SESSION_IDLE_SECONDS", "86400"))
+
+
+class SessionHistory:
+    """
+    Server-side chat history of one browser session. The client only ever
+    receives the last `shown` messages, so a turn's payload does not grow
+    with the conversation.
+    """
+
+    def __init__(self, user_id: str = None, window: int = None, max_messages: int = None):
+        self.user_id = user_id
+        self.window = window or CHAT_WINDOW_MESSAGES
+        self.messages = deque(maxlen=max_messages or SESSION_HISTORY_MAX_MESSAGES)
+        self.shown = self.window
+        # Two requests of one session (e.g. a double submit) can run at once
+        self._lock = threading.Lock()
+
+    def append(self, *messages: dict) -> None:
+        """
+        Adds messages and scrolls the view back to the newest window.
+        """
+        with self._lock:
+            self.messages.extend(messages)
+            self.shown = self.window
+
+    def visible(self) -> list[dict]:
+        with self._lock:
+            return self._visible()
+
+    def _visible(self) -> list[dict]:
+        start = max(0, len(self.messages) - self.shown)
+        return [self.messages[i] for i in range(start, len(self.messages))]
+
+    def has_earlier(self) -> bool:
+        with self._lock:
+            return len(self.messages) > self.shown
+
+    def load_earlier(self) -> list[dict]:
+        """
+        Extends the view by one window of older messages.
+        """
+        with self._lock:
+            self.shown = min(len(self.messages), self.shown + self.window)
+            return self._visible()
+
+
+class SessionStore:
+    """
+    Thread-safe map of session key (Gradio session hash) -> SessionHistory.
+    Closed tabs never say goodbye, so sessions idle for `idle_seconds` are
+    evicted, and beyond `max_sessions` the least recently used one is.
+    """
+
+    def __init__(self, window: int = None, max_messages: int = None,
+                 max_sessions: int = None, idle_seconds: float = None):
+        self.window = window
+        self.max_messages = max_messages
+        self.max_sessions = max_sessions or SESSION_STORE_MAX_SESSIONS
+        self.idle_seconds = idle_seconds or SESSION_IDLE_SECONDS
+        self._sessions = OrderedDict()  # key -> (last used, SessionHistory), least recent first
+        self._lock = threading.Lock()
+
+    def _evict(self, now: float) -> None:
+        while self._sessions:
+            last_used, _ = next(iter(self._sessions.values()))
+            if len(self._sessions) <= self.max_sessions and now - last_used < self.idle_seconds:
+                break
+            self._sessions.popitem(last=False)
+
+    def get(self, key: str) -> SessionHistory | None:
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            entry = self._sessions.get(key)
+            if entry is None:
+                return None
+            self._sessions[key] = (now, entry[1])
+            self._sessions.move_to_end(key)
+            return entry[1]
+
+    def start(self, key: str, user_id: str) -> SessionHistory:
+        """
+        Fresh history for key, replacing any previous one.
+        """
+        history = SessionHistory(user_id, self.window, self.max_messages)
+        now = time.monotonic()
+        with self._lock:
+            self._sessions.pop(key, None)
+            self._sessions[key] = (now, history)
+            self._evict(now)
+        return history
+
+    def drop(self, key: str) -> SessionHistory | None:
+        with self._lock:
+            entry = self._sessions.pop(key, None)
+            return entry[1] if entry else None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+session_store = SessionStore()
@@ -0,0 +1,271 @@
+import io
+import os
+import gzip
+import json
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Iterable, Iterator
+from app.db.coach_state_repo import iter_coach_states, upsert_coach_states
+from app.db.recent_turns_repo import export_turns, upsert_turns, sync_turn_id_sequence
+from app.utils.validation import validate_coach_state
+
+# Rows per upsert request and parallel workers for bulk import/export
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "500"))
+BULK_WORKERS = int(os.getenv("BULK_WORKERS", "4"))
+
+
+def open_ndjson(path: str, mode: str = "r"):
+    """
+    Opens an NDJSON file for text I/O; paths ending in .gz are gzip-compressed.
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def read_ndjson(path: str) -> Iterator[dict]:
+    with open_ndjson(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Checkpoint:
+    """
+    Append-only record of finished work keys (one per line). A rerun with the
+    same checkpoint file skips everything already marked. Without a path it
+    only tracks the current run.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self._done = []
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self._done = [line.rstrip("\n") for line in f if line.strip()]
+        self._keys = set(self._done)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._keys
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def last(self) -> str | None:
+        return self._done[-1] if self._done else None
+
+    def mark(self, key: str) -> None:
+        with self._lock:
+            self._done.append(key)
+            self._keys.add(key)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(key + "\n")
+
+
+def run_bounded(fn, items: Iterable, workers: int) -> Iterator[tuple]:
+    """
+    Runs fn(item) in a pool of `workers` threads with at most 2 x workers
+    items in flight, so huge inputs are streamed rather than loaded.
+    Yields (item, result, error) as calls complete.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        in_flight = {}
+
+        def drain(return_when):
+            done, _ = wait(in_flight, return_when=return_when)
+            for future in done:
+                item = in_flight.pop(future)
+                error = future.exception()
+                yield item, None if error else future.result(), error
+
+        for item in items:
+            in_flight[pool.submit(fn, item)] = item
+            if len(in_flight) >= 2 * workers:
+                yield from drain(FIRST_COMPLETED)
+        while in_flight:
+            yield from drain(FIRST_COMPLETED)
+
+
+def export_states(path: str, page_size: int = None, checkpoint: Checkpoint = None) -> int:
+    """
+    Streams every coach_state row to NDJSON in user_id order.
+    With a checkpoint, a rerun appends after the last exported user.
+    Returns the number of rows written.
+    """
+    checkpoint = checkpoint if checkpoint is not None else Checkpoint()
+    page_size = page_size or BULK_BATCH_SIZE
+    written = 0
+    with open_ndjson(path, "a" if checkpoint.last() else "w") as out:
+        for page in batched(iter_coach_states(page_size=page_size, after=checkpoint.last()), page_size):
+            for row in page:
+                out.write(json.dumps(row) + "\n")
+            out.flush()
+            checkpoint.mark(page[-1]["user_id"])
+            written += len(page)
+    print(f"[Bulk] ✓ Exported {written} coach_state rows to {path}")
+    return written
+
+
+def export_all_turns(path: str, user_ids: Iterable[str], workers: int = None,
+                     checkpoint: Checkpoint = None) -> tuple[int, list[str]]:
+    """
+    Exports the turns of many users to one NDJSON file, reading users in
+    parallel. Each user's turns are written as one block, then the user is
+    checkpointed. Returns (rows written, failed user_ids).
+    """
+    checkpoint = checkpoint if checkpoint is not None else Checkpoint()
+    written, failed = 0, []
+
+    def fetch(user_id):
+        buffer = io.StringIO()
+        count = export_turns(user_id, buffer)
+        return count, buffer.getvalue()
+
+    todo = (u for u in user_ids if u not in checkpoint)
+    with open_ndjson(path, "a" if len(checkpoint) else "w") as out:
+        for user_id, result, error in run_bounded(fetch, todo, workers or BULK_WORKERS):
+            if error:
+                print(f"[Bulk] ✗ Export failed for {user_id}: {error}")
+                failed.append(user_id)
+                continue
+            # Only this thread writes, so each user's block stays contiguous
+            count, text = result
+            out.write(text)
+            out.flush()
+            checkpoint.mark(user_id)
+            written += count
+    print(f"[Bulk] ✓ Exported {written} turns to {path} ({len(failed)} users failed)")
+    return written, failed
+
+
+def _state_row(record: dict) -> dict | None:
+    is_valid, error_msg = validate_coach_state(record.get("state_json"))
+    if not record.get("user_id") or not is_valid:
+        print(f"[Bulk] ⚠ Skipping invalid coach_state for {record.get('user_id')}: {error_msg}")
+        return None
+    row = {"user_id": record["user_id"], "state_json": record["state_json"], "version": record.get("version") or 1}
+    if record.get("updated_at"):
+        row["updated_at"] = record["updated_at"]
+    return row
+
+
+def _turn_row(record: dict) -> dict | None:
+    if not record.get("user_id") or record.get("role") not in ("user", "assistant"):
+        print(f"[Bulk] ⚠ Skipping invalid turn: {record.get('id')}")
+        return None
+    return {k: record[k] for k in ("id", "user_id", "role", "content", "created_at") if k in record}
+
+
+def import_file(table: str, path: str, batch_size: int = None, workers: int = None,
+                checkpoint: Checkpoint = None) -> tuple[int, list[int]]:
+    """
+    Imports an NDJSON export into coach_state or recent_turns with batched
+    upserts from a bounded worker pool. Batches are checkpointed by index,
+    so a rerun skips the ones already written; upserts keyed on user_id / id
+    make a batch that is written twice harmless. Turns keep their ids, so
+    the recent_turns id sequence is moved past them afterwards.
+    Returns (rows written, failed batch indexes).
+    """
+    to_row, write = {
+        "coach_state": (_state_row, upsert_coach_states),
+        "recent_turns": (_turn_row, upsert_turns),
+    }[table]
+    checkpoint = checkpoint if checkpoint is not None else Checkpoint()
+
+    def pending_batches():
+        for index, records in enumerate(batched(read_ndjson(path), batch_size or BULK_BATCH_SIZE)):
+            if str(index) not in checkpoint:
+                yield index, [row for row in map(to_row, records) if row]
+
+    def write_batch(item):
+        index, rows = item
+        write(rows)
+        return len(rows)
+
+    written, failed = 0, []
+    for (index, _), count, error in run_bounded(write_batch, pending_batches(), workers or BULK_WORKERS):
+        if error:
+            print(f"[Bulk] ✗ Batch {index} failed: {error}")
+            failed.append(index)
+            continue
+        checkpoint.mark(str(index))
+        written += count
+    if table == "recent_turns" and written:
+        try:
+            print(f"[Bulk] ✓ recent_turns id sequence now at {sync_turn_id_sequence()}")
+        except Exception as e:
+            print(f"[Bulk] ✗ Could not sync the recent_turns id sequence; run sync_recent_turns_id_seq() before new chats: {e}")
+    print(f"[Bulk] ✓ Imported {written} rows into {table} ({len(failed)} batches failed)")
+    return written, sorted(failed)
+
+
+def _user_ids(users_file: str = None) -> Iterator[str]:
+    if users_file:
+        with open(users_file, encoding="utf-8") as f:
+            yield from (line.strip() for line in f if line.strip())
+    else:
+        yield from (row["user_id"] for row in iter_coach_states(columns="user_id"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk export/import of coach_state and recent_turns, and memory backfill.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("export-states", help="Export coach_state to NDJSON (.gz to compress)")
+    p.add_argument("path")
+    p = sub.add_parser("export-turns", help="Export recent_turns to NDJSON (.gz to compress)")
+    p.add_argument("path")
+    p.add_argument("--users", help="File with one user_id per line (default: every coach_state user)")
+    p = sub.add_parser("import-states", help="Import a coach_state export")
+    p.add_argument("path")
+    p = sub.add_parser("import-turns", help="Import a recent_turns export")
+    p.add_argument("path")
+    p = sub.add_parser("backfill", help="Rerun the memory updater over each user's turn history")
+    p.add_argument("--users", help="File with one user_id per line (default: every coach_state user)")
+    p.add_argument("--rate", type=float, default=1.0, help="Updater LLM calls per second, across workers")
+    p.add_argument("--from-scratch", action="store_true", help="Rebuild from INITIAL_STATE over all turns")
+    p = sub.add_parser("index-episodic", help="Index stored (or exported) turns into episodic memory")
+    p.add_argument("--users", help="File with one user_id per line (default: every coach_state user)")
+    p.add_argument("--from", dest="source", help="Index an NDJSON turn export instead of recent_turns")
+    for p in sub.choices.values():
+        p.add_argument("--workers", type=int, default=BULK_WORKERS)
+        p.add_argument("--batch-size", type=int, default=BULK_BATCH_SIZE)
+        p.add_argument("--checkpoint", help="Resume file; rerun with the same path to continue")
+    args = parser.parse_args()
+
+    checkpoint = Checkpoint(args.checkpoint)
+    if args.command == "export-states":
+        export_states(args.path, args.batch_size, checkpoint)
+    elif args.command == "export-turns":
+        export_all_turns(args.path, _user_ids(args.users), args.workers, checkpoint)
+    elif args.command == "import-states":
+        import_file("coach_state", args.path, args.batch_size, args.workers, checkpoint)
+    elif args.command == "import-turns":
+        import_file("recent_turns", args.path, args.batch_size, args.workers, checkpoint)
+    elif args.command == "index-episodic":
+        from app.memory.backfill import index_episodic_history, index_episodic_file
+        if args.source:
+            index_episodic_file(args.source, batch_size=args.batch_size)
+        else:
+            index_episodic_history(_user_ids(args.users), workers=args.workers, checkpoint=checkpoint,
+                                   page_size=args.batch_size)
+    else:
+        from app.memory.backfill import run_backfill
+        from app.utils.ledger import start_usage_flusher
+        start_usage_flusher()
+        run_backfill(_user_ids(args.users), workers=args.workers, rate=args.rate,
+                     from_scratch=args.from_scratch, checkpoint=checkpoint)
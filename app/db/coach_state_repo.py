@@ -1,4 +1,16 @@
 from app.db.supabase_client import supabase
+from app.db.shared_cache import get_shared_cache
+from app.utils.circuit_breaker import CircuitOpenError
+from collections import OrderedDict
+from typing import Iterator
+import copy
+import os
+import threading
+
+# Shared-cache TTL for coach_state reads; save_coach_state invalidates explicitly
+COACH_STATE_CACHE_TTL = float(os.getenv("COACH_STATE_CACHE_TTL", "300"))
+# Users whose last known good state is kept for outages (least recently used dropped first)
+COACH_STATE_FALLBACK_MAX_USERS = int(os.getenv("COACH_STATE_FALLBACK_MAX_USERS", "1000"))
 
 # INITIAL_STATE must match the structure used in the Memory Updater
 INITIAL_STATE = {
@@ -28,17 +40,78 @@ INITIAL_STATE = {
     "updated_at": ""
 }
 
+class FallbackState(dict):
+    """
+    A coach_state served while the database is unavailable (last known good
+    copy, or INITIAL_STATE). It is fine to chat with, but must never be saved:
+    save_coach_state refuses it and the memory updater skips it.
+    deepcopy keeps the type, so states derived by copying stay marked.
+    """
+
+
+class FallbackStateError(Exception):
+    pass
+
+
+class StaleStateError(Exception):
+    """
+    A versioned save found the row at another version: someone else wrote
+    the state after it was read.
+    """
+
+
+def is_fallback_state(state) -> bool:
+    return isinstance(state, FallbackState)
+
+
+# Last state successfully read or written per user (this process), served when the DB is down;
+# bounded LRU, so only recently active users get their own fallback
+_last_known_good = OrderedDict()
+_last_known_good_lock = threading.Lock()
+
+
+def _remember(user_id: str, state: dict) -> None:
+    with _last_known_good_lock:
+        _last_known_good[user_id] = copy.deepcopy(state)
+        _last_known_good.move_to_end(user_id)
+        while len(_last_known_good) > COACH_STATE_FALLBACK_MAX_USERS:
+            _last_known_good.popitem(last=False)
+
+
+def _fallback(user_id: str) -> FallbackState:
+    with _last_known_good_lock:
+        state = _last_known_good.get(user_id, INITIAL_STATE)
+        return FallbackState(copy.deepcopy(state))
+
+
+def _cache_key(user_id: str) -> str:
+    return f"coach_state:{user_id}"
+
+
 def get_or_create_coach_state(user_id: str) -> dict:
     """
     Retrieve existing coach_state for user_id, or create a new one with INITIAL_STATE.
+    Reads go through the shared cache so every worker process sees the same state.
+    If the database is unavailable, returns a FallbackState (last known good
+    copy or INITIAL_STATE) that cannot be persisted.
     Returns the state as a Python dict.
     """
+    cache = get_shared_cache()
+    cached = cache.get(_cache_key(user_id))
+    if cached is not None:
+        return cached
+
+    # Read the generation before the DB so a concurrent save wins over this read
+    generation = cache.generation(_cache_key(user_id))
     try:
         response = supabase.table("coach_state").select("state_json").eq("user_id", user_id).execute()
         
         if response.data and len(response.data) > 0:
             # Row exists, return the state
-            return response.data[0]["state_json"]
+            state = response.data[0]["state_json"]
+            cache.set(_cache_key(user_id), state, ttl=COACH_STATE_CACHE_TTL, generation=generation)
+            _remember(user_id, state)
+            return state
         else:
             # Row does not exist, insert new row
             new_row = {
@@ -49,40 +122,137 @@ def get_or_create_coach_state(user_id: str) -> dict:
             insert_response = supabase.table("coach_state").insert(new_row).execute()
             
             if insert_response.data:
-                return INITIAL_STATE
+                _remember(user_id, INITIAL_STATE)
+                return copy.deepcopy(INITIAL_STATE)
             else:
                 raise Exception(f"Failed to insert new coach_state for user_id: {user_id}")
+    except CircuitOpenError:
+        # Fail fast: no log spam while the breaker is open
+        return _fallback(user_id)
     except Exception as e:
         print(f"Error in get_or_create_coach_state: {e}")
-        # For read failures, return INITIAL_STATE to avoid crashing
-        return INITIAL_STATE
+        # For read failures, serve a non-persistable fallback to avoid crashing
+        return _fallback(user_id)
 
 
-def save_coach_state(user_id: str, new_state: dict) -> None:
+def save_coach_state(user_id: str, new_state: dict, watermark: tuple[str, int] | None = None,
+                     expected_version: int | None = None) -> None:
     """
     Update coach_state for user_id with new_state.
-    Increments version and updates updated_at.
-    Raises on failure.
+    Increments version and updates updated_at; watermark, if given, is the
+    (created_at, id) of the last turn new_state was built from.
+    With expected_version (from load_state_for_update) the write only applies
+    if nobody saved in between, and raises StaleStateError otherwise.
+    Raises on failure, and refuses (FallbackStateError) to persist a fallback state.
     """
+    if is_fallback_state(new_state):
+        raise FallbackStateError(f"Refusing to persist fallback coach_state for user_id: {user_id}")
     try:
-        # First get current version
-        response = supabase.table("coach_state").select("version").eq("user_id", user_id).execute()
-        
-        if response.data and len(response.data) > 0:
-            current_version = response.data[0]["version"]
+        if expected_version is not None:
+            current_version = expected_version
         else:
-            current_version = 0
+            # First get current version
+            response = supabase.table("coach_state").select("version").eq("user_id", user_id).execute()
+            
+            if response.data and len(response.data) > 0:
+                current_version = response.data[0]["version"]
+            else:
+                current_version = 0
         
         # Update the row
-        update_response = supabase.table("coach_state").update({
+        values = {
             "state_json": new_state,
             "version": current_version + 1,
             "updated_at": "now()"  # Supabase handles this as SQL now()
-        }).eq("user_id", user_id).execute()
+        }
+        if watermark:
+            values.update(_watermark_columns(watermark))
+        query = supabase.table("coach_state").update(values).eq("user_id", user_id)
+        if expected_version is not None:
+            query = query.eq("version", expected_version)
+        update_response = query.execute()
         
         if not update_response.data:
+            if expected_version is not None:
+                raise StaleStateError(f"coach_state for {user_id} is no longer at version {expected_version}")
             raise Exception(f"Failed to update coach_state for user_id: {user_id}")
+
+        # Evict the cached copy in every worker process
+        get_shared_cache().invalidate(_cache_key(user_id))
+        _remember(user_id, new_state)
             
+    except StaleStateError:
+        raise
     except Exception as e:
         print(f"Error in save_coach_state: {e}")
         raise  # Re-raise to fail loudly on write errors
+
+
+def _watermark_columns(watermark: tuple[str, int]) -> dict:
+    return {"processed_turn_at": watermark[0], "processed_turn_id": watermark[1]}
+
+
+def load_state_for_update(user_id: str) -> tuple[dict, int, tuple[str, int] | None]:
+    """
+    (state, version, watermark) read from the database, bypassing the cache,
+    for a read-modify-write that saves with expected_version. watermark is
+    the (created_at, id) of the last turn a memory update processed, or None.
+    Creates the row if missing. Raises on failure.
+    """
+    response = supabase.table("coach_state")\
+        .select("state_json, version, processed_turn_at, processed_turn_id")\
+        .eq("user_id", user_id)\
+        .execute()
+    if not response.data:
+        state = get_or_create_coach_state(user_id)
+        if is_fallback_state(state):
+            raise FallbackStateError(f"coach_state for {user_id} is unavailable")
+        return state, 1, None
+    row = response.data[0]
+    watermark = None
+    if row.get("processed_turn_at") and row.get("processed_turn_id") is not None:
+        watermark = (row["processed_turn_at"], row["processed_turn_id"])
+    return row["state_json"], row["version"], watermark
+
+
+def advance_turn_watermark(user_id: str, watermark: tuple[str, int]) -> None:
+    """
+    Marks the turns up to watermark as processed without touching the state
+    (an update that found nothing to change). Raises on failure.
+    """
+    supabase.table("coach_state").update(_watermark_columns(watermark)).eq("user_id", user_id).execute()
+
+
+def iter_coach_states(page_size: int = 500, after: str | None = None,
+                      columns: str = "user_id, state_json, version, updated_at") -> Iterator[dict]:
+    """
+    Stream all coach_state rows in user_id order with keyset pagination,
+    optionally resuming strictly after user_id `after`.
+    Raises on failure, so bulk exports never end silently short.
+    """
+    wanted = [c.strip() for c in columns.split(",")]
+    fetch_columns = ", ".join(dict.fromkeys(wanted + ["user_id"]))
+    while True:
+        query = supabase.table("coach_state").select(fetch_columns)
+        if after is not None:
+            query = query.gt("user_id", after)
+        page = query.order("user_id").limit(page_size).execute().data or []
+        for row in page:
+            yield {c: row.get(c) for c in wanted}
+        if len(page) < page_size:
+            return
+        after = page[-1]["user_id"]
+
+
+def upsert_coach_states(rows: list[dict]) -> None:
+    """
+    Bulk-write coach_state rows ({user_id, state_json, version, updated_at})
+    in one request, keyed on user_id, and evict them from the shared cache.
+    Raises on failure.
+    """
+    if not rows:
+        return
+    supabase.table("coach_state").upsert(rows, on_conflict="user_id").execute()
+    cache = get_shared_cache()
+    for row in rows:
+        cache.invalidate(_cache_key(row["user_id"]))
@@ -0,0 +1,237 @@
+from app.db.supabase_client import supabase
+from app.db.shared_cache import get_shared_cache
+from app.utils.circuit_breaker import CircuitOpenError
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterator
+import os
+
+# EMOTION_SERIES=0 stops recording snapshots and the prompt trend summary
+EMOTION_SERIES = os.getenv("EMOTION_SERIES", "1") == "1"
+# Weeks of weekly rollups summarized for the coach prompt
+EMOTION_TREND_WEEKS = int(os.getenv("EMOTION_TREND_WEEKS", "4"))
+# Shared-cache TTL of the trend summary; a new snapshot invalidates it
+EMOTION_TREND_CACHE_TTL = float(os.getenv("EMOTION_TREND_CACHE_TTL", "3600"))
+
+# Tracked values and where they live in coach_state
+METRICS = {
+    "valence": ("last_emotional_state", "valence"),
+    "arousal": ("last_emotional_state", "arousal"),
+    "stress_level": ("pattern_analysis", "stress_level"),
+    "confidence_level": ("pattern_analysis", "confidence_level"),
+}
+
+RESOLUTIONS = ("day", "week")
+
+# Compare-and-set attempts per rollup row before an append gives up
+_APPEND_ATTEMPTS = 5
+
+
+def snapshot_from_state(state: dict) -> dict | None:
+    """
+    The numeric emotional values of a coach_state, or None if there are none.
+    """
+    snapshot = {}
+    for metric, (section, key) in METRICS.items():
+        value = (state.get(section) or {}).get(key) if isinstance(state, dict) else None
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            snapshot[metric] = float(value)
+    return snapshot or None
+
+
+def bucket_start(day: date, resolution: str) -> str:
+    """
+    First day of the rollup bucket containing day (weeks start on Monday).
+    """
+    if resolution == "week":
+        day = day - timedelta(days=day.weekday())
+    return day.isoformat()
+
+
+def _fold(row: dict | None, user_id: str, resolution: str, bucket: str,
+          snapshot: dict, ts: str) -> dict:
+    """
+    Adds one snapshot to a rollup row: count, per-metric count/sum/min/max, and
+    for day rows the raw points as parallel arrays (one column per metric,
+    None where a snapshot lacked the metric).
+    """
+    row = row or {"user_id": user_id, "resolution": resolution, "bucket": bucket, "n": 0,
+                  "count": {}, "sum": {}, "min": {}, "max": {}}
+    row = {**row, "n": row["n"] + 1, **{k: dict(row[k]) for k in ("count", "sum", "min", "max")}}
+    for metric, value in snapshot.items():
+        row["count"][metric] = row["count"].get(metric, 0) + 1
+        row["sum"][metric] = row["sum"].get(metric, 0.0) + value
+        row["min"][metric] = min(row["min"].get(metric, value), value)
+        row["max"][metric] = max(row["max"].get(metric, value), value)
+    if resolution == "day":
+        row["ts"] = list(row.get("ts") or []) + [ts]
+        for metric in METRICS:
+            row[metric] = list(row.get(metric) or []) + [snapshot.get(metric)]
+    return row
+
+
+def _trend_key(user_id: str) -> str:
+    return f"emotion_trend:{user_id}"
+
+
+def _append_to_row(user_id: str, resolution: str, bucket: str, snapshot: dict, ts: str) -> None:
+    for _ in range(_APPEND_ATTEMPTS):
+        response = supabase.table("emotion_series")\
+            .select("*")\
+            .eq("user_id", user_id)\
+            .eq("resolution", resolution)\
+            .eq("bucket", bucket)\
+            .execute()
+        existing = response.data[0] if response.data else None
+        row = _fold(existing, user_id, resolution, bucket, snapshot, ts)
+        row.pop("id", None)
+        if existing is None:
+            try:
+                supabase.table("emotion_series").insert(row).execute()
+                return
+            except CircuitOpenError:
+                raise
+            except Exception:
+                # Most likely the unique key: another writer created the row first
+                continue
+        # Compare-and-set on n: matches nothing if another append got in between
+        response = supabase.table("emotion_series")\
+            .update(row)\
+            .eq("user_id", user_id)\
+            .eq("resolution", resolution)\
+            .eq("bucket", bucket)\
+            .eq("n", existing["n"])\
+            .execute()
+        if response.data:
+            return
+    raise RuntimeError(f"emotion_series {resolution} row {bucket} of {user_id} kept changing")
+
+
+def append_emotion_snapshot(user_id: str, snapshot: dict, at: datetime = None) -> None:
+    """
+    Appends one snapshot to the user's time series: the day row gets the
+    raw point and updated aggregates, the week row the aggregates only.
+    Full memory updates and fused-mode deltas of one user can append at the
+    same time (from different workers), so each row is written with a
+    compare-and-set on its count and re-read if it lost. Raises on failure.
+    """
+    at = at or datetime.now(timezone.utc)
+    for resolution in RESOLUTIONS:
+        _append_to_row(user_id, resolution, bucket_start(at.date(), resolution), snapshot, at.isoformat())
+    get_shared_cache().invalidate(_trend_key(user_id))
+
+
+def record_state_snapshot(user_id: str, state: dict, at: datetime = None) -> bool:
+    """
+    Side effect of a saved memory update: appends the state's emotional
+    values, as of `at` (default now). Never raises; the update itself has
+    already succeeded. Returns True if a snapshot was written.
+    """
+    snapshot = snapshot_from_state(state)
+    if not EMOTION_SERIES or snapshot is None:
+        return False
+    try:
+        append_emotion_snapshot(user_id, snapshot, at)
+        return True
+    except Exception as e:
+        print(f"[Emotion] ✗ Snapshot not recorded for {user_id}: {e}")
+        return False
+
+
+def load_rollups(user_id: str, resolution: str, since: str) -> list[dict]:
+    """
+    Rollup rows (bucket, n, count, sum, min, max) with bucket >= since, oldest first.
+    Raw arrays are not fetched.
+    """
+    response = supabase.table("emotion_series")\
+        .select("bucket, n, count, sum, min, max")\
+        .eq("user_id", user_id)\
+        .eq("resolution", resolution)\
+        .gte("bucket", since)\
+        .order("bucket")\
+        .execute()
+    return response.data or []
+
+
+def iter_emotion_points(user_id: str, since_day: str = None) -> Iterator[dict]:
+    """
+    Raw snapshots from the day rows, oldest first: {"ts", <metric>: value|None}.
+    """
+    query = supabase.table("emotion_series")\
+        .select("bucket, ts, " + ", ".join(METRICS))\
+        .eq("user_id", user_id)\
+        .eq("resolution", "day")
+    if since_day:
+        query = query.gte("bucket", since_day)
+    for row in query.order("bucket").execute().data or []:
+        columns = {m: row.get(m) or [] for m in METRICS}
+        for i, ts in enumerate(row.get("ts") or []):
+            yield {"ts": ts, **{m: values[i] if i < len(values) else None for m, values in columns.items()}}
+
+
+def _mean(row: dict, metric: str) -> float | None:
+    count = row["count"].get(metric)
+    return row["sum"][metric] / count if count else None
+
+
+def _direction(values: list[float]) -> str:
+    if len(values) < 2:
+        return "steady"
+    earlier = sum(values[:-1]) / len(values[:-1])
+    delta = values[-1] - earlier
+    # Scales differ per metric, so "significant" is relative to the values seen
+    if abs(delta) < max(0.05, 0.1 * max(abs(v) for v in values)):
+        return "steady"
+    return "rising" if delta > 0 else "falling"
+
+
+def summarize_trends(user_id: str, weeks: int = None, today: date = None) -> str:
+    """
+    Short text summary of the user's emotional trends from the weekly and
+    daily rollups ("" without data). Reads at most `weeks` week rows and
+    7 day rows; never scans raw history.
+    """
+    weeks = weeks or EMOTION_TREND_WEEKS
+    today = today or datetime.now(timezone.utc).date()
+    weekly = load_rollups(user_id, "week", bucket_start(today - timedelta(weeks=weeks - 1), "week"))
+    daily = load_rollups(user_id, "day", (today - timedelta(days=6)).isoformat())
+
+    lines = []
+    for metric in METRICS:
+        means = [m for m in (_mean(row, metric) for row in weekly) if m is not None]
+        if not means:
+            continue
+        line = f"- {metric}: weekly avg {', '.join(f'{m:.1f}' for m in means)} ({_direction(means)})"
+        recent = [row for row in daily if row["sum"].get(metric) is not None]
+        if recent:
+            n = sum(row["count"][metric] for row in recent)
+            avg = sum(row["sum"][metric] for row in recent) / n
+            low = min(row["min"][metric] for row in recent)
+            high = max(row["max"][metric] for row in recent)
+            line += f"; last 7 days avg {avg:.1f}, range {low:.1f}-{high:.1f}"
+        lines.append(line)
+    if not lines:
+        return ""
+    return f"Weekly averages over the last {len(weekly)} week(s), oldest first:\n" + "\n".join(lines)
+
+
+def get_trend_summary(user_id: str) -> str:
+    """
+    summarize_trends through the shared cache, for the per-turn prompt.
+    Returns "" when disabled or the database is unavailable.
+    """
+    if not EMOTION_SERIES:
+        return ""
+    cache = get_shared_cache()
+    cached = cache.get(_trend_key(user_id))
+    if cached is not None:
+        return cached
+    generation = cache.generation(_trend_key(user_id))
+    try:
+        summary = summarize_trends(user_id)
+    except CircuitOpenError:
+        return ""
+    except Exception as e:
+        print(f"[Emotion] ✗ Trend summary failed for {user_id}: {e}")
+        return ""
+    cache.set(_trend_key(user_id), summary, ttl=EMOTION_TREND_CACHE_TTL, generation=generation)
+    return summary
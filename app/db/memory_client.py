@@ -0,0 +1,208 @@
+import copy
+import itertools
+import threading
+from datetime import datetime, timezone
+
+
+class _Response:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+def _split_top_level(text: str) -> list[str]:
+    parts, depth, current = [], 0, ""
+    for ch in text:
+        if ch == "," and depth == 0:
+            parts.append(current)
+            current = ""
+            continue
+        depth += ch == "("
+        depth -= ch == ")"
+        current += ch
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _coerce(value: str):
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return value[1:-1]
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+_OPS = {
+    "eq": lambda a, b: a == b,
+    "neq": lambda a, b: a != b,
+    "gt": lambda a, b: a is not None and a > b,
+    "gte": lambda a, b: a is not None and a >= b,
+    "lt": lambda a, b: a is not None and a < b,
+    "lte": lambda a, b: a is not None and a <= b,
+}
+
+
+def _parse_filter(expr: str):
+    """
+    Parses a PostgREST logic expression, e.g.
+    'created_at.gt."t1",and(created_at.eq."t1",id.gt.5)'  (top level = OR).
+    """
+    expr = expr.strip()
+    for logic, combine in (("and(", all), ("or(", any)):
+        if expr.startswith(logic) and expr.endswith(")"):
+            subs = [_parse_filter(p) for p in _split_top_level(expr[len(logic):-1])]
+            return lambda row, subs=subs, combine=combine: combine(f(row) for f in subs)
+    column, op, value = expr.split(".", 2)
+    value = _coerce(value)
+    return lambda row: _OPS[op](row.get(column), value)
+
+
+class _Query:
+    def __init__(self, client, table: str):
+        self._client = client
+        self._table = table
+        self._action = "select"
+        self._columns = None
+        self._count = None
+        self._payload = None
+        self._on_conflict = None
+        self._filters = []
+        self._order = []
+        self._limit = None
+        self._offset = 0
+
+    # Actions
+    def select(self, columns: str = "*", count: str = None):
+        self._action, self._count = "select", count
+        self._columns = None if columns.strip() == "*" else [c.strip() for c in columns.split(",")]
+        return self
+
+    def insert(self, rows):
+        self._action, self._payload = "insert", rows
+        return self
+
+    def upsert(self, rows, on_conflict: str = None):
+        self._action, self._payload, self._on_conflict = "upsert", rows, on_conflict
+        return self
+
+    def update(self, values: dict):
+        self._action, self._payload = "update", values
+        return self
+
+    def delete(self):
+        self._action = "delete"
+        return self
+
+    # Filters / modifiers
+    def _filter(self, column, op, value):
+        self._filters.append(lambda row: _OPS[op](row.get(column), value))
+        return self
+
+    def eq(self, column, value): return self._filter(column, "eq", value)
+    def neq(self, column, value): return self._filter(column, "neq", value)
+    def gt(self, column, value): return self._filter(column, "gt", value)
+    def gte(self, column, value): return self._filter(column, "gte", value)
+    def lt(self, column, value): return self._filter(column, "lt", value)
+    def lte(self, column, value): return self._filter(column, "lte", value)
+
+    def in_(self, column, values):
+        values = list(values)
+        self._filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def or_(self, filters: str):
+        self._filters.append(_parse_filter(f"or({filters})"))
+        return self
+
+    def order(self, column: str, desc: bool = False):
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, n: int):
+        self._limit = n
+        return self
+
+    def offset(self, n: int):
+        self._offset = n
+        return self
+
+    def _matches(self, row) -> bool:
+        return all(f(row) for f in self._filters)
+
+    def _project(self, row) -> dict:
+        if self._columns is None:
+            return copy.deepcopy(row)
+        return {c: copy.deepcopy(row.get(c)) for c in self._columns}
+
+    def execute(self) -> _Response:
+        return self._client._execute(self)
+
+
+class InMemorySupabase:
+    """
+    Minimal in-memory stand-in for the Supabase/PostgREST client used by the repos:
+    table(...).select/insert/upsert/update/delete with eq/gt/lt/in_/or_ filters,
+    order, limit, offset and exact counts. Rows get an increasing `id` and a
+    `created_at` timestamp when not supplied. Used by tests and the replay tool.
+    """
+
+    def __init__(self):
+        self._tables = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def table(self, name: str) -> _Query:
+        return _Query(self, name)
+
+    def rows(self, name: str) -> list[dict]:
+        return self._tables.setdefault(name, [])
+
+    def _new_row(self, row: dict) -> dict:
+        row = copy.deepcopy(row)
+        row.setdefault("id", next(self._ids))
+        row.setdefault("created_at", datetime.now(timezone.utc).isoformat())
+        row.setdefault("updated_at", row["created_at"])
+        return row
+
+    def _execute(self, q: _Query) -> _Response:
+        with self._lock:
+            rows = self.rows(q._table)
+            if q._action == "insert":
+                payload = q._payload if isinstance(q._payload, list) else [q._payload]
+                created = [self._new_row(r) for r in payload]
+                rows.extend(created)
+                return _Response(copy.deepcopy(created))
+
+            if q._action == "upsert":
+                payload = q._payload if isinstance(q._payload, list) else [q._payload]
+                keys = [k.strip() for k in (q._on_conflict or "id").split(",")]
+                result = []
+                for new in payload:
+                    match = next((r for r in rows if all(r.get(k) == new.get(k) for k in keys)), None)
+                    if match is not None:
+                        match.update(copy.deepcopy(new))
+                        result.append(copy.deepcopy(match))
+                    else:
+                        row = self._new_row(new)
+                        rows.append(row)
+                        result.append(copy.deepcopy(row))
+                return _Response(result)
+
+            matched = [r for r in rows if q._matches(r)]
+            if q._action == "update":
+                for r in matched:
+                    r.update(copy.deepcopy(q._payload))
+                return _Response([copy.deepcopy(r) for r in matched])
+
+            if q._action == "delete":
+                self._tables[q._table] = [r for r in rows if not q._matches(r)]
+                return _Response([copy.deepcopy(r) for r in matched])
+
+            count = len(matched) if q._count else None
+            for column, desc in reversed(q._order):
+                matched.sort(key=lambda r: (r.get(column) is None, r.get(column)), reverse=desc)
+            end = None if q._limit is None else q._offset + q._limit
+            return _Response([q._project(r) for r in matched[q._offset:end]], count)
@@ -1,4 +1,7 @@
 from app.db.supabase_client import supabase
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator
+import json
 import random
 
 def save_turn(user_id: str, role: str, content: str) -> None:
@@ -19,10 +22,12 @@ def save_turn(user_id: str, role: str, content: str) -> None:
         # We assume fire-and-forget for history to avoid blocking chat
         pass
 
-def save_turn_pair(user_id: str, user_text: str, assistant_text: str) -> None:
+def save_turn_pair(user_id: str, user_text: str, assistant_text: str,
+                   archive: Callable[[list[dict]], None] | None = None) -> None:
     """
     Save a pair of turns (user + assistant) in one batch if possible.
-    Includes auto-pruning every 50 turns approx (random check or simple count).
+    Includes auto-pruning every 50 turns approx (random check or simple count);
+    archive receives the pruned turns before they are deleted.
     """
     try:
         # Batch insert
@@ -35,7 +40,7 @@ def save_turn_pair(user_id: str, user_text: str, assistant_text: str) -> None:
         # Simple probability-based pruning to avoid counting every time
         # Let's use a 1/10 chance to prune.
         if random.random() < 0.1:
-            prune_recent_turns(user_id)
+            prune_recent_turns(user_id, archive=archive)
             
     except Exception as e:
         print(f"Error in save_turn_pair: {e}")
@@ -59,56 +64,201 @@ def load_recent_turns(user_id: str, limit: int = 30) -> list[dict]:
         print(f"Error in load_recent_turns: {e}")
         return []
 
-def prune_recent_turns(user_id: str, keep_last: int = 500) -> None:
+def count_pending_turns(limit: int = 1000) -> list[dict]:
+    """
+    Users with turns after their processed-turn watermark (updated_at for rows
+    without one), counted in one grouped query by the pending_turn_counts
+    function. Returns [{"user_id", "pending"}], largest first. Raises on failure.
+    """
+    response = supabase.rpc("pending_turn_counts", {"max_users": limit}).execute()
+    return response.data or []
+
+def _keyset_filter(cursor: tuple[str, int], descending: bool) -> str:
+    """
+    PostgREST OR-filter selecting rows strictly after cursor=(created_at, id)
+    in (created_at, id) order.
+    """
+    created_at, row_id = cursor
+    op = "lt" if descending else "gt"
+    return f'created_at.{op}."{created_at}",and(created_at.eq."{created_at}",id.{op}.{row_id})'
+
+def _fetch_turn_page(user_id: str, columns: str, page_size: int, descending: bool,
+                     cursor: tuple[str, int] | None, since: str | None) -> list[dict]:
+    query = supabase.table("recent_turns")\
+        .select(columns)\
+        .eq("user_id", user_id)
+    if since:
+        query = query.gt("created_at", since)
+    if cursor:
+        query = query.or_(_keyset_filter(cursor, descending))
+    response = query\
+        .order("created_at", desc=descending)\
+        .order("id", desc=descending)\
+        .limit(page_size)\
+        .execute()
+    return response.data or []
+
+def iter_turns(user_id: str, page_size: int = 200, descending: bool = False,
+               after: tuple[str, int] | None = None, since: str | None = None,
+               columns: str = "id, role, content, created_at", prefetch: bool = True,
+               strict: bool = False) -> Iterator[dict]:
+    """
+    Stream a user's turns with keyset pagination on (created_at, id).
+    Chronological by default (descending=True for newest first).
+    - after: resume strictly after this (created_at, id) cursor
+    - since: only turns created after this timestamp
+    - prefetch: fetch the next page in the background while the caller
+      consumes the current one
+    - strict: re-raise errors instead of ending the stream early
+    Unlike offset paging, every page costs the same regardless of depth.
+    """
+    # The cursor columns are always needed, whatever the caller asked for
+    wanted = [c.strip() for c in columns.split(",")]
+    fetch_columns = ", ".join(dict.fromkeys(wanted + ["id", "created_at"]))
+
+    def fetch(cursor):
+        return _fetch_turn_page(user_id, fetch_columns, page_size, descending, cursor, since)
+
+    executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+    try:
+        page = fetch(after)
+        while page:
+            last = page[-1]
+            next_page = None
+            if len(page) == page_size:
+                cursor = (last["created_at"], last["id"])
+                next_page = executor.submit(fetch, cursor) if executor else cursor
+            for row in page:
+                yield {c: row.get(c) for c in wanted}
+            if next_page is None:
+                break
+            page = next_page.result() if executor else fetch(next_page)
+    except Exception as e:
+        print(f"Error in iter_turns: {e}")
+        if strict:
+            raise
+    finally:
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+def load_turns_after(user_id: str, after: tuple[str, int] | None = None, since: str | None = None,
+                     limit: int = 40, columns: str = "id, role, content, created_at") -> list[dict]:
+    """
+    The oldest `limit` turns strictly after the (created_at, id) cursor
+    `after` (and created after `since`), oldest -> newest, so a backlog is
+    read in order. One bounded request however long the history is.
+    Raises on failure.
+    """
+    wanted = [c.strip() for c in columns.split(",")]
+    fetch_columns = ", ".join(dict.fromkeys(wanted + ["id", "created_at"]))
+    query = supabase.table("recent_turns")\
+        .select(fetch_columns)\
+        .eq("user_id", user_id)
+    if since:
+        query = query.gt("created_at", since)
+    if after:
+        query = query.or_(_keyset_filter(after, descending=False))
+    response = query\
+        .order("created_at")\
+        .order("id")\
+        .limit(limit)\
+        .execute()
+    return [{c: row.get(c) for c in wanted} for row in response.data or []]
+
+def load_turns_before(user_id: str, limit: int = 40,
+                      before: tuple[str, int] | None = None) -> tuple[list[dict], tuple[str, int] | None]:
+    """
+    One page of a user's history, newest first from `before` (a
+    (created_at, id) cursor; None starts at the newest turn).
+    Returns (turns oldest -> newest, cursor for the next older page or None).
+    """
+    page = []
+    for row in iter_turns(user_id, page_size=limit + 1, descending=True, after=before,
+                          columns="id, role, content, created_at", prefetch=False, strict=True):
+        page.append(row)
+        if len(page) > limit:
+            break
+    more = len(page) > limit
+    page = page[:limit]
+    cursor = (page[-1]["created_at"], page[-1]["id"]) if more else None
+    return list(reversed(page)), cursor
+
+def export_turns(user_id: str, out, page_size: int = 500) -> int:
+    """
+    Write all of a user's turns to a text stream as NDJSON, oldest first.
+    Returns the number of rows written. Raises if the stream fails midway.
+    """
+    written = 0
+    for row in iter_turns(user_id, page_size=page_size, columns="id, role, content, created_at", strict=True):
+        out.write(json.dumps({"user_id": user_id, **row}) + "\n")
+        written += 1
+    return written
+
+def upsert_turns(rows: list[dict]) -> None:
+    """
+    Bulk-write turns ({user_id, role, content, created_at[, id]}) in one request.
+    Rows carrying an id are upserted on id, so re-importing an export is
+    idempotent; rows without one are inserted. Explicit ids do not advance
+    the id sequence: call sync_turn_id_sequence after importing them.
+    Raises on failure.
+    """
+    with_id = [r for r in rows if r.get("id") is not None]
+    without_id = [{k: v for k, v in r.items() if k != "id"} for r in rows if r.get("id") is None]
+    if with_id:
+        supabase.table("recent_turns").upsert(with_id, on_conflict="id").execute()
+    if without_id:
+        supabase.table("recent_turns").insert(without_id).execute()
+
+def sync_turn_id_sequence() -> int:
+    """
+    Moves the recent_turns id sequence past the largest id (the
+    sync_recent_turns_id_seq function), so inserts after an import that kept
+    its ids do not collide with them. Returns the sequence value. Raises on failure.
+    """
+    response = supabase.rpc("sync_recent_turns_id_seq", {}).execute()
+    return response.data
+
+def prune_recent_turns(user_id: str, keep_last: int = 500,
+                       archive: Callable[[list[dict]], None] | None = None) -> None:
     """
     Delete turns older than the newest keep_last rows.
-    Uses subquery deletion for safety.
+    Finds the boundary row with a single-row offset probe (newest first), then
+    deletes everything at or before it in (created_at, id) order.
+    If archive is given, the rows to be deleted are streamed to it in pages
+    (oldest first) before deletion.
     """
     try:
-        # Find the ID of the Nth most recent row
-        # We want to keep IDs >= (SELECT id FROM ... ORDER BY created_at DESC LIMIT 1 OFFSET keep_last-1)
-        # Actually easier to delete IDs NOT IN top N.
-        
-        # Supabase/Postgrest delete with filtered logic is tricky via JS client syntax.
-        # We can use a stored procedure if available, but requirements asked for Python.
-        # We'll use a two-step approach: fetch the cutoff ID, then delete < cutoff.
-        
         response = supabase.table("recent_turns")\
-            .select("id")\
+            .select("id, created_at")\
             .eq("user_id", user_id)\
             .order("created_at", desc=True)\
-            .limit(1)\
+            .order("id", desc=True)\
             .offset(keep_last)\
+            .limit(1)\
+            .execute()
+        if not response.data:
+            return
+        boundary = response.data[0]
+
+        if archive:
+            page = []
+            # strict: a failed page must stop the prune, not delete unarchived turns
+            for row in iter_turns(user_id, page_size=500, strict=True):
+                if (row["created_at"], row["id"]) > (boundary["created_at"], boundary["id"]):
+                    break
+                page.append(row)
+                if len(page) == 500:
+                    archive(page)
+                    page = []
+            if page:
+                archive(page)
+
+        cutoff = boundary["created_at"]
+        supabase.table("recent_turns")\
+            .delete()\
+            .eq("user_id", user_id)\
+            .or_(f'created_at.lt."{cutoff}",and(created_at.eq."{cutoff}",id.lte.{boundary["id"]})')\
             .execute()
-            
-        if response.data:
-            # This is the first ID to *DELETE* (or keep? wait)
-            # offset 500 means we skipped 500. So the 501st row.
-            # We want to delete anything older than or equal to this row.
-            # Assuming IDs increase with time (mostly true but created_at is better).
-            # Created_at based cut-off is safer.
-            
-            # Let's get the timestamp of the 500th item (boundary).
-            cutoff_response = supabase.table("recent_turns")\
-                .select("created_at")\
-                .eq("user_id", user_id)\
-                .order("created_at", desc=True)\
-                .limit(1)\
-                .offset(keep_last)\
-                .execute()
-                
-            if cutoff_response.data:
-                cutoff_time = cutoff_response.data[0]['created_at']
-                
-                # Delete rows strictly older than cutoff (or equal if we want to be strict about count)
-                # "lte" (less than or equal) might delete the 500th item depending on precision.
-                # "lt" (less than) the 500th's timestamp keeps the 500th.
-                # But if duplicates exist... straightforward is to allow small buffer.
-                supabase.table("recent_turns")\
-                    .delete()\
-                    .eq("user_id", user_id)\
-                    .lt("created_at", cutoff_time)\
-                    .execute()
                     
     except Exception as e:
         print(f"Error in prune_recent_turns: {e}")
@@ -0,0 +1,197 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+
+class InMemoryCache:
+    """
+    In-process cache with the same interface as SharedCache.
+    Values are stored as JSON strings so callers never share mutable objects.
+    Every key carries a generation number that is bumped on invalidate(); a set()
+    made with a stale generation is dropped, so a slow reader cannot re-cache data
+    that was invalidated while it was reading.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}  # key -> [value_json | None, expires_at | None, generation]
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry or entry[0] is None:
+                return None
+            if entry[1] is not None and entry[1] < time.time():
+                return None
+            return json.loads(entry[0])
+
+    def generation(self, key: str) -> int:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[2] if entry else 0
+
+    def set(self, key: str, value, ttl: float = None, generation: int = None) -> bool:
+        """
+        Store value under key. If generation is given, the write only happens when
+        the key has not been invalidated since that generation was read.
+        Returns True if the value was stored.
+        """
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            current = self._entries.get(key, [None, None, 0])[2]
+            if generation is not None and generation != current:
+                return False
+            self._entries[key] = [json.dumps(value), expires_at, current]
+            return True
+
+    def update(self, key: str, fn, ttl: float = None):
+        """
+        Atomically replace the value under key with fn(old_value) and return it.
+        old_value is None when the key is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            old = None
+            if entry and entry[0] is not None and (entry[1] is None or entry[1] >= time.time()):
+                old = json.loads(entry[0])
+            new = fn(old)
+            current = entry[2] if entry else 0
+            self._entries[key] = [json.dumps(new), time.time() + ttl if ttl else None, current]
+            return new
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            current = self._entries.get(key, [None, None, 0])[2]
+            self._entries[key] = [None, None, current + 1]
+
+    def keys(self, prefix: str = "") -> list[str]:
+        now = time.time()
+        with self._lock:
+            return [
+                k for k, (v, exp, _) in self._entries.items()
+                if k.startswith(prefix) and v is not None and (exp is None or exp >= now)
+            ]
+
+
+class SharedCache:
+    """
+    SQLite-backed cache shared by every worker process on the host.
+    Same semantics as InMemoryCache; invalidate() is visible to all processes
+    as soon as it commits, which is how save_coach_state evicts stale copies.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT,"
+            " expires_at REAL,"
+            " generation INTEGER NOT NULL DEFAULT 0)"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None: autocommit, we open write transactions explicitly
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str):
+        row = self._conn().execute(
+            "SELECT value, expires_at FROM cache_entries WHERE key = ?", (key,)
+        ).fetchone()
+        if not row or row[0] is None:
+            return None
+        if row[1] is not None and row[1] < time.time():
+            return None
+        return json.loads(row[0])
+
+    def generation(self, key: str) -> int:
+        row = self._conn().execute(
+            "SELECT generation FROM cache_entries WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def set(self, key: str, value, ttl: float = None, generation: int = None) -> bool:
+        expires_at = time.time() + ttl if ttl else None
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT generation FROM cache_entries WHERE key = ?", (key,)).fetchone()
+            current = row[0] if row else 0
+            if generation is not None and generation != current:
+                conn.execute("ROLLBACK")
+                return False
+            conn.execute(
+                "INSERT INTO cache_entries (key, value, expires_at, generation) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+                (key, json.dumps(value), expires_at, current),
+            )
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def update(self, key: str, fn, ttl: float = None):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT value, expires_at FROM cache_entries WHERE key = ?", (key,)
+            ).fetchone()
+            old = None
+            if row and row[0] is not None and (row[1] is None or row[1] >= time.time()):
+                old = json.loads(row[0])
+            new = fn(old)
+            conn.execute(
+                "INSERT INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)"
+                " ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+                (key, json.dumps(new), time.time() + ttl if ttl else None),
+            )
+            conn.execute("COMMIT")
+            return new
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def invalidate(self, key: str) -> None:
+        self._conn().execute(
+            "INSERT INTO cache_entries (key, value, expires_at, generation) VALUES (?, NULL, NULL, 1)"
+            " ON CONFLICT(key) DO UPDATE SET value = NULL, expires_at = NULL, generation = generation + 1",
+            (key,),
+        )
+
+    def keys(self, prefix: str = "") -> list[str]:
+        rows = self._conn().execute(
+            "SELECT key FROM cache_entries WHERE key LIKE ? ESCAPE '\\'"
+            " AND value IS NOT NULL AND (expires_at IS NULL OR expires_at >= ?)",
+            (prefix.replace("%", r"\%").replace("_", r"\_") + "%", time.time()),
+        ).fetchall()
+        return [r[0] for r in rows if r[0].startswith(prefix)]
+
+
+# Set SHARED_CACHE_PATH to a SQLite file to share the cache between worker processes.
+# When unset, an in-process cache is used (single-process deployments and tests).
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_shared_cache():
+    """
+    Returns the process-wide cache instance, SQLite-backed if SHARED_CACHE_PATH is set.
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                path = os.getenv("SHARED_CACHE_PATH", "")
+                _cache = SharedCache(path) if path else InMemoryCache()
+    return _cache
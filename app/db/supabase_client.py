@@ -1,14 +1,21 @@
 import os
-from supabase import create_client, Client
+from supabase import create_client, Client, ClientOptions
 from dotenv import load_dotenv, find_dotenv
+from app.utils.circuit_breaker import GuardedClient, supabase_breaker
 
 # Load environment variables
 load_dotenv(find_dotenv())
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_ANON_KEY")
+# Per-request timeout; the circuit breaker turns repeated timeouts into fast failures
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "10"))
 
 if not SUPABASE_URL or not SUPABASE_KEY:
     raise ValueError("Missing SUPABASE_URL or SUPABASE_ANON_KEY in .env")
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+_client: Client = create_client(
+    SUPABASE_URL, SUPABASE_KEY, options=ClientOptions(postgrest_client_timeout=SUPABASE_TIMEOUT)
+)
+# Every .execute() goes through the Supabase circuit breaker
+supabase = GuardedClient(_client, supabase_breaker)
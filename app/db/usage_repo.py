@@ -0,0 +1,92 @@
+from app.db.supabase_client import supabase
+from datetime import datetime, timedelta, timezone
+from typing import Iterator
+from app.utils.ledger import COUNTERS
+
+
+def insert_usage_rows(rows: list[dict]) -> None:
+    """
+    Append rolled-up ledger rows (one request per flush). Raises on failure.
+    """
+    if rows:
+        supabase.table("usage_ledger").insert(rows).execute()
+
+
+def iter_usage_rows(since_day: str, until_day: str = None, user_id: str = None,
+                    page_size: int = 1000) -> Iterator[dict]:
+    """
+    Stream usage_ledger rows for days in [since_day, until_day], keyset-paged by id.
+    """
+    after = 0
+    while True:
+        query = supabase.table("usage_ledger").select("*").gte("day", since_day).gt("id", after)
+        if until_day:
+            query = query.lte("day", until_day)
+        if user_id:
+            query = query.eq("user_id", user_id)
+        page = query.order("id").limit(page_size).execute().data or []
+        yield from page
+        if len(page) < page_size:
+            return
+        after = page[-1]["id"]
+
+
+def _since(days: int) -> str:
+    return (datetime.now(timezone.utc).date() - timedelta(days=days - 1)).isoformat()
+
+
+def _sum_into(totals: dict, key, row: dict) -> None:
+    entry = totals.setdefault(key, dict.fromkeys(COUNTERS, 0))
+    for name in COUNTERS:
+        entry[name] += row.get(name) or 0
+
+
+def top_consumers(days: int = 7, limit: int = 10, call_type: str = None) -> list[dict]:
+    """
+    Users with the most tokens (prompt + completion) over the last `days` days.
+    Returns [{"user_id", "total_tokens", <counters>}, ...], largest first.
+    """
+    totals = {}
+    for row in iter_usage_rows(_since(days)):
+        if call_type and row["call_type"] != call_type:
+            continue
+        _sum_into(totals, row["user_id"], row)
+    ranked = [
+        {"user_id": user_id, "total_tokens": c["prompt_tokens"] + c["completion_tokens"], **c}
+        for user_id, c in totals.items()
+    ]
+    ranked.sort(key=lambda r: r["total_tokens"], reverse=True)
+    return ranked[:limit]
+
+
+def daily_totals(days: int = 30, user_id: str = None) -> list[dict]:
+    """
+    Per-day, per-call-type totals over the last `days` days (optionally one user).
+    Returns [{"day", "call_type", <counters>}, ...] sorted by day.
+    """
+    totals = {}
+    for row in iter_usage_rows(_since(days), user_id=user_id):
+        _sum_into(totals, (row["day"], row["call_type"]), row)
+    return [{"day": day, "call_type": call_type, **c} for (day, call_type), c in sorted(totals.items())]
+
+
+def compact_usage_day(day: str) -> int:
+    """
+    Collapse a day's flush rows into one row per (user_id, call_type).
+    Aggregates are inserted before the originals are deleted, and rows
+    flushed meanwhile (higher ids) are left alone.
+    Returns the number of rows removed.
+    """
+    rows = list(iter_usage_rows(day, day))
+    if not rows:
+        return 0
+    totals = {}
+    for row in rows:
+        _sum_into(totals, (row["user_id"], row["call_type"]), row)
+    insert_usage_rows([
+        {"day": day, "user_id": user_id, "call_type": call_type, **c}
+        for (user_id, call_type), c in totals.items()
+    ])
+    max_id = max(row["id"] for row in rows)
+    supabase.table("usage_ledger").delete().eq("day", day).lte("id", max_id).execute()
+    return len(rows)
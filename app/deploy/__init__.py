@@ -0,0 +1 @@
+""" here we run the app as several worker processes behind a local router """
\ No newline at end of file
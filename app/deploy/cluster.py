@@ -0,0 +1,109 @@
+import os
+import hashlib
+import multiprocessing
+from urllib.parse import urlencode
+
+from dotenv import load_dotenv, find_dotenv
+
+
+def worker_for_user(user_id: str, workers: int) -> int:
+    """
+    Picks the worker index for user_id using rendezvous hashing.
+    The same user always lands on the same worker, and changing the worker
+    count only moves the users of the added/removed worker.
+    """
+    def weight(index: int) -> int:
+        digest = hashlib.sha1(f"{index}:{user_id}".encode("utf-8")).digest()
+        return int.from_bytes(digest[:8], "big")
+
+    return max(range(workers), key=weight)
+
+
+def run_worker(port: int, host: str = "127.0.0.1") -> None:
+    """
+    Entry point of one worker process: the app for APP_MODE (plus /metrics) on its own port.
+    """
+    load_dotenv(find_dotenv())
+    # Import inside the worker so each process builds its own clients
+    import uvicorn
+    from app.api.server import create_server
+    from app.memory.autosave import start_autosave_sweeper
+    from app.utils.ledger import start_usage_flusher
+
+    # Every worker sweeps; the per-user claim keeps updates from running twice
+    start_autosave_sweeper()
+    start_usage_flusher()
+    print(f"[Cluster] Worker starting on {host}:{port}")
+    uvicorn.run(create_server(), host=host, port=port, log_level="warning")
+
+
+def create_router(worker_urls: list[str]):
+    """
+    Builds the ASGI router. Requests carrying ?user_id= and API calls under
+    /api/users/{user_id}/ are redirected to that user's worker, so a user's
+    session always runs in the same process.
+    """
+    from starlette.applications import Starlette
+    from starlette.responses import HTMLResponse, RedirectResponse
+    from starlette.routing import Route
+
+    async def index(request):
+        user_id = request.query_params.get("user_id", "").strip()
+        if not user_id:
+            return HTMLResponse(
+                "<form method='get'><label>User ID <input name='user_id' autofocus></label>"
+                "<button type='submit'>Start</button></form>"
+            )
+        target = worker_urls[worker_for_user(user_id, len(worker_urls))]
+        return RedirectResponse(f"{target}/?{urlencode({'user_id': user_id})}", status_code=307)
+
+    async def api(request):
+        # 307 keeps the method and body, so POSTs are replayed against the worker
+        user_id = request.path_params["user_id"]
+        target = worker_urls[worker_for_user(user_id, len(worker_urls))]
+        query = f"?{request.url.query}" if request.url.query else ""
+        return RedirectResponse(f"{target}{request.url.path}{query}", status_code=307)
+
+    async def any_worker(request):
+        # Shared-storage endpoints (e.g. usage reports) can be served by any worker
+        query = f"?{request.url.query}" if request.url.query else ""
+        return RedirectResponse(f"{worker_urls[0]}{request.url.path}{query}", status_code=307)
+
+    async def workers(request):
+        return HTMLResponse("<br>".join(worker_urls))
+
+    return Starlette(routes=[
+        Route("/", index),
+        Route("/workers", workers),
+        Route("/api/users/{user_id}/{rest:path}", api, methods=["GET", "POST"]),
+        Route("/api/usage/{rest:path}", any_worker),
+    ])
+
+
+def run_cluster(workers: int, base_port: int = 7861, router_port: int = 7860, host: str = "127.0.0.1") -> None:
+    """
+    Starts `workers` app processes on consecutive ports plus the router on router_port.
+    All processes share the SQLite cache at SHARED_CACHE_PATH.
+    """
+    import uvicorn
+
+    # Workers must share one cache file, otherwise they would each cache privately
+    os.environ.setdefault("SHARED_CACHE_PATH", os.path.abspath("coach_cache.sqlite3"))
+    print(f"[Cluster] Shared cache: {os.environ['SHARED_CACHE_PATH']}")
+
+    ctx = multiprocessing.get_context("spawn")
+    processes = []
+    for i in range(workers):
+        p = ctx.Process(target=run_worker, args=(base_port + i, host), daemon=True)
+        p.start()
+        processes.append(p)
+
+    worker_urls = [f"http://{host}:{base_port + i}" for i in range(workers)]
+    print(f"[Cluster] Router on http://{host}:{router_port} -> {worker_urls}")
+    try:
+        uvicorn.run(create_router(worker_urls), host=host, port=router_port, log_level="warning")
+    finally:
+        for p in processes:
+            p.terminate()
+        for p in processes:
+            p.join(timeout=5)
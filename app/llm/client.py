@@ -13,5 +13,13 @@ if not api_key:
 # Strip any quotes that might be included
 api_key = api_key.strip('"').strip("'")
 
+# Per-request timeout (admission deadlines can shorten it per call)
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+
+# SDK-level retries per call. Each one can take OPENAI_TIMEOUT, and the
+# circuit breaker only sees the final outcome, so by default a slow call
+# fails once and feeds the breaker; app-level retries handle the rest
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "0"))
+
 # Initialize the OpenAI client
-client = OpenAI(api_key=api_key)
+client = OpenAI(api_key=api_key, timeout=OPENAI_TIMEOUT, max_retries=OPENAI_MAX_RETRIES)
@@ -2,12 +2,14 @@
 COACH_SYSTEM_PROMPT = """You are a mentor-coach for high-pressure individuals such as founders. For each session, you will receive:
 - **COACH_STATE:** a JSON containing the user's long-term goals, plans, blockers, preferences, and commitments. Treat this as authoritative.
 - **RECENT_TURNS:** the user's most recent conversation exchanges.
+- **RELEVANT_PAST_TURNS (optional):** older exchanges retrieved because they relate to the latest message.
 - **The user's latest message.**
 
 Your outputs must adhere to these instructions:
 
 - Use **COACH_STATE** as the reliable source of the user's objectives, blockers, and commitments.
 - Use **RECENT_TURNS** for short-term context and recent conversational flow.
+- Use **RELEVANT_PAST_TURNS**, when present, to recall earlier blockers, commitments, or context the user refers back to.
 
 For each response, follow this structured format:
 
@@ -82,3 +84,51 @@ Required keys (must always exist):
 
 Return JSON only.
 """
+
+# Appended to COACH_SYSTEM_PROMPT in fused mode (reply + state delta in one call)
+FUSED_STATE_DELTA_INSTRUCTIONS = """
+**Fused mode:** Return JSON: "reply" = your full response as specified above; "state_delta" = COACH_STATE changes stated explicitly in the LATEST user message only (new goals/actions/blockers, actions confirmed done, blockers resolved, focus, note, emotional signals), or null if it states none. Inside a delta use [] and null for unchanged fields. Never invent facts.
+"""
+
+_NULLABLE_STRING = {"type": ["string", "null"]}
+_NULLABLE_NUMBER = {"type": ["number", "null"]}
+_STRING_LIST = {"type": "array", "items": {"type": "string"}}
+
+# Structured-output schema for fused mode (OpenAI json_schema, strict)
+FUSED_RESPONSE_SCHEMA = {
+    "name": "coach_reply_with_state_delta",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "additionalProperties": False,
+        "required": ["reply", "state_delta"],
+        "properties": {
+            "reply": {"type": "string"},
+            # null on turns without state changes (most of them), which keeps the
+            # output a few tokens longer than a plain reply instead of ~60
+            "state_delta": {"anyOf": [{"type": "null"}, {
+                "type": "object",
+                "additionalProperties": False,
+                "required": [
+                    "add_goals", "add_next_actions", "completed_actions", "add_blockers",
+                    "resolved_blockers", "current_focus", "session_note", "mood_label",
+                    "valence", "arousal", "stress_level", "confidence_level"
+                ],
+                "properties": {
+                    "add_goals": _STRING_LIST,
+                    "add_next_actions": _STRING_LIST,
+                    "completed_actions": _STRING_LIST,
+                    "add_blockers": _STRING_LIST,
+                    "resolved_blockers": _STRING_LIST,
+                    "current_focus": _NULLABLE_STRING,
+                    "session_note": _NULLABLE_STRING,
+                    "mood_label": _NULLABLE_STRING,
+                    "valence": _NULLABLE_NUMBER,
+                    "arousal": _NULLABLE_NUMBER,
+                    "stress_level": _NULLABLE_NUMBER,
+                    "confidence_level": _NULLABLE_NUMBER,
+                },
+            }]},
+        },
+    },
+}
@@ -1,9 +1,68 @@
+import json
+import time
 from app.llm.client import client
+from app.llm.prompts import FUSED_RESPONSE_SCHEMA
+from app.utils.admission import timeout_kwargs
+from app.utils.circuit_breaker import openai_breaker
+from app.llm.shadow import shadow_traffic, streamed_response
 
 def get_message_completion(messages, model="gpt-5-nano", temperature=1):
-    response = client.chat.completions.create(
-        model=model,
-        messages=messages,
-        temperature=temperature
+    request = {"model": model, "messages": messages, "temperature": temperature}
+    began = time.perf_counter()
+    response = openai_breaker.call(
+        client.chat.completions.create,
+        **request,
+        **timeout_kwargs()  # propagate the request deadline
     )
+    # A sample is replayed against candidate models in the background
+    shadow_traffic.mirror("chat", request, response, (time.perf_counter() - began) * 1000)
     return response.choices[0].message.content
+
+def stream_message_completion(messages, model="gpt-5-nano", temperature=1):
+    """
+    Yields the coach reply in text chunks as they are generated.
+    A finished stream is mirrored as a regular chat call (candidates are not
+    streamed; latencies compare time to the full reply).
+    """
+    request = {"model": model, "messages": messages, "temperature": temperature}
+    began = time.perf_counter()
+    # Recorded at the breaker (wall time, usage, errors) when the stream ends, not when it opens
+    stream = openai_breaker.call_stream(
+        client.chat.completions.create,
+        **request,
+        stream=True,
+        stream_options={"include_usage": True},
+        **timeout_kwargs()
+    )
+    parts, usage = [], None
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            parts.append(chunk.choices[0].delta.content)
+            yield chunk.choices[0].delta.content
+        # The final chunk carries the usage of the whole stream
+        usage = getattr(chunk, "usage", None) or usage
+    shadow_traffic.mirror("chat", request, streamed_response("".join(parts), usage),
+                          (time.perf_counter() - began) * 1000)
+
+def get_fused_completion(messages, model="gpt-5-nano", temperature=1) -> tuple[str, dict | None]:
+    """
+    Coach reply and state delta from a single structured-output call.
+    Returns (reply, state_delta); state_delta is {} when the turn changed
+    nothing, and None if the output could not be parsed.
+    """
+    request = {"model": model, "messages": messages, "temperature": temperature,
+               "response_format": {"type": "json_schema", "json_schema": FUSED_RESPONSE_SCHEMA}}
+    began = time.perf_counter()
+    response = openai_breaker.call(
+        client.chat.completions.create,
+        **request,
+        **timeout_kwargs()
+    )
+    shadow_traffic.mirror("fused_chat", request, response, (time.perf_counter() - began) * 1000)
+    content = response.choices[0].message.content
+    try:
+        parsed = json.loads(content)
+        return parsed["reply"], parsed["state_delta"] or {}
+    except (json.JSONDecodeError, KeyError, TypeError):
+        print("[Fused] ⚠ Could not parse fused output; using raw content as reply")
+        return content, None
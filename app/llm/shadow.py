@@ -0,0 +1,223 @@
+import os
+import json
+import time
+import atexit
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from app.utils.validation import validate_coach_state
+
+# Candidate backends mirrored against the live model: "model" uses the OpenAI
+# client, "model@base_url" any OpenAI-compatible endpoint (comma-separated)
+SHADOW_MODELS = [m.strip() for m in os.getenv("SHADOW_MODELS", "").split(",") if m.strip()]
+# Fraction of live requests that are mirrored
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", "0.05"))
+# Shadow calls in flight at most; samples beyond this are dropped, never queued
+SHADOW_MAX_CONCURRENCY = int(os.getenv("SHADOW_MAX_CONCURRENCY", "2"))
+# Per-call timeout for candidate backends
+SHADOW_TIMEOUT = float(os.getenv("SHADOW_TIMEOUT", "60"))
+# Key for OpenAI-compatible candidate endpoints (defaults to OPENAI_API_KEY)
+SHADOW_API_KEY = os.getenv("SHADOW_API_KEY", "")
+# Comparison report, rewritten after every SHADOW_REPORT_EVERY shadow calls and at exit
+# ("{pid}" in the path gives each worker process its own file)
+SHADOW_REPORT_PATH = os.getenv("SHADOW_REPORT_PATH", "reports/shadow_report.json")
+SHADOW_REPORT_EVERY = int(os.getenv("SHADOW_REPORT_EVERY", "20"))
+
+# Latency samples kept per (kind, model) for percentiles
+_MAX_SAMPLES = 1000
+
+
+def _percentile(values, pct: float) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * pct / 100))], 1)
+
+
+def streamed_response(content: str, usage=None) -> SimpleNamespace:
+    """
+    Stand-in for a non-streamed response, built from a finished stream, so
+    streamed replies can be mirrored like any other call.
+    """
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=usage)
+
+
+def check_output(kind: str, content: str) -> bool | None:
+    """
+    Schema check of one completion: memory updates must parse and pass
+    validate_coach_state (updated_at is stamped by the app, so it is filled
+    in first); fused replies must carry a string reply and an object or null
+    state_delta. Chat replies have no schema (None).
+    """
+    if kind not in ("memory_update", "fused_chat"):
+        return None
+    try:
+        state = json.loads(content or "")
+    except json.JSONDecodeError:
+        return False
+    if kind == "fused_chat":
+        return (isinstance(state, dict) and isinstance(state.get("reply"), str)
+                and isinstance(state.get("state_delta", False), (dict, type(None))))
+    if isinstance(state, dict):
+        state.setdefault("updated_at", "")
+    return validate_coach_state(state)[0]
+
+
+class _ModelStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.checked = 0
+        self.valid = 0
+        self.latencies = deque(maxlen=_MAX_SAMPLES)
+
+    def add(self, latency_ms: float = None, usage=None, valid: bool | None = None, error: bool = False) -> None:
+        self.calls += 1
+        if error:
+            self.errors += 1
+            return
+        self.latencies.append(latency_ms)
+        self.prompt_tokens += getattr(usage, "prompt_tokens", 0) or 0
+        self.completion_tokens += getattr(usage, "completion_tokens", 0) or 0
+        if valid is not None:
+            self.checked += 1
+            self.valid += int(valid)
+
+    def summary(self) -> dict:
+        ok = self.calls - self.errors
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "p50_ms": _percentile(self.latencies, 50),
+            "p95_ms": _percentile(self.latencies, 95),
+            "avg_prompt_tokens": round(self.prompt_tokens / ok, 1) if ok else None,
+            "avg_completion_tokens": round(self.completion_tokens / ok, 1) if ok else None,
+            "schema_pass_rate": round(self.valid / self.checked, 3) if self.checked else None,
+        }
+
+
+class ShadowTraffic:
+    """
+    Mirrors a sample of live LLM requests to candidate models in the
+    background and keeps side-by-side stats against the live model.
+
+    Shadow calls run on their own small pool with at most `max_concurrency`
+    in flight; a sample arriving while every slot is busy is dropped, so
+    nothing queues up behind live traffic. They bypass admission control,
+    the OpenAI circuit breaker and the usage ledger, and their errors
+    never reach the caller.
+    """
+
+    def __init__(self, models: list[str] = None, sample_rate: float = None, max_concurrency: int = None,
+                 report_path: str = None, report_every: int = None, clients: dict = None):
+        self.models = SHADOW_MODELS if models is None else models
+        self.sample_rate = SHADOW_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.max_concurrency = max_concurrency or SHADOW_MAX_CONCURRENCY
+        self.report_path = report_path or SHADOW_REPORT_PATH
+        self.report_every = report_every or SHADOW_REPORT_EVERY
+        self._clients = dict(clients or {})
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._pool = None
+        self._stats = {}  # (kind, model) -> _ModelStats
+        self._dropped = 0
+        self._completed = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.models) and self.sample_rate > 0
+
+    def _client(self, spec: str):
+        with self._lock:
+            if spec not in self._clients:
+                model, _, base_url = spec.partition("@")
+                if base_url:
+                    from openai import OpenAI
+                    api_key = SHADOW_API_KEY or os.getenv("OPENAI_API_KEY", "")
+                    self._clients[spec] = OpenAI(api_key=api_key, base_url=base_url, timeout=SHADOW_TIMEOUT)
+                else:
+                    from app.llm.client import client
+                    self._clients[spec] = client
+            return self._clients[spec]
+
+    def _record(self, kind: str, model: str, **result) -> None:
+        with self._lock:
+            self._stats.setdefault((kind, model), _ModelStats()).add(**result)
+
+    def mirror(self, kind: str, request: dict, live_response, live_ms: float) -> bool:
+        """
+        Samples one live call (kind is "chat", "fused_chat" or "memory_update";
+        request is the create() kwargs, without streaming options) and, if
+        sampled and a slot is free, replays it against every candidate in the
+        background. Returns True if mirrored.
+        """
+        if not self.enabled or random.random() >= self.sample_rate:
+            return False
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._dropped += 1
+            return False
+
+        content = live_response.choices[0].message.content
+        self._record(kind, request["model"], latency_ms=live_ms, usage=getattr(live_response, "usage", None),
+                     valid=check_output(kind, content))
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="shadow")
+                atexit.register(self.write_report)
+        self._pool.submit(self._run, kind, request)
+        return True
+
+    def _run(self, kind: str, request: dict) -> None:
+        try:
+            for spec in self.models:
+                model = spec.partition("@")[0]
+                kwargs = {**request, "model": model, "timeout": SHADOW_TIMEOUT}
+                began = time.perf_counter()
+                try:
+                    response = self._client(spec).chat.completions.create(**kwargs)
+                except Exception as e:
+                    print(f"[Shadow] ⚠ {spec} failed on {kind}: {e}")
+                    self._record(kind, spec, error=True)
+                    continue
+                self._record(kind, spec, latency_ms=(time.perf_counter() - began) * 1000,
+                             usage=getattr(response, "usage", None),
+                             valid=check_output(kind, response.choices[0].message.content))
+        finally:
+            self._slots.release()
+        with self._lock:
+            self._completed += 1
+            due = self._completed % self.report_every == 0
+        if due:
+            self.write_report()
+
+    def report(self) -> dict:
+        """
+        Side-by-side stats: {"dropped", "mirrored", "kinds": {kind: {model: summary}}}.
+        The live model's row covers the same sampled requests as the candidates.
+        """
+        with self._lock:
+            kinds = {}
+            for (kind, model), stats in sorted(self._stats.items()):
+                kinds.setdefault(kind, {})[model] = stats.summary()
+            return {"dropped": self._dropped, "mirrored": self._completed, "kinds": kinds}
+
+    def write_report(self, path: str = None) -> dict:
+        path = (path or self.report_path).format(pid=os.getpid())
+        report = self.report()
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            tmp = f"{path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"[Shadow] ✗ Could not write report to {path}: {e}")
+        return report
+
+
+shadow_traffic = ShadowTraffic()
@@ -1,9 +1,21 @@
-from app.ui.gradio_app import create_demo
+import os
+from app.api.server import create_server
+from app.memory.autosave import start_autosave_sweeper
+from app.utils.ledger import start_usage_flusher
 from dotenv import load_dotenv, find_dotenv
 
 if __name__ == "__main__":
     # Load env vars
     load_dotenv(find_dotenv())
     
-    demo = create_demo()
-    demo.launch(share=False)
+    workers = int(os.getenv("APP_WORKERS", "1"))
+    if workers > 1:
+        # Multi-process mode: N app workers behind a user_id-affine router
+        from app.deploy.cluster import run_cluster
+        run_cluster(workers)
+    else:
+        import uvicorn
+        # Flush idle and ended sessions in the background
+        start_autosave_sweeper()
+        start_usage_flusher()
+        uvicorn.run(create_server(), host="127.0.0.1", port=7860)
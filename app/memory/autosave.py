@@ -1,25 +1,263 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from app.db.shared_cache import get_shared_cache
 from app.memory.updater import perform_memory_update
+from app.utils.tokens import estimate_tokens
 
-def check_and_trigger_autosave(user_id: str, current_count: int, threshold: int = 10) -> int:
+# Trigger an update once this many dialogue tokens are unprocessed
+AUTOSAVE_TOKEN_THRESHOLD = int(os.getenv("AUTOSAVE_TOKEN_THRESHOLD", "4000"))
+# ...or once the user has been idle this long with anything pending
+AUTOSAVE_IDLE_SECONDS = float(os.getenv("AUTOSAVE_IDLE_SECONDS", "600"))
+# In fused mode turns already carried a state delta, so they count this much toward the
+# threshold (0.05: one consolidating full update per ~20 thresholds of dialogue)
+AUTOSAVE_FUSED_TOKEN_WEIGHT = float(os.getenv("AUTOSAVE_FUSED_TOKEN_WEIGHT", "0.05"))
+# A claim older than this is considered abandoned (crashed worker) and can be retaken
+AUTOSAVE_CLAIM_TIMEOUT = float(os.getenv("AUTOSAVE_CLAIM_TIMEOUT", "300"))
+# How long a manual update waits for a running update of the same user
+AUTOSAVE_CLAIM_WAIT_SECONDS = float(os.getenv("AUTOSAVE_CLAIM_WAIT_SECONDS", "10"))
+# Users updated in parallel by process_due()
+AUTOSAVE_WORKERS = int(os.getenv("AUTOSAVE_WORKERS", "4"))
+
+TRIGGER_TOKENS = "tokens"
+TRIGGER_IDLE = "idle"
+TRIGGER_SESSION_END = "session_end"
+
+
+def _empty_record() -> dict:
+    return {
+        "turns": 0,
+        "tokens": 0,
+        "covered_turns": 0,
+        "last_activity": 0.0,
+        "session_ended": False,
+        "claimed_at": None,
+        "claimed_turns": 0,
+        "claimed_tokens": 0,
+        "claimed_covered_turns": 0,
+    }
+
+
+class AutosavePolicy:
     """
-    Checks if autosave should be triggered.
-    Returns new_count (0 if triggered, else current_count).
+    Server-side, per-user memory-update policy.
+
+    Tracks unprocessed turns and tokens since the last successful update in the
+    shared cache, so the count survives page reloads and is shared by every tab
+    and worker process of the same user. Updates trigger on token volume (inline),
+    or on idle time / session end (via process_due()). A claim flag makes sure
+    only one caller runs the update for a user at a time.
     """
-    # Increment counter
-    new_count = current_count + 1
-    print(f"[AutoSave] User message count: {new_count}/{threshold}")
-    
-    if new_count >= threshold:
-        print(f"[AutoSave] Triggering auto-save for {user_id} after {new_count} messages...")
-        success, message = perform_memory_update(user_id)
-        
+
+    def __init__(self, cache=None, token_threshold: int = None, idle_seconds: float = None,
+                 claim_timeout: float = None, updater=None):
+        self.cache = cache
+        self.token_threshold = token_threshold or AUTOSAVE_TOKEN_THRESHOLD
+        self.idle_seconds = idle_seconds if idle_seconds is not None else AUTOSAVE_IDLE_SECONDS
+        self.claim_timeout = claim_timeout or AUTOSAVE_CLAIM_TIMEOUT
+        self.updater = updater
+
+    def _cache(self):
+        return self.cache if self.cache is not None else get_shared_cache()
+
+    def _update_record(self, user_id: str, fn) -> dict:
+        def apply(old):
+            record = _empty_record()
+            record.update(old or {})
+            fn(record)
+            return record
+        return self._cache().update(f"autosave:{user_id}", apply)
+
+    def pending(self, user_id: str) -> dict:
+        record = _empty_record()
+        record.update(self._cache().get(f"autosave:{user_id}") or {})
+        return record
+
+    def record_turn(self, user_id: str, user_text: str, assistant_text: str,
+                    token_weight: float = 1.0, covered: bool = False) -> str | None:
+        """
+        Records one user/assistant exchange. Runs the memory update inline when the
+        token threshold is crossed. Returns the trigger reason if an update ran.
+        token_weight < 1 stretches the interval between full updates (fused mode).
+        covered marks a turn whose state changes were already applied (a
+        fused-mode delta): it never triggers an idle or session-end update.
+        """
+        tokens = int((estimate_tokens(user_text) + estimate_tokens(assistant_text)) * token_weight)
+
+        def add(record):
+            record["turns"] += 1
+            record["covered_turns"] += int(covered)
+            record["tokens"] += tokens
+            record["last_activity"] = time.time()
+            record["session_ended"] = False
+
+        record = self._update_record(user_id, add)
+        print(f"[AutoSave] Pending for {user_id}: {record['turns']} turns, {record['tokens']}/{self.token_threshold} tokens")
+
+        if record["tokens"] >= self.token_threshold:
+            self.run_update(user_id, TRIGGER_TOKENS)
+            return TRIGGER_TOKENS
+        return None
+
+    def end_session(self, user_id: str) -> None:
+        """
+        Marks the user's session as ended; the next process_due() picks it up.
+        """
+        def mark(record):
+            if record["turns"]:
+                record["session_ended"] = True
+        self._update_record(user_id, mark)
+
+    def due_reason(self, record: dict, now: float = None) -> str | None:
+        now = now if now is not None else time.time()
+        if not record["turns"]:
+            return None
+        if record["tokens"] >= self.token_threshold:
+            return TRIGGER_TOKENS
+        if record["turns"] <= record["covered_turns"]:
+            # Everything pending was already applied as deltas; only volume triggers a consolidation
+            return None
+        if record["session_ended"]:
+            return TRIGGER_SESSION_END
+        if now - record["last_activity"] >= self.idle_seconds:
+            return TRIGGER_IDLE
+        return None
+
+    def due_users(self, now: float = None) -> list[tuple[str, str, dict]]:
+        """
+        Returns (user_id, reason, record) for every user whose pending dialogue
+        should be processed now, largest token backlog first.
+        """
+        due = []
+        for key in self._cache().keys("autosave:"):
+            user_id = key[len("autosave:"):]
+            record = self.pending(user_id)
+            reason = self.due_reason(record, now)
+            if reason:
+                due.append((user_id, reason, record))
+        due.sort(key=lambda item: item[2]["tokens"], reverse=True)
+        return due
+
+    def claim(self, user_id: str, allow_empty: bool = False) -> bool:
+        """
+        Atomically claims the user's pending work. False if someone else holds
+        it, or if nothing is pending (unless allow_empty, for manual updates).
+        """
+        claimed = {}
+
+        def take(record):
+            now = time.time()
+            held = record["claimed_at"] and now - record["claimed_at"] < self.claim_timeout
+            claimed["ok"] = not held and (allow_empty or record["turns"] > 0)
+            if claimed["ok"]:
+                record["claimed_at"] = now
+                record["claimed_turns"] = record["turns"]
+                record["claimed_tokens"] = record["tokens"]
+                record["claimed_covered_turns"] = record["covered_turns"]
+
+        self._update_record(user_id, take)
+        return claimed["ok"]
+
+    def wait_for_claim(self, user_id: str, timeout: float = None, poll: float = 0.2) -> bool:
+        """
+        Claims the user even with nothing pending, waiting up to timeout
+        seconds for a running update to finish. False if it is still held.
+        """
+        deadline = time.monotonic() + (AUTOSAVE_CLAIM_WAIT_SECONDS if timeout is None else timeout)
+        while not self.claim(user_id, allow_empty=True):
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(poll)
+        return True
+
+    def refresh_claim(self, user_id: str) -> None:
+        """
+        Restarts the claim timeout of a held claim, for holders whose work
+        outlasts it (Batch API jobs). A crashed holder stops refreshing, so
+        its claims still expire.
+        """
+        def touch(record):
+            if record["claimed_at"]:
+                record["claimed_at"] = time.time()
+        self._update_record(user_id, touch)
+
+    def release(self, user_id: str, processed: bool) -> None:
+        """
+        Drops the claim. On success only the claimed turns are cleared, so turns
+        recorded while the update was running stay pending.
+        """
+        def done(record):
+            if processed:
+                record["turns"] = max(0, record["turns"] - record["claimed_turns"])
+                record["tokens"] = max(0, record["tokens"] - record["claimed_tokens"])
+                record["covered_turns"] = max(0, record["covered_turns"] - record["claimed_covered_turns"])
+                if not record["turns"]:
+                    record["session_ended"] = False
+            record["claimed_at"] = None
+            record["claimed_turns"] = 0
+            record["claimed_tokens"] = 0
+            record["claimed_covered_turns"] = 0
+        self._update_record(user_id, done)
+
+    def run_update(self, user_id: str, reason: str) -> tuple[bool, str]:
+        """
+        Runs perform_memory_update for user_id if the claim succeeds.
+        """
+        if not self.claim(user_id):
+            return False, "Update already running or nothing pending."
+
+        print(f"[AutoSave] Triggering memory update for {user_id} ({reason})...")
+        success = False
+        try:
+            success, message = (self.updater or perform_memory_update)(user_id)
+        except Exception as e:
+            message = f"Update error: {e}"
+        finally:
+            self.release(user_id, processed=success)
+
         if success:
             print(f"[AutoSave] ✓ Auto-save successful: {message}")
-            return 0  # Reset
         else:
             print(f"[AutoSave] ✗ Auto-save failed: {message}")
-            # Keep count to retry next time? Or reset?
-            # Original logic kept count to retry.
-            return new_count 
-            
-    return new_count
+        return success, message
+
+    def process_due(self, max_users: int = None, workers: int = None) -> list[tuple[str, bool, str]]:
+        """
+        Processes users whose updates are due (idle / session end / tokens)
+        as one batch on a pool of `workers` threads, largest backlog first.
+        Admission control still bounds the LLM calls they make.
+        Returns (user_id, success, message) per user attempted.
+        """
+        due = self.due_users()[:max_users]
+        if not due:
+            return []
+
+        def run(item):
+            user_id, reason, _ = item
+            return (user_id, *self.run_update(user_id, reason))
+
+        with ThreadPoolExecutor(max_workers=min(workers or AUTOSAVE_WORKERS, len(due))) as pool:
+            return list(pool.map(run, due))
+
+
+autosave_policy = AutosavePolicy()
+
+
+def start_autosave_sweeper(interval: float = 60.0, policy: AutosavePolicy = None) -> threading.Thread:
+    """
+    Starts a daemon thread that periodically processes idle and ended sessions.
+    """
+    policy = policy or autosave_policy
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                policy.process_due()
+            except Exception as e:
+                print(f"[AutoSave] ✗ Sweeper error: {e}")
+
+    thread = threading.Thread(target=loop, name="autosave-sweeper", daemon=True)
+    thread.start()
+    return thread
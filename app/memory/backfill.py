@@ -0,0 +1,172 @@
+import copy
+from datetime import datetime
+from typing import Iterable
+from app.db.bulk import Checkpoint, run_bounded, read_ndjson
+from app.db.coach_state_repo import INITIAL_STATE, load_state_for_update
+from app.db.emotion_series_repo import record_state_snapshot
+from app.db.recent_turns_repo import iter_turns
+from app.memory.batch_job import _is_rate_limit_error
+from app.memory.dialogue_chunk import build_dialogue_chunk, format_turn
+from app.memory.episodic import EpisodicMemory, episodic_memory
+from app.memory.updater import safe_update_coach_state, apply_memory_update
+from app.utils.admission import admission, AdmissionRejected, PRIORITY_BACKGROUND
+from app.utils.ledger import usage_context
+from app.utils.rate_limit import TokenBucket
+
+
+def _update_window(user_id: str, state: dict, window: list[dict], limiter: TokenBucket,
+                   max_retries: int, backoff: float, window_chars: int) -> tuple[dict, bool, str]:
+    chunk = build_dialogue_chunk(window, max_turns=len(window), max_chars=window_chars)
+    for attempt in range(max_retries + 1):
+        limiter.acquire()
+        try:
+            # Admitted as background work: queues behind chat turns and gets
+            # the memory-update deadline as its OpenAI timeout
+            with admission.admit(user_id, priority=PRIORITY_BACKGROUND):
+                return safe_update_coach_state(state, chunk)
+        except Exception as e:
+            retriable = _is_rate_limit_error(e) or (isinstance(e, AdmissionRejected) and e.reason == "queue_full")
+            if not retriable or attempt == max_retries:
+                return state, False, str(e)
+            # A 429 pauses every worker sharing the limiter
+            limiter.pause(backoff * (2 ** attempt))
+    return state, False, "retries exhausted"
+
+
+def backfill_user(user_id: str, limiter: TokenBucket, from_scratch: bool = False,
+                  window_turns: int = 40, window_chars: int = 6000,
+                  max_retries: int = 3, backoff: float = 5.0) -> tuple[bool, str]:
+    """
+    Reruns the memory updater over a user's turn history, chaining the state
+    through every window, then saves once. A window closes at window_turns
+    turns or window_chars characters of dialogue, whichever comes first, so
+    the updater sees every turn it covers.
+    from_scratch starts from INITIAL_STATE over all turns; otherwise only
+    turns after the stored processed-turn watermark are folded in.
+    The last turn read becomes the new watermark, so turns written during
+    the backfill are left to the next memory update.
+    Returns (success, message); nothing is saved if any window fails, or if
+    the state was written by someone else while the backfill ran.
+    """
+    try:
+        stored, version, processed = load_state_for_update(user_id)
+    except Exception as e:
+        return False, f"⚠ Memory store unavailable; backfill deferred ({e})."
+    state = copy.deepcopy(INITIAL_STATE) if from_scratch else stored
+    after = None if from_scratch else processed
+    since = None if from_scratch or after else stored.get("updated_at") or None
+
+    # (state, time of the window's last turn) per window, for the emotional time series
+    history = []
+    window, chars = [], 0
+    turns = iter_turns(user_id, after=after, since=since, strict=True)
+    for turn in turns:
+        line = len(format_turn(turn)) + 1
+        if window and (len(window) >= window_turns or chars + line > window_chars):
+            state, success, message = _update_window(user_id, state, window, limiter, max_retries, backoff,
+                                                     window_chars)
+            if not success:
+                return False, f"⚠ Backfill failed at window {len(history) + 1}: {message}"
+            history.append((state, window[-1]))
+            window, chars = [], 0
+        window.append(turn)
+        chars += line
+    if window:
+        state, success, message = _update_window(user_id, state, window, limiter, max_retries, backoff,
+                                                 window_chars)
+        if not success:
+            return False, f"⚠ Backfill failed at window {len(history) + 1}: {message}"
+        history.append((state, window[-1]))
+
+    if not history:
+        return True, "✓ Nothing to backfill."
+    last = history[-1][1]
+    success, message = apply_memory_update(user_id, state, (last["created_at"], last["id"]), version,
+                                           snapshot=False)
+    if success:
+        # Each window is a point in time of the replayed history, not "now"
+        for window_state, window_last in history:
+            record_state_snapshot(user_id, window_state, datetime.fromisoformat(window_last["created_at"]))
+    return success, f"{message} ({len(history)} windows)"
+
+
+def run_backfill(user_ids: Iterable[str], workers: int = 4, rate: float = 1.0, from_scratch: bool = False,
+                 checkpoint: Checkpoint = None, limiter: TokenBucket = None) -> dict[str, tuple[bool, str]]:
+    """
+    Backfills many users concurrently. All workers share one rate limiter,
+    so `rate` bounds updater LLM calls per second overall. Users finished
+    successfully are checkpointed; a rerun skips them.
+    """
+    checkpoint = checkpoint if checkpoint is not None else Checkpoint()
+    limiter = limiter or TokenBucket(rate)
+    results = {}
+
+    def run(user_id):
+        with usage_context(user_id, "backfill"):
+            return backfill_user(user_id, limiter, from_scratch=from_scratch)
+
+    todo = (u for u in user_ids if u not in checkpoint)
+    for user_id, result, error in run_bounded(run, todo, workers):
+        success, message = result if not error else (False, f"⚠ Backfill failed: {error}")
+        results[user_id] = (success, message)
+        if success:
+            checkpoint.mark(user_id)
+        else:
+            print(f"[Backfill] ✗ {user_id}: {message}")
+
+    ok = sum(1 for success, _ in results.values() if success)
+    print(f"[Backfill] ✓ {ok}/{len(results)} users backfilled ({len(checkpoint)} done overall)")
+    return results
+
+
+def index_episodic_history(user_ids: Iterable[str], memory: EpisodicMemory = None, workers: int = 4,
+                           checkpoint: Checkpoint = None, page_size: int = 500) -> dict[str, int]:
+    """
+    Indexes each user's stored turns into episodic memory, for history saved
+    before EPISODIC_MEMORY was enabled. Turns already indexed are skipped, so
+    a rerun only embeds what is missing. Users finished are checkpointed.
+    Returns {user_id: turns added}.
+    """
+    memory = memory or episodic_memory or EpisodicMemory()
+    checkpoint = checkpoint if checkpoint is not None else Checkpoint()
+    results = {}
+
+    def run(user_id):
+        added, page = 0, []
+        for turn in iter_turns(user_id, page_size=page_size, columns="role, content", strict=True):
+            page.append(turn)
+            if len(page) == page_size:
+                added += memory.add_turns(user_id, page, skip_indexed=True)
+                page = []
+        return added + memory.add_turns(user_id, page, skip_indexed=True)
+
+    todo = (u for u in user_ids if u not in checkpoint)
+    for user_id, added, error in run_bounded(run, todo, workers):
+        if error:
+            print(f"[Episodic] ✗ Indexing {user_id} failed: {error}")
+            continue
+        results[user_id] = added
+        checkpoint.mark(user_id)
+    print(f"[Episodic] ✓ Indexed {sum(results.values())} turns for {len(results)} users")
+    return results
+
+
+def index_episodic_file(path: str, memory: EpisodicMemory = None, batch_size: int = 500) -> int:
+    """
+    Indexes an NDJSON turn export (export-turns, or the archive of pruned
+    turns) into episodic memory, skipping turns already indexed.
+    Returns the number of turns added.
+    """
+    memory = memory or episodic_memory or EpisodicMemory()
+    pending, added = {}, 0
+    for record in read_ndjson(path):
+        if not record.get("user_id"):
+            continue
+        batch = pending.setdefault(record["user_id"], [])
+        batch.append(record)
+        if len(batch) == batch_size:
+            added += memory.add_turns(record["user_id"], pending.pop(record["user_id"]), skip_indexed=True)
+    for user_id, batch in pending.items():
+        added += memory.add_turns(user_id, batch, skip_indexed=True)
+    print(f"[Episodic] ✓ Indexed {added} turns from {path}")
+    return added
@@ -0,0 +1,324 @@
+import os
+import io
+import json
+import time
+import argparse
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from app.db.recent_turns_repo import count_pending_turns
+from app.memory.autosave import autosave_policy
+from app.memory.updater import (
+    perform_memory_update, prepare_memory_update, apply_memory_update, build_updater_messages, skip_unchanged
+)
+from app.utils.ledger import usage_ledger, start_usage_flusher
+from app.utils.rate_limit import TokenBucket
+
+# Bounded pool size and LLM request rate for the batch job
+MEMORY_BATCH_WORKERS = int(os.getenv("MEMORY_BATCH_WORKERS", "4"))
+MEMORY_BATCH_RATE = float(os.getenv("MEMORY_BATCH_RATE", "1.0"))  # updates per second
+# Optional UTC window the scheduler runs in, e.g. "01:00-06:00"; empty = always
+MEMORY_BATCH_WINDOW = os.getenv("MEMORY_BATCH_WINDOW", "")
+MEMORY_BATCH_MODEL = "gpt-5-nano"
+
+
+def find_pending_users(policy=None, limit: int = 1000) -> list[tuple[str, int]]:
+    """
+    Users with turns their last memory update has not processed (one grouped
+    query), plus users the autosave policy reports as due.
+    Returns [(user_id, pending_turns)], largest first.
+    """
+    policy = policy or autosave_policy
+    pending = {row["user_id"]: row["pending"] for row in count_pending_turns(limit) if row["pending"]}
+    for user_id, _, record in policy.due_users():
+        pending[user_id] = max(pending.get(user_id, 0), record["turns"])
+    return sorted(pending.items(), key=lambda item: item[1], reverse=True)
+
+
+def in_batch_window(window: str, now: datetime = None) -> bool:
+    """
+    True if now (UTC) falls in window "HH:MM-HH:MM". The window may wrap midnight.
+    """
+    if not window:
+        return True
+    now = now or datetime.now(timezone.utc)
+    start_text, end_text = window.split("-")
+    start = datetime.strptime(start_text.strip(), "%H:%M").time()
+    end = datetime.strptime(end_text.strip(), "%H:%M").time()
+    current = now.time()
+    if start <= end:
+        return start <= current < end
+    return current >= start or current < end
+
+
+def _is_rate_limit_error(e: Exception) -> bool:
+    return getattr(e, "status_code", None) == 429 or "RateLimit" in type(e).__name__
+
+
+class InlineSubmitter:
+    """
+    Runs perform_memory_update per user in a bounded thread pool.
+    Every update takes a permit from the rate limiter; a 429 pauses the limiter
+    for all workers and the user is retried with exponential backoff.
+    """
+
+    def __init__(self, max_workers: int = None, limiter: TokenBucket = None,
+                 max_retries: int = 3, backoff: float = 5.0, updater=None):
+        self.max_workers = max_workers or MEMORY_BATCH_WORKERS
+        self.limiter = limiter or TokenBucket(MEMORY_BATCH_RATE)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.updater = updater
+
+    def _run_one(self, user_id: str) -> tuple[bool, str]:
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            try:
+                return (self.updater or perform_memory_update)(user_id)
+            except Exception as e:
+                if not _is_rate_limit_error(e) or attempt == self.max_retries:
+                    return False, f"⚠ Memory update failed: {e}"
+                delay = self.backoff * (2 ** attempt)
+                print(f"[Batch] Rate limited on {user_id}, backing off {delay:.0f}s")
+                self.limiter.pause(delay)
+        return False, "⚠ Memory update failed: retries exhausted"
+
+    def submit(self, user_ids: list[str]) -> dict[str, tuple[bool, str]]:
+        # Executor preserves submission order, so the largest backlogs start first
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            results = pool.map(self._run_one, user_ids)
+            return dict(zip(user_ids, results))
+
+
+class LocalBatchAPI:
+    """
+    In-process stand-in for an offline batch API with the OpenAI Batch API shape:
+    create(requests) -> batch_id, status(batch_id), results(batch_id).
+    Requests are completed with completion_fn(body) -> chat completion dict.
+    """
+
+    def __init__(self, completion_fn=None):
+        self.completion_fn = completion_fn
+        self._batches = {}
+
+    def _complete(self, body: dict) -> dict:
+        if self.completion_fn:
+            return self.completion_fn(body)
+        from app.llm.client import client
+        return client.chat.completions.create(**body).model_dump()
+
+    def create(self, requests: list[dict]) -> str:
+        batch_id = f"local_batch_{len(self._batches) + 1}"
+        self._batches[batch_id] = requests
+        return batch_id
+
+    def status(self, batch_id: str) -> str:
+        return "completed"
+
+    def results(self, batch_id: str) -> list[dict]:
+        output = []
+        for request in self._batches.pop(batch_id, []):
+            try:
+                output.append({"custom_id": request["custom_id"],
+                               "response": {"status_code": 200, "body": self._complete(request["body"])}})
+            except Exception as e:
+                output.append({"custom_id": request["custom_id"], "error": {"message": str(e)}})
+        return output
+
+
+class OpenAIBatchAPI:
+    """
+    OpenAI Batch API (24h completion window, discounted, separate rate limits).
+    """
+
+    def __init__(self, client=None):
+        if client is None:
+            from app.llm.client import client
+        self.client = client
+
+    def create(self, requests: list[dict]) -> str:
+        payload = "\n".join(json.dumps(r) for r in requests).encode("utf-8")
+        input_file = self.client.files.create(file=("memory_updates.jsonl", io.BytesIO(payload)), purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id, endpoint="/v1/chat/completions", completion_window="24h"
+        )
+        return batch.id
+
+    def status(self, batch_id: str) -> str:
+        return self.client.batches.retrieve(batch_id).status
+
+    def results(self, batch_id: str) -> list[dict]:
+        batch = self.client.batches.retrieve(batch_id)
+        output = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                text = self.client.files.content(file_id).text
+                output.extend(json.loads(line) for line in text.splitlines() if line.strip())
+        return output
+
+
+class BatchAPISubmitter:
+    """
+    Submits all updates as one offline batch, polls until done, then validates
+    and saves each result.
+    """
+
+    def __init__(self, api=None, poll_interval: float = 30.0, timeout: float = 24 * 3600):
+        self.api = api or LocalBatchAPI()
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+
+    def submit(self, user_ids: list[str]) -> dict[str, tuple[bool, str]]:
+        results = {}
+        requests = []
+        prepared = {}  # user_id -> (watermark, version) the result is saved against
+        for user_id in user_ids:
+            try:
+                # A backlog longer than one chunk stays pending for the next sweep
+                old_state, dialogue_chunk, watermark, version, _ = prepare_memory_update(user_id)
+            except Exception as e:
+                results[user_id] = (False, f"⚠ Memory update deferred: could not load dialogue ({e}).")
+                continue
+            if not dialogue_chunk:
+                results[user_id] = (False, "⚠ No valid dialogue to save.")
+                continue
+            prepared[user_id] = (watermark, version)
+            skipped = skip_unchanged(user_id, dialogue_chunk, watermark)
+            if skipped:
+                results[user_id] = (True, skipped)
+                continue
+            requests.append({
+                "custom_id": user_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": MEMORY_BATCH_MODEL,
+                    "messages": build_updater_messages(old_state, dialogue_chunk),
+                    "response_format": {"type": "json_object"},
+                },
+            })
+        if not requests:
+            return results
+
+        batch_id = self.api.create(requests)
+        print(f"[Batch] Submitted {len(requests)} updates as {batch_id}")
+        deadline = time.monotonic() + self.timeout
+        status = self.api.status(batch_id)
+        while status not in ("completed", "failed", "expired", "cancelled"):
+            if time.monotonic() > deadline:
+                break
+            time.sleep(self.poll_interval)
+            status = self.api.status(batch_id)
+        if status != "completed":
+            for request in requests:
+                results[request["custom_id"]] = (False, f"⚠ Batch {batch_id} ended as {status}")
+            return results
+
+        for item in self.api.results(batch_id):
+            user_id = item["custom_id"]
+            # Batch items never pass the breaker, so each one is counted as a call here
+            body = (item.get("response") or {}).get("body") or {}
+            usage_ledger.add_usage(body.get("usage"), user_id=user_id, call_type="memory_update_batch",
+                                   calls=1, errors=int(bool(item.get("error")) or "choices" not in body))
+            try:
+                content = body["choices"][0]["message"]["content"]
+                results[user_id] = apply_memory_update(user_id, json.loads(content), *prepared[user_id])
+            except (KeyError, IndexError, TypeError, json.JSONDecodeError) as e:
+                error = item.get("error") or e
+                results[user_id] = (False, f"⚠ Memory update failed: {error}")
+        return results
+
+
+@contextmanager
+def _keep_claims(policy, user_ids: list[str]):
+    """
+    Refreshes the users' autosave claims every third of the claim timeout
+    while the block runs, so a Batch API job that takes hours does not let
+    the autosave sweeper retake its users.
+    """
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(policy.claim_timeout / 3):
+            for user_id in user_ids:
+                policy.refresh_claim(user_id)
+
+    thread = threading.Thread(target=beat, name="batch-claims", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_batch(limit: int = None, submitter=None, policy=None) -> dict[str, tuple[bool, str]]:
+    """
+    One pass of the batch job: find pending users, claim them, process the
+    ones claimed, release the claims. Users whose update is already running
+    elsewhere are left out. Returns {user_id: (success, message)}.
+    """
+    policy = policy or autosave_policy
+    submitter = submitter or InlineSubmitter()
+    pending = find_pending_users(policy)[:limit]
+    if not pending:
+        print("[Batch] No users with pending dialogue.")
+        return {}
+
+    # Claim so the inline autosave does not process the same users meanwhile;
+    # users found in the database may have nothing pending in the policy
+    user_ids = [user_id for user_id, _ in pending if policy.claim(user_id, allow_empty=True)]
+    if len(user_ids) < len(pending):
+        print(f"[Batch] {len(pending) - len(user_ids)} users skipped: update already running")
+    if not user_ids:
+        return {}
+    print(f"[Batch] Processing {len(user_ids)} users (top backlog: {pending[0][1]} turns)")
+    results = {}
+    try:
+        with _keep_claims(policy, user_ids):
+            results = submitter.submit(user_ids)
+    finally:
+        for user_id in user_ids:
+            policy.release(user_id, processed=results.get(user_id, (False, ""))[0])
+
+    ok = sum(1 for success, _ in results.values() if success)
+    print(f"[Batch] ✓ {ok}/{len(results)} memory updates succeeded")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch memory updates for users with pending dialogue.")
+    parser.add_argument("--once", action="store_true", help="Run one pass and exit")
+    parser.add_argument("--interval", type=float, default=900.0, help="Seconds between passes")
+    parser.add_argument("--workers", type=int, default=MEMORY_BATCH_WORKERS)
+    parser.add_argument("--rate", type=float, default=MEMORY_BATCH_RATE, help="Updates per second")
+    parser.add_argument("--limit", type=int, default=None, help="Max users per pass")
+    parser.add_argument("--batch-api", action="store_true", help="Submit through the OpenAI Batch API")
+    parser.add_argument("--standalone", action="store_true",
+                        help="Run without SHARED_CACHE_PATH (no app running: claims are not shared)")
+    args = parser.parse_args()
+
+    # Claims and due users live in the autosave policy's cache; without a shared
+    # cache they are private to this process and the app could update the same users
+    if not os.getenv("SHARED_CACHE_PATH") and not args.standalone:
+        parser.error("SHARED_CACHE_PATH is not set, so claims cannot be coordinated with the app's autosave. "
+                     "Point it at the app's cache file (the cluster uses coach_cache.sqlite3), "
+                     "or pass --standalone if the app is not running.")
+
+    if args.batch_api:
+        submitter = BatchAPISubmitter(OpenAIBatchAPI())
+    else:
+        submitter = InlineSubmitter(max_workers=args.workers, limiter=TokenBucket(args.rate))
+    start_usage_flusher()
+
+    if args.once:
+        run_batch(limit=args.limit, submitter=submitter)
+    else:
+        while True:
+            if in_batch_window(MEMORY_BATCH_WINDOW):
+                try:
+                    run_batch(limit=args.limit, submitter=submitter)
+                except Exception as e:
+                    print(f"[Batch] ✗ Pass failed, retrying in {args.interval:.0f}s: {e}")
+            time.sleep(args.interval)
@@ -0,0 +1,83 @@
+import os
+import re
+
+# MEMORY_CHANGE_DETECTOR=0 disables the pre-filter (every update calls the LLM)
+MEMORY_CHANGE_DETECTOR = os.getenv("MEMORY_CHANGE_DETECTOR", "1") == "1"
+# Minimum signal score for an update to be worth an LLM call
+MEMORY_CHANGE_THRESHOLD = float(os.getenv("MEMORY_CHANGE_THRESHOLD", "1.0"))
+# A chunk with this many turns (a full updater window) always updates
+MEMORY_CHANGE_MAX_DEFER_TURNS = int(os.getenv("MEMORY_CHANGE_MAX_DEFER_TURNS", "40"))
+
+_WEEKDAYS = r"monday|tuesday|wednesday|thursday|friday|saturday|sunday|weekend"
+_MONTHS = r"january|february|march|april|june|july|august|september|october|november|december"
+
+# (signal, weight, pattern) over the user's lines of the dialogue chunk
+SIGNALS = [
+    ("commitment", 1.0, re.compile(
+        r"\b(i'?ll|i will|i'?m going to|i am going to|gonna|i plan to|i'?m planning to|planning to|"
+        r"i promise|i commit|committed to|i need to|i have to|i must|my plan is|i decided|i'?ve decided)\b")),
+    ("goal", 1.0, re.compile(
+        r"\b(goals?|aim|target|objective|milestone|launch\w*|raise|raising|fundrais\w*|hire|hiring|"
+        r"revenue|mrr|arr|runway|customers?|users|ship|release|grow\w*|want to|hoping to|priority|"
+        r"focus on)\b")),
+    ("blocker", 1.0, re.compile(
+        r"\b(stuck|blocked|blocker|can'?t|cannot|unable|struggl\w*|problem|obstacle|bottleneck|behind|"
+        r"delay\w*|procrastinat\w*|no time|keeps? failing|not working|conflict|falling apart)\b")),
+    ("progress", 1.0, re.compile(
+        r"\b(done|finished|completed?|shipped|launched|closed|signed|hired|submitted|quit|gave up|"
+        r"cancell?ed|pivot\w*|postponed|dropped)\b")),
+    ("emotion", 1.0, re.compile(
+        r"\b(anxious|anxiety|panic\w*|stressed|stress|burn(ed|t)? ?out|exhausted|overwhelmed|depressed|"
+        r"hopeless|furious|angry|frustrated|terrified|scared|devastated|thrilled|ecstatic|excited|"
+        r"proud|relieved|crying|miserable|lonely|can'?t sleep|dread\w*)\b")),
+    ("date", 0.5, re.compile(
+        rf"\b(today|tonight|tomorrow|next (week|month|quarter)|this (week|month|quarter)|"
+        rf"end of (the )?(week|month|quarter|year)|deadline|eod|eow|q[1-4]|in \d+ (days|weeks|months)|"
+        rf"(by|on|next|this) ({_WEEKDAYS})|{_MONTHS}|\d{{1,2}}[/.-]\d{{1,2}})\b")),
+]
+
+
+def _user_lines(dialogue_chunk: str) -> tuple[list[str], int]:
+    """
+    User messages of a chunk built by build_dialogue_chunk, plus the turn count.
+    Continuation lines of multi-line messages stay with their speaker.
+    """
+    user_lines, turns, speaker = [], 0, None
+    for line in dialogue_chunk.splitlines():
+        if line.startswith("User: "):
+            speaker, line = "user", line[len("User: "):]
+            turns += 1
+        elif line.startswith("Assistant: "):
+            speaker = "assistant"
+            turns += 1
+        if speaker == "user":
+            user_lines.append(line)
+    return user_lines, turns
+
+
+def assess_dialogue(dialogue_chunk: str, threshold: float = None) -> dict:
+    """
+    Cheap local check whether a dialogue chunk can change the coach_state.
+    Scores the user's messages for commitments, goals, blockers, progress,
+    strong emotion and dates; only user text counts, since coach replies
+    always sound actionable.
+    Returns {"warranted": bool, "score": float, "signals": {name: hits}}.
+    """
+    threshold = MEMORY_CHANGE_THRESHOLD if threshold is None else threshold
+    user_lines, turns = _user_lines(dialogue_chunk or "")
+    text = "\n".join(user_lines).lower().replace("’", "'")
+
+    signals, score = {}, 0.0
+    for name, weight, pattern in SIGNALS:
+        hits = len(pattern.findall(text))
+        if hits:
+            signals[name] = hits
+            score += weight
+    if turns >= MEMORY_CHANGE_MAX_DEFER_TURNS:
+        signals["backlog"] = turns
+        score += threshold
+    return {"warranted": score >= threshold, "score": score, "signals": signals}
+
+
+def should_update(dialogue_chunk: str, threshold: float = None) -> bool:
+    return assess_dialogue(dialogue_chunk, threshold)["warranted"]
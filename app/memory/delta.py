@@ -0,0 +1,119 @@
+import copy
+import os
+from concurrent.futures import ThreadPoolExecutor
+from app.db.coach_state_repo import load_state_for_update, save_coach_state, StaleStateError
+from app.db.emotion_series_repo import record_state_snapshot, METRICS
+from app.utils.validation import validate_coach_state
+
+# Re-reads of the state when another writer saved between a delta's read and save
+DELTA_CONFLICT_RETRIES = int(os.getenv("DELTA_CONFLICT_RETRIES", "3"))
+
+# One writer thread: deltas are applied in arrival order. Writes from other
+# processes and from full memory updates are caught by the version check.
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state-delta")
+
+_LIST_FIELDS = ("add_goals", "add_next_actions", "completed_actions", "add_blockers", "resolved_blockers")
+_SCALAR_FIELDS = ("current_focus", "session_note", "mood_label", "valence", "arousal",
+                  "stress_level", "confidence_level")
+
+
+def is_empty_delta(delta: dict | None) -> bool:
+    if not delta:
+        return True
+    return not any(delta.get(f) for f in _LIST_FIELDS) and all(delta.get(f) is None for f in _SCALAR_FIELDS)
+
+
+def _item_text(item) -> str:
+    """
+    Comparable text of a state list item (items may be strings or dicts).
+    """
+    if isinstance(item, dict):
+        for key in ("title", "action", "text", "description", "name", "goal", "blocker"):
+            if item.get(key):
+                return str(item[key]).strip().casefold()
+        return ""
+    return str(item).strip().casefold()
+
+
+def _append_unique(items: list, new_items: list[str]) -> list:
+    existing = {_item_text(i) for i in items}
+    for text in new_items:
+        if text and text.strip().casefold() not in existing:
+            items.append(text.strip())
+            existing.add(text.strip().casefold())
+    return items
+
+
+def apply_state_delta(state: dict, delta: dict) -> dict:
+    """
+    Deterministically merges a fused-mode state delta into a copy of state.
+    """
+    new_state = copy.deepcopy(state)
+    _append_unique(new_state.setdefault("goals", []), delta.get("add_goals") or [])
+    _append_unique(new_state.setdefault("blockers", []), delta.get("add_blockers") or [])
+
+    actions = _append_unique(new_state.setdefault("next_actions", []), delta.get("add_next_actions") or [])
+    done = {t.strip().casefold() for t in delta.get("completed_actions") or []}
+    if done:
+        # Structured items keep a status; plain strings have none, so a done
+        # action is no longer a next action
+        for action in actions:
+            if isinstance(action, dict) and _item_text(action) in done:
+                action["status"] = "done"
+        new_state["next_actions"] = [a for a in actions if isinstance(a, dict) or _item_text(a) not in done]
+
+    resolved = {t.strip().casefold() for t in delta.get("resolved_blockers") or []}
+    if resolved:
+        new_state["blockers"] = [b for b in new_state["blockers"] if _item_text(b) not in resolved]
+
+    if delta.get("current_focus"):
+        new_state["current_focus"] = delta["current_focus"]
+
+    patterns = new_state.setdefault("pattern_analysis", {})
+    if delta.get("session_note"):
+        patterns["last_session_notes"] = delta["session_note"]
+    for key in ("stress_level", "confidence_level"):
+        if delta.get(key) is not None:
+            patterns[key] = delta[key]
+
+    emotional = new_state.setdefault("last_emotional_state", {})
+    for key in ("mood_label", "valence", "arousal"):
+        if delta.get(key) is not None:
+            emotional[key] = delta[key]
+    return new_state
+
+
+def _apply_and_save(user_id: str, delta: dict) -> bool:
+    try:
+        for _ in range(DELTA_CONFLICT_RETRIES + 1):
+            old_state, version, _ = load_state_for_update(user_id)
+            new_state = apply_state_delta(old_state, delta)
+            is_valid, error_msg = validate_coach_state(new_state)
+            if not is_valid:
+                print(f"[Fused] ✗ Delta for {user_id} produced invalid state: {error_msg}")
+                return False
+            # updated_at marks the last full memory update, so it is left alone here
+            try:
+                save_coach_state(user_id, new_state, expected_version=version)
+            except StaleStateError:
+                continue
+            print(f"[Fused] ✓ State delta applied for {user_id}")
+            if any(delta.get(metric) is not None for metric in METRICS):
+                # Fused mode rarely runs full updates, so deltas feed the emotional time series
+                record_state_snapshot(user_id, new_state)
+            return True
+        print(f"[Fused] ✗ Dropping state delta for {user_id}: the state kept changing")
+        return False
+    except Exception as e:
+        print(f"[Fused] ✗ Applying state delta failed for {user_id}: {e}")
+        return False
+
+
+def apply_delta_async(user_id: str, delta: dict):
+    """
+    Applies delta to the stored coach_state in the background.
+    Returns a Future[bool], or None when the delta is empty.
+    """
+    if is_empty_delta(delta):
+        return None
+    return _executor.submit(_apply_and_save, user_id, delta)
@@ -1,29 +1,45 @@
-def build_dialogue_chunk(conv_history: list, max_turns: int = 40, max_chars: int = 6000) -> str:
+from collections import deque
+from typing import Iterable
+
+def format_turn(msg: dict) -> str:
+    return f"{msg['role'].capitalize()}: {msg['content']}"
+
+def select_dialogue_turns(conv_history: Iterable[dict], max_turns: int = 40, max_chars: int = 6000) -> list[dict]:
     """
-    Builds a dialogue chunk from conversation history for the memory updater.
-    Caps at max_turns or max_chars to avoid token blowups.
+    The turns build_dialogue_chunk puts in a chunk: of the most recent
+    max_turns valid messages, the oldest ones that fit in max_chars (a
+    first turn longer than max_chars on its own is kept, and truncated).
+    The last returned turn is the newest one the updater sees, so the
+    processed-turn watermark must be taken from it, not from the input.
     """
     if not conv_history:
-        return ""
-    
-    # Filter valid messages
-    valid_messages = [
-        m for m in conv_history 
-        if isinstance(m, dict) and 'role' in m and 'content' in m
-    ]
-    
-    # Take most recent turns
-    recent = valid_messages[-max_turns:] if len(valid_messages) > max_turns else valid_messages
-    
-    # Build chunk with character limit
-    lines = []
+        return []
+
+    # Filter valid messages, keeping only the most recent turns
+    recent = deque(
+        (m for m in conv_history
+         if isinstance(m, dict) and 'role' in m and 'content' in m),
+        maxlen=max_turns
+    )
+
+    selected = []
     total_chars = 0
-    
+
     for msg in recent:
-        line = f"{msg['role'].capitalize()}: {msg['content']}"
-        if total_chars + len(line) > max_chars:
+        line = format_turn(msg)
+        if selected and total_chars + len(line) > max_chars:
             break
-        lines.append(line)
+        selected.append(msg)
         total_chars += len(line) + 1  # +1 for newline
-    
-    return "\n".join(lines)
+
+    return selected
+
+def build_dialogue_chunk(conv_history: Iterable[dict], max_turns: int = 40, max_chars: int = 6000) -> str:
+    """
+    Builds a dialogue chunk from conversation history for the memory updater.
+    conv_history can be any iterable (e.g. the iter_turns stream); only the
+    most recent max_turns valid messages are kept while consuming it.
+    Caps at max_turns or max_chars to avoid token blowups.
+    """
+    lines = [format_turn(msg) for msg in select_dialogue_turns(conv_history, max_turns, max_chars)]
+    return "\n".join(lines)[:max_chars]
@@ -0,0 +1,247 @@
+import os
+import re
+import json
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict
+from app.utils.tokens import estimate_tokens
+
+# EPISODIC_MEMORY=1 indexes every turn and retrieves relevant older turns into the prompt
+EPISODIC_MEMORY = os.getenv("EPISODIC_MEMORY", "0") == "1"
+EPISODIC_MEMORY_DIR = os.getenv("EPISODIC_MEMORY_DIR", os.path.join("data", "episodic"))
+EPISODIC_TOP_K = int(os.getenv("EPISODIC_TOP_K", "5"))
+EPISODIC_TOKEN_BUDGET = int(os.getenv("EPISODIC_TOKEN_BUDGET", "400"))
+EPISODIC_MIN_SCORE = float(os.getenv("EPISODIC_MIN_SCORE", "0.15"))
+# Per-user indexes kept open (each holds a memory map); the least recently used is closed first
+EPISODIC_MAX_OPEN_INDEXES = int(os.getenv("EPISODIC_MAX_OPEN_INDEXES", "128"))
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+
+class HashingEmbedder:
+    """
+    Deterministic local embedder: signed feature hashing of words and word
+    bigrams, L2-normalised. No model or network needed; used in tests and as
+    the default backend.
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def _features(self, text: str) -> list[str]:
+        words = _WORD_RE.findall(text.lower())
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+                vectors[row, h % self.dim] += 1.0 if (h >> 63) & 1 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+class OpenAIEmbedder:
+    """
+    Embeddings from the OpenAI API (text-embedding-3-small by default).
+    """
+
+    def __init__(self, model: str = "text-embedding-3-small", dim: int = 256):
+        self.model = model
+        self.dim = dim
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        from app.llm.client import client
+        response = client.embeddings.create(model=self.model, input=texts, dimensions=self.dim)
+        vectors = np.array([item.embedding for item in response.data], dtype=np.float32)
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+class VectorIndex:
+    """
+    Append-only vector index for one user, stored in a directory:
+    - vectors.f32: float32 matrix (capacity x dim), memory-mapped, grown by doubling
+    - meta.jsonl: one {"role", "content"} line per stored vector; its line
+      count is the number of valid rows, so a torn append is simply ignored
+    Search is a brute-force dot product over the mapped matrix.
+    """
+
+    def __init__(self, directory: str, dim: int, initial_capacity: int = 1024):
+        self.directory = directory
+        self.dim = dim
+        os.makedirs(directory, exist_ok=True)
+        self._vectors_path = os.path.join(directory, "vectors.f32")
+        self._meta_path = os.path.join(directory, "meta.jsonl")
+        self._lock = threading.Lock()
+        self._matrix = None
+
+        self.meta = []
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path, encoding="utf-8") as f:
+                self.meta = [json.loads(line) for line in f if line.strip()]
+        self._keys = {(m["role"], m["content"]) for m in self.meta}
+
+        rows_on_disk = 0
+        if os.path.exists(self._vectors_path):
+            rows_on_disk = os.path.getsize(self._vectors_path) // (4 * dim)
+        self._capacity = max(initial_capacity, rows_on_disk, len(self.meta))
+        self._open(self._capacity)
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        return os.path.exists(os.path.join(directory, "meta.jsonl"))
+
+    def close(self) -> None:
+        """
+        Releases the memory map (and its file descriptor). The index stays
+        usable: the next append or search maps the file again.
+        """
+        with self._lock:
+            if self._matrix is not None:
+                self._matrix.flush()
+                self._matrix = None
+
+    def _mapped(self) -> np.memmap:
+        if self._matrix is None:
+            self._open(self._capacity)
+        return self._matrix
+
+    def _open(self, capacity: int) -> None:
+        with open(self._vectors_path, "ab") as f:
+            f.truncate(capacity * self.dim * 4)
+        self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        self._capacity = capacity
+
+    def __len__(self) -> int:
+        return len(self.meta)
+
+    def __contains__(self, meta: dict) -> bool:
+        return (meta["role"], meta["content"]) in self._keys
+
+    def append(self, vectors: np.ndarray, metas: list[dict]) -> None:
+        with self._lock:
+            start = len(self.meta)
+            needed = start + len(metas)
+            if needed > self._capacity:
+                if self._matrix is not None:
+                    self._matrix.flush()
+                    self._matrix = None
+                capacity = self._capacity
+                while capacity < needed:
+                    capacity *= 2
+                self._open(capacity)
+            matrix = self._mapped()
+            matrix[start:needed] = vectors
+            matrix.flush()
+            # Vectors first, then metadata: meta.jsonl decides what is valid
+            with open(self._meta_path, "a", encoding="utf-8") as f:
+                for meta in metas:
+                    f.write(json.dumps(meta) + "\n")
+            self.meta.extend(metas)
+            self._keys.update((m["role"], m["content"]) for m in metas)
+
+    def search(self, query: np.ndarray, k: int) -> list[tuple[int, float]]:
+        """
+        Top-k (row, cosine score) for a normalised query vector, best first.
+        """
+        with self._lock:
+            n = len(self.meta)
+            if n == 0 or k <= 0:
+                return []
+            scores = self._mapped()[:n] @ query
+        k = min(k, n)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top]
+
+
+class EpisodicMemory:
+    """
+    Per-user episodic memory over the full turn history.
+    Turns are embedded and appended as they are saved; retrieve() returns the
+    most relevant older snippets for a message within a token budget.
+    """
+
+    def __init__(self, root_dir: str = None, embedder=None, max_open: int = None):
+        self.root_dir = root_dir or EPISODIC_MEMORY_DIR
+        self.embedder = embedder or HashingEmbedder()
+        self.max_open = max_open or EPISODIC_MAX_OPEN_INDEXES
+        self._indexes = OrderedDict()  # user_id -> VectorIndex, least recently used first
+        self._lock = threading.Lock()
+
+    def _index(self, user_id: str, create: bool = True) -> VectorIndex | None:
+        """
+        The user's index, opened on first use. With create=False a user
+        without one gets None instead of a new, empty index on disk.
+        """
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is not None:
+                self._indexes.move_to_end(user_id)
+                return index
+            # Hash the user id so it is always a safe directory name
+            directory = os.path.join(self.root_dir, hashlib.sha1(user_id.encode("utf-8")).hexdigest())
+            if not create and not VectorIndex.exists(directory):
+                return None
+            index = VectorIndex(directory, self.embedder.dim)
+            self._indexes[user_id] = index
+            while len(self._indexes) > self.max_open:
+                _, evicted = self._indexes.popitem(last=False)
+                evicted.close()
+            return index
+
+    def add_turns(self, user_id: str, turns: list[dict], skip_indexed: bool = False) -> int:
+        """
+        Embeds and appends turns. skip_indexed drops turns whose role and
+        content are already in the index (re-indexing stored history).
+        Returns the number of turns added.
+        """
+        metas = [{"role": t["role"], "content": t["content"]} for t in turns if t.get("content")]
+        index = self._index(user_id)
+        if skip_indexed:
+            metas = [m for m in metas if m not in index]
+        if not metas:
+            return 0
+        vectors = self.embedder.embed([m["content"] for m in metas])
+        index.append(vectors, metas)
+        return len(metas)
+
+    def retrieve(self, user_id: str, query: str, k: int = None, token_budget: int = None,
+                 exclude: set = None, min_score: float = None) -> list[dict]:
+        """
+        Most relevant past turns for query, best first.
+        Turns whose content is in `exclude` (e.g. already in RECENT_TURNS) are skipped.
+        """
+        k = k or EPISODIC_TOP_K
+        token_budget = token_budget or EPISODIC_TOKEN_BUDGET
+        min_score = EPISODIC_MIN_SCORE if min_score is None else min_score
+        exclude = exclude or set()
+        if not query:
+            return []
+        index = self._index(user_id, create=False)
+        if index is None or not len(index):
+            return []
+
+        query_vector = self.embedder.embed([query])[0]
+        # Over-fetch so excluded or duplicate hits do not starve the result
+        hits = index.search(query_vector, k + len(exclude) + 5)
+        snippets, seen, used = [], set(), 0
+        for row, score in hits:
+            if score < min_score or len(snippets) >= k:
+                break
+            meta = index.meta[row]
+            if meta["content"] in exclude or meta["content"] in seen:
+                continue
+            cost = estimate_tokens(meta["content"])
+            if used + cost > token_budget:
+                continue
+            seen.add(meta["content"])
+            used += cost
+            snippets.append({"role": meta["role"], "content": meta["content"], "score": round(score, 3)})
+        return snippets
+
+
+episodic_memory = EpisodicMemory() if EPISODIC_MEMORY else None
@@ -1,25 +1,52 @@
 from app.llm.client import client
 from app.llm.prompts import MEMORY_UPDATER_PROMPT
 from app.utils.validation import validate_coach_state
-from app.db.coach_state_repo import get_or_create_coach_state, save_coach_state
-from app.db.recent_turns_repo import load_recent_turns
-from app.memory.dialogue_chunk import build_dialogue_chunk
+from app.db.coach_state_repo import (
+    save_coach_state, load_state_for_update, advance_turn_watermark, StaleStateError, FallbackStateError
+)
+from app.db.recent_turns_repo import load_turns_after
+from app.memory.dialogue_chunk import build_dialogue_chunk, select_dialogue_turns
+from app.memory.change_detector import assess_dialogue, MEMORY_CHANGE_DETECTOR
+from app.utils.profiling import profiled
+from app.utils.circuit_breaker import openai_breaker, CircuitOpenError
+from app.utils.admission import admission, timeout_kwargs, AdmissionRejected, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, MEMORY_UPDATE_DEADLINE_SECONDS
+from app.utils.ledger import usage_context
+from app.llm.shadow import shadow_traffic
+from app.db.emotion_series_repo import record_state_snapshot
+import os
 import json
+import time
 from datetime import datetime, timezone
 
-def update_coach_state(old_state, dialogue_chunk):
-    messages = [
+# Reruns of a memory update whose state was changed meanwhile (fused-mode deltas)
+MEMORY_UPDATE_CONFLICT_RETRIES = int(os.getenv("MEMORY_UPDATE_CONFLICT_RETRIES", "1"))
+# Dialogue chunks (40 turns / 6000 characters each) one update works through when more
+# turns are pending than fit in one; the rest waits for the next update
+MEMORY_UPDATE_MAX_CHUNKS = int(os.getenv("MEMORY_UPDATE_MAX_CHUNKS", "4"))
+
+def build_updater_messages(old_state: dict, dialogue_chunk: str) -> list[dict]:
+    """
+    Messages for one memory-updater call (shared by the inline and batch paths).
+    """
+    return [
         {"role": "system", "content": MEMORY_UPDATER_PROMPT},
         {"role": "user", "content": f"OLD_COACH_STATE: {json.dumps(old_state)}\n\nDIALOGUE_CHUNK: {dialogue_chunk}"}
     ]
 
+
+def update_coach_state(old_state, dialogue_chunk):
+    messages = build_updater_messages(old_state, dialogue_chunk)
+
     # Using a model capable of good JSON generation
-    response = client.chat.completions.create(
-        model="gpt-5-nano",
-        messages=messages,
-        temperature=1,
-        response_format={ "type": "json_object" }
+    request = {"model": "gpt-5-nano", "messages": messages, "temperature": 1,
+               "response_format": {"type": "json_object"}}
+    began = time.perf_counter()
+    response = openai_breaker.call(
+        client.chat.completions.create,
+        **request,
+        **timeout_kwargs()
     )
+    shadow_traffic.mirror("memory_update", request, response, (time.perf_counter() - began) * 1000)
     
     new_state_json = response.choices[0].message.content
     try:
@@ -61,12 +88,15 @@ def safe_update_coach_state(old_state: dict, dialogue_chunk: str) -> tuple[dict,
     ]
     
     try:
-        response = client.chat.completions.create(
-            model="gpt-5-nano",
-            messages=strict_messages,
-            temperature=1,  # gpt-5-nano requires temp 1
-            response_format={"type": "json_object"}
-        )
+        with usage_context(retry=True):
+            response = openai_breaker.call(
+                client.chat.completions.create,
+                model="gpt-5-nano",
+                messages=strict_messages,
+                temperature=1,  # gpt-5-nano requires temp 1
+                response_format={"type": "json_object"},
+                **timeout_kwargs()
+            )
         
         retry_state_json = response.choices[0].message.content
         retry_state = json.loads(retry_state_json)
@@ -89,38 +119,174 @@ def safe_update_coach_state(old_state: dict, dialogue_chunk: str) -> tuple[dict,
         return old_state, False, f"Error on retry: {e}"
 
 
-def perform_memory_update(user_id: str) -> tuple[bool, str]:
+def prepare_memory_update(user_id: str) -> tuple[dict, str, tuple[str, int] | None, int | None, bool]:
+    """
+    Loads the inputs of a memory update: (old_state, dialogue_chunk, watermark, version, more).
+    The chunk holds the oldest unprocessed turns that fit in 40 turns and
+    6000 characters. watermark is the (created_at, id) of the newest turn in
+    the chunk; saving it with the result marks exactly those turns processed,
+    so turns cut by the budget or written while the LLM call runs are picked
+    up by the next chunk. more is True if turns past the chunk were already
+    pending. version is the state's version, for a save that fails if the
+    state changed meanwhile.
+    dialogue_chunk is "" when there is nothing to process.
+    Raises if the state or the turns cannot be read, rather than building a
+    partial chunk.
+    """
+    # Fetch fresh state from DB
+    old_state, version, processed = load_state_for_update(user_id)
+    
+    # Step 7A: Build dialogue chunk from DB (Phase 2)
+    # The oldest unprocessed turns (one past a full chunk, to tell whether more
+    # are pending), in one bounded read; rows without a watermark yet fall
+    # back to updated_at
+    since = None if processed else old_state.get("updated_at") or None
+    turns = load_turns_after(user_id, after=processed, since=since, limit=41)
+    included = select_dialogue_turns(turns[:40], max_turns=40, max_chars=6000)
+    dialogue_chunk = build_dialogue_chunk(included, max_turns=40, max_chars=6000)
+    
+    if not dialogue_chunk:
+        return {}, "", None, None, False
+    watermark = (included[-1]["created_at"], included[-1]["id"])
+    return old_state, dialogue_chunk, watermark, version, len(included) < len(turns)
+
+
+def apply_memory_update(user_id: str, new_state: dict, watermark: tuple[str, int] | None = None,
+                        expected_version: int | None = None, snapshot: bool = True) -> tuple[bool, str]:
+    """
+    Validates new_state and saves it for user_id, with the watermark and
+    version returned by prepare_memory_update. A state changed since then
+    is not overwritten. snapshot=False leaves the emotional time series to
+    the caller (backfill records its windows at their own times).
+    Used directly by the batch-API path, where the LLM output arrives later.
+    """
+    is_valid, error_msg = validate_coach_state(new_state)
+    if not is_valid:
+        print(f"[Memory] Update failed for {user_id}: {error_msg}")
+        return False, f"⚠ Memory update failed: {error_msg}"
+    new_state["updated_at"] = datetime.now(timezone.utc).isoformat()
+    try:
+        return _save_updated_state(user_id, new_state, watermark, expected_version, snapshot)
+    except StaleStateError:
+        print(f"[Memory] ⚠ coach_state for {user_id} changed since the update was prepared; result dropped")
+        return False, "⚠ Memory update deferred: the state changed while it was running."
+
+
+def skip_unchanged(user_id: str, dialogue_chunk: str,
+                   watermark: tuple[str, int] | None = None) -> str | None:
+    """
+    Runs the change detector. Returns a skip message if the chunk has nothing
+    state-relevant, else None. A skip advances the processed-turn watermark,
+    so the batch job and the next update do not pick the same turns again.
+    """
+    if not MEMORY_CHANGE_DETECTOR:
+        return None
+    assessment = assess_dialogue(dialogue_chunk)
+    if assessment["warranted"]:
+        return None
+    print(f"[Memory] No state-relevant changes for {user_id} (score {assessment['score']:.1f}); update skipped.")
+    if watermark:
+        try:
+            advance_turn_watermark(user_id, watermark)
+        except Exception as e:
+            # Harmless: the turns are just assessed again next time
+            print(f"[Memory] ✗ Could not mark skipped turns processed for {user_id}: {e}")
+    return "✓ No state changes detected; update skipped."
+
+
+@profiled("perform_memory_update", trace_allocations=True)
+def perform_memory_update(user_id: str, force: bool = False, interactive: bool = False) -> tuple[bool, str]:
     """
     Core memory update pipeline used by both manual save and auto-save.
+    Unless force is set, chunks without state-relevant content skip the LLM call.
+    interactive marks a user waiting on the result (manual save): it is
+    admitted ahead of background updates, with the memory-update deadline.
+    A backlog longer than one dialogue chunk is worked through oldest first,
+    chaining the state, up to MEMORY_UPDATE_MAX_CHUNKS chunks.
+    If the state is changed while the LLM call runs (a fused-mode delta), the
+    result is not saved over it; the update reruns on the new state up to
+    MEMORY_UPDATE_CONFLICT_RETRIES times.
     Returns (success: bool, message: str).
     """
     if not user_id:
         return False, "⚠ No user loaded."
     
-    # Step 7A: Build dialogue chunk from DB (Phase 2)
-    # Fetch recent turns from DB instead of in-memory history
-    # Limit fetch to 40 turns, cap strings at 6000 chars
-    db_history = load_recent_turns(user_id, limit=40)
-    dialogue_chunk = build_dialogue_chunk(db_history, max_turns=40, max_chars=6000)
+    for chunk in range(1, MEMORY_UPDATE_MAX_CHUNKS + 1):
+        success, message, more = _update_chunk(user_id, force, interactive)
+        if not success and chunk > 1:
+            # The earlier chunks are saved; the rest stays pending
+            return False, f"{message} ({chunk - 1} chunk(s) saved before it)"
+        if not success or not more:
+            break
+    if chunk > 1:
+        message = f"{message} ({chunk} chunks)"
+    return success, message
+
+
+def _update_chunk(user_id: str, force: bool, interactive: bool) -> tuple[bool, str, bool]:
+    for _ in range(MEMORY_UPDATE_CONFLICT_RETRIES + 1):
+        try:
+            return _run_memory_update(user_id, force, interactive)
+        except StaleStateError:
+            print(f"[Memory] ⚠ coach_state for {user_id} changed during the update; rerunning on the new state")
+    return False, "⚠ Memory update deferred: the state kept changing while it was running.", False
+
+
+def _run_memory_update(user_id: str, force: bool, interactive: bool) -> tuple[bool, str, bool]:
+    """
+    One chunk of perform_memory_update: (success, message, more turns pending).
+    Raises StaleStateError if the state changed between the read and the save.
+    """
+    try:
+        old_state, dialogue_chunk, watermark, version, more = prepare_memory_update(user_id)
+    except (FallbackStateError, CircuitOpenError):
+        # Updating a stale/default state would overwrite the real memory later
+        return False, "⚠ Memory store unavailable; update deferred.", False
+    except Exception as e:
+        print(f"[Memory] ✗ Could not load dialogue for {user_id}: {e}")
+        return False, f"⚠ Memory update deferred: could not load dialogue ({e}).", False
     
     if not dialogue_chunk:
-        return False, "⚠ No valid dialogue to save."
-    
-    # Fetch fresh state from DB
-    old_state = get_or_create_coach_state(user_id)
+        return False, "⚠ No valid dialogue to save.", False
+    if not force:
+        skipped = skip_unchanged(user_id, dialogue_chunk, watermark)
+        if skipped:
+            return True, skipped, more
     
     # Step 7C: Call updater with retry logic
-    new_state, success, message = safe_update_coach_state(old_state, dialogue_chunk)
+    # Background updates queue behind interactive turns for LLM capacity
+    priority = PRIORITY_INTERACTIVE if interactive else PRIORITY_BACKGROUND
+    try:
+        # Not a chat message: a manual save must not spend (or fail on) the user's message rate
+        with admission.admit(user_id, priority=priority, timeout=MEMORY_UPDATE_DEADLINE_SECONDS,
+                             rate_limit=False), \
+                usage_context(user_id, "memory_update"):
+            new_state, success, message = safe_update_coach_state(old_state, dialogue_chunk)
+    except AdmissionRejected as e:
+        print(f"[Memory] Update for {user_id} shed by admission control: {e.reason}")
+        return False, f"⚠ Memory update deferred: server busy ({e.reason}).", False
     
     if not success:
         print(f"[Memory] Update failed for {user_id}: {message}")
-        return False, f"⚠ Memory update failed: {message}"
+        return False, f"⚠ Memory update failed: {message}", False
     
+    return (*_save_updated_state(user_id, new_state, watermark, version), more)
+
+
+def _save_updated_state(user_id: str, new_state: dict, watermark: tuple[str, int] | None = None,
+                        expected_version: int | None = None, snapshot: bool = True) -> tuple[bool, str]:
     # Step 7D: Save to database
+    # A concurrent write (StaleStateError) propagates: the caller decides
+    # whether to rerun or drop the result
     try:
-        save_coach_state(user_id, new_state)
+        save_coach_state(user_id, new_state, watermark, expected_version)
         print(f"[Memory] ✓ State saved to database for {user_id}")
+        # Keep the emotional values the next update will overwrite
+        if snapshot:
+            record_state_snapshot(user_id, new_state)
         return True, f"✓ Memory updated for {user_id}."
+    except StaleStateError:
+        raise
     except Exception as e:
         print(f"[Memory] ✗ Database save failed: {e}")
         return False, f"⚠ Database save failed: {e}"
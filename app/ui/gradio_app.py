@@ -1,91 +1,102 @@
 import gradio as gr
-import json
-from app.db.coach_state_repo import get_or_create_coach_state
-from app.db.recent_turns_repo import save_turn_pair, load_recent_turns
-from app.llm.prompts import COACH_SYSTEM_PROMPT
-from app.llm.responder import get_message_completion
-from app.memory.updater import perform_memory_update
-from app.memory.autosave import check_and_trigger_autosave
+from app.core.chat import ChatError, load_user, end_session, chat_turn, run_memory_update
+from app.core.history import session_store
 
 # Check version
 major_version = int(gr.__version__.split('.')[0])
 print(f"Gradio Version: {gr.__version__}")
 
-def load_user_state(user_id):
+def _session_key(user_id, request: gr.Request = None):
+    # Browser session; scripts calling the handlers directly get one per user
+    return request.session_hash if request is not None else user_id
+
+def _earlier_button(history):
+    return gr.Button(visible=history is not None and history.has_earlier())
+
+def load_user_state(user_id, request: gr.Request = None):
     """
-    Loads user state from database. Resets message counter on new session.
-    Returns: (user_id, chatbot_history, conv_history, status, user_msg_count)
+    Loads user state from database and starts a fresh server-side chat history.
+    Pending autosave work is tracked server-side, so nothing is reset here.
+    Returns: (user_id, chatbot_window, status, load_earlier_button)
     """
     if not user_id or user_id.strip() == "":
-        return None, [], [], "Please enter a User ID to start.", 0
+        return None, [], "Please enter a User ID to start.", _earlier_button(None)
     
     user_id = user_id.strip()
-    state = get_or_create_coach_state(user_id)
+    key = _session_key(user_id, request)
+    previous = session_store.get(key)
+    if previous and previous.user_id != user_id:
+        end_session(previous.user_id)
+    history = session_store.start(key, user_id)
+
+    state = load_user(user_id)
     goals_preview = state.get('goals', [])[:3]
     goals_text = f" Goals: {goals_preview}" if goals_preview else ""
-    # Reset counter to 0 on new session
-    return user_id, [], [], f"✓ Loaded state for user: {user_id}.{goals_text}", 0
+    return user_id, history.visible(), f"✓ Loaded state for user: {user_id}.{goals_text}", _earlier_button(history)
+
+def end_user_session(request: gr.Request = None):
+    """
+    Called when a browser tab closes; drops the session history and lets
+    the policy flush the user's pending turns.
+    """
+    if request is None:
+        return
+    history = session_store.drop(request.session_hash)
+    if history and history.user_id:
+        end_session(history.user_id)
 
-def process_message(user_message, history, user_id, conv_history, user_msg_count):
+def prefill_user_id(request: gr.Request):
     """
-    Processes user message and handles auto-save trigger every 10 user messages.
-    Returns: (chatbot_history, conv_history, msg_input_clear, user_msg_count)
+    Pre-fills the User ID box from ?user_id= (set by the multi-worker router).
+    """
+    if request is None:
+        return ""
+    return request.query_params.get("user_id", "")
+
+def process_message(user_message, user_id, request: gr.Request = None):
+    """
+    Runs one chat turn through the shared core pipeline.
+    The history lives server-side: the browser sends only the new message
+    and gets back the last CHAT_WINDOW_MESSAGES messages, so the payload
+    stays flat however long the session runs.
+    Returns: (chatbot_window, msg_input_clear, load_earlier_button)
     """
     if not user_id:
-        return history, conv_history, "⚠ Please load a User ID first.", user_msg_count
+        return gr.skip(), "⚠ Please load a User ID first.", gr.skip()
     if not user_message or user_message.strip() == "":
-        return history, conv_history, "", user_msg_count
-    
-    coach_state = get_or_create_coach_state(user_id)
-    messages = [{"role": "system", "content": COACH_SYSTEM_PROMPT}]
-    messages.append({"role": "user", "content": f"COACH_STATE:\n{json.dumps(coach_state, indent=2)}"})
-    messages.append({"role": "assistant", "content": "I've reviewed the COACH_STATE."})
-    
-    # PHASE 2: Load recent turns from DB for context
-    # User Requirement: Inject RECENT_TURNS as a separate context message
-    db_history = load_recent_turns(user_id, limit=20)
-    if db_history:
-        recent_turns_json = json.dumps(db_history, indent=2)
-        messages.append({"role": "user", "content": f"RECENT_TURNS:\n{recent_turns_json}"})
-        messages.append({"role": "assistant", "content": "I have reviewed the RECENT_TURNS."})
-    else:
-        messages.append({"role": "user", "content": "RECENT_TURNS: []"})
-        messages.append({"role": "assistant", "content": "I have reviewed the RECENT_TURNS."})
-    
-    messages.append({"role": "user", "content": user_message})
+        return gr.skip(), "", gr.skip()
     
     try:
-        response = get_message_completion(messages)
-    except Exception as e:
-        return history, conv_history, f"Error: {str(e)}", user_msg_count
+        response = chat_turn(user_id, user_message)
+    except ChatError as e:
+        return gr.skip(), e.message, gr.skip()
     
-    # Internal history unused but kept for interface compatibility if needed
-    new_conv_history = [] 
-    
-    # For Gradio: Messages format
-    if history is None: history = []
-    new_history = history + [
+    key = _session_key(user_id, request)
+    history = session_store.get(key)
+    if history is None or history.user_id != user_id:
+        history = session_store.start(key, user_id)
+    history.append(
         {"role": "user", "content": user_message},
         {"role": "assistant", "content": response}
-    ]
-    
-    # PHASE 2: Save turns to DB
-    save_turn_pair(user_id, user_message, response)
-    
-    # ═══════════════════════════════════════════════════════════════════════════
-    # STEP 6: AUTO-TRIGGER MEMORY UPDATE EVERY 10 USER MESSAGES
-    # ═══════════════════════════════════════════════════════════════════════════
-    
-    new_count = check_and_trigger_autosave(user_id, user_msg_count, threshold=10)
-    
-    return new_history, new_conv_history, "", new_count
+    )
+    return history.visible(), "", _earlier_button(history)
+
+def load_earlier(user_id, request: gr.Request = None):
+    """
+    'Load earlier messages': extends the chat window by one page.
+    Returns: (chatbot_window, load_earlier_button)
+    """
+    history = session_store.get(_session_key(user_id, request))
+    if history is None:
+        return gr.skip(), _earlier_button(None)
+    return history.load_earlier(), _earlier_button(history)
 
-def update_memory(user_id, conv_history):
+def update_memory(user_id):
     """
     Manual memory update triggered by the 'Update Memory' button.
     Uses the shared perform_memory_update() pipeline.
     """
-    success, message = perform_memory_update(user_id)
+    success, message = run_memory_update(user_id)
     return message
 
 def create_demo():
@@ -94,14 +105,13 @@ def create_demo():
         gr.Markdown("Enter your User ID to load your coaching state.")
         
         current_user_id = gr.State(value=None)
-        conversation_history = gr.State(value=[])
-        user_msg_count = gr.State(value=0)  # Counter for auto-save trigger
         
         with gr.Row():
             user_id_input = gr.Textbox(label="User ID", placeholder="Enter your name or ID...")
             load_btn = gr.Button("Load State", variant="primary")
         status_text = gr.Textbox(label="Status", interactive=False)
         
+        earlier_btn = gr.Button("⬆ Load earlier messages", size="sm", visible=False)
         chatbot = gr.Chatbot(label="Conversation", height=400)
             
         msg_input = gr.Textbox(label="Your message", placeholder="Type your message here...")
@@ -109,26 +119,39 @@ def create_demo():
         with gr.Row():
             send_btn = gr.Button("Send", variant="primary")
             save_btn = gr.Button("💾 Update Memory", variant="secondary")
-        gr.Markdown("*Memory auto-saves every 10 messages. Click 'Update Memory' to save manually.*")
+        gr.Markdown("*Memory auto-saves as the conversation grows, when you go idle, or when you leave. Click 'Update Memory' to save manually.*")
         
+        demo.load(fn=prefill_user_id, inputs=None, outputs=[user_id_input])
         load_btn.click(
             fn=load_user_state, 
             inputs=[user_id_input], 
-            outputs=[current_user_id, chatbot, conversation_history, status_text, user_msg_count]
+            outputs=[current_user_id, chatbot, status_text, earlier_btn]
         )
         send_btn.click(
             fn=process_message, 
-            inputs=[msg_input, chatbot, current_user_id, conversation_history, user_msg_count], 
-            outputs=[chatbot, conversation_history, msg_input, user_msg_count]
+            inputs=[msg_input, current_user_id], 
+            outputs=[chatbot, msg_input, earlier_btn],
+            concurrency_limit=None  # admission control limits LLM concurrency
         )
         msg_input.submit(
             fn=process_message, 
-            inputs=[msg_input, chatbot, current_user_id, conversation_history, user_msg_count], 
-            outputs=[chatbot, conversation_history, msg_input, user_msg_count]
+            inputs=[msg_input, current_user_id], 
+            outputs=[chatbot, msg_input, earlier_btn],
+            concurrency_limit=None  # admission control limits LLM concurrency
         )
         save_btn.click(
             fn=update_memory, 
-            inputs=[current_user_id, conversation_history], 
+            inputs=[current_user_id], 
             outputs=[status_text]
         )
+        earlier_btn.click(fn=load_earlier, inputs=[current_user_id], outputs=[chatbot, earlier_btn])
+        demo.unload(end_user_session)
     return demo
+
+def create_app():
+    """
+    ASGI app serving the Gradio demo at /, alongside the JSON API (/api) and /metrics.
+    """
+    from app.api.server import create_api_app
+
+    return gr.mount_gradio_app(create_api_app(), create_demo(), path="/")
@@ -0,0 +1,232 @@
+import os
+import time
+import heapq
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+from app.utils.rate_limit import TokenBucket
+
+# Global limits for LLM-bound work (interactive turns and memory updates)
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "8"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "32"))
+# Per-user message rate: sustained messages/second and burst size
+ADMISSION_USER_RATE = float(os.getenv("ADMISSION_USER_RATE", "0.5"))
+ADMISSION_USER_BURST = float(os.getenv("ADMISSION_USER_BURST", "3"))
+# End-to-end deadlines in seconds
+CHAT_DEADLINE_SECONDS = float(os.getenv("CHAT_DEADLINE_SECONDS", "60"))
+MEMORY_UPDATE_DEADLINE_SECONDS = float(os.getenv("MEMORY_UPDATE_DEADLINE_SECONDS", "180"))
+# How often idle per-user rate buckets are evicted (seconds)
+ADMISSION_BUCKET_SWEEP_SECONDS = float(os.getenv("ADMISSION_BUCKET_SWEEP_SECONDS", "60"))
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+_deadline = contextvars.ContextVar("admission_deadline", default=None)
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a request is shed. reason is one of
+    "queue_full", "rate_limited" or "deadline".
+    """
+
+    def __init__(self, reason: str, message: str = None):
+        super().__init__(message or f"Request rejected: {reason}")
+        self.reason = reason
+        # Set once a controller has counted the rejection in its metrics
+        self.counted = False
+
+
+def remaining_time() -> float | None:
+    """
+    Seconds left before the current request's deadline (None if no deadline).
+    Raises AdmissionRejected if the deadline already passed.
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise AdmissionRejected("deadline", "Request deadline exceeded")
+    return remaining
+
+
+def timeout_kwargs() -> dict:
+    """
+    {"timeout": seconds left} for an OpenAI call inside a request deadline,
+    {} outside one. Passing timeout=None would disable the client's own
+    timeout, so the key is left out instead.
+    """
+    remaining = remaining_time()
+    return {} if remaining is None else {"timeout": remaining}
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "deadline", "event", "granted")
+
+    def __init__(self, priority: int, seq: int, deadline: float | None):
+        self.priority = priority
+        self.seq = seq
+        self.deadline = deadline
+        self.event = threading.Event()
+        self.granted = False
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class AdmissionController:
+    """
+    Global concurrency limiter with a bounded priority queue.
+
+    - At most max_concurrency requests run at once; up to max_queue wait.
+      Interactive requests are served before background (memory-update) ones.
+    - Interactive requests are rate limited per user.
+    - Each admitted request carries a deadline (see remaining_time()); queued
+      requests whose deadline passes are rejected without ever running.
+    """
+
+    def __init__(self, max_concurrency: int = None, max_queue: int = None,
+                 user_rate: float = None, user_burst: float = None):
+        self.max_concurrency = max_concurrency or ADMISSION_MAX_CONCURRENCY
+        self.max_queue = max_queue if max_queue is not None else ADMISSION_MAX_QUEUE
+        self.user_rate = user_rate if user_rate is not None else ADMISSION_USER_RATE
+        self.user_burst = user_burst if user_burst is not None else ADMISSION_USER_BURST
+        self._lock = threading.Lock()
+        self._queue = []
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._user_buckets = {}
+        self._last_sweep = time.monotonic()
+        self._admitted = {PRIORITY_INTERACTIVE: 0, PRIORITY_BACKGROUND: 0}
+        self._rejected = {"queue_full": 0, "rate_limited": 0, "deadline": 0}
+
+    def _reject(self, reason: str):
+        self._rejected[reason] += 1
+        error = AdmissionRejected(reason)
+        error.counted = True
+        raise error
+
+    def _sweep_buckets(self, now: float) -> None:
+        # A bucket that has refilled is the same as a fresh one, so drop it
+        if now - self._last_sweep < ADMISSION_BUCKET_SWEEP_SECONDS:
+            return
+        self._last_sweep = now
+        for user_id in [u for u, b in self._user_buckets.items() if b.is_idle()]:
+            del self._user_buckets[user_id]
+
+    def _check_user_rate(self, user_id: str) -> None:
+        self._sweep_buckets(time.monotonic())
+        bucket = self._user_buckets.get(user_id)
+        if bucket is None:
+            bucket = self._user_buckets[user_id] = TokenBucket(self.user_rate, self.user_burst)
+        if not bucket.try_acquire():
+            self._reject("rate_limited")
+
+    def _acquire(self, priority: int, deadline: float | None) -> None:
+        with self._lock:
+            if self._in_flight < self.max_concurrency and not self._queue:
+                self._in_flight += 1
+                self._admitted[priority] += 1
+                return
+            if len(self._queue) >= self.max_queue:
+                self._reject("queue_full")
+            waiter = _Waiter(priority, next(self._seq), deadline)
+            heapq.heappush(self._queue, waiter)
+
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        waiter.event.wait(timeout)
+        with self._lock:
+            if waiter.granted:
+                self._admitted[priority] += 1
+                return
+            if waiter in self._queue:
+                self._queue.remove(waiter)
+                heapq.heapify(self._queue)
+            self._reject("deadline")
+
+    def _release(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            while self._queue:
+                waiter = heapq.heappop(self._queue)
+                if waiter.deadline is not None and waiter.deadline <= now:
+                    # Expired while queued; wake it so it rejects itself
+                    waiter.event.set()
+                    continue
+                # Hand our slot straight to the next waiter
+                waiter.granted = True
+                waiter.event.set()
+                return
+            self._in_flight -= 1
+
+    @contextmanager
+    def admit(self, user_id: str = None, priority: int = PRIORITY_INTERACTIVE, timeout: float = None,
+              rate_limit: bool = None):
+        """
+        Runs the body once a slot is free. timeout (seconds) sets the request
+        deadline, which covers both queueing and the work itself.
+        rate_limit spends a token of the user's message rate (default: for
+        interactive requests); a manual memory update is interactive but is
+        not a chat message, so it passes False.
+        Raises AdmissionRejected when the request is shed.
+        """
+        if timeout is None:
+            timeout = CHAT_DEADLINE_SECONDS if priority == PRIORITY_INTERACTIVE else MEMORY_UPDATE_DEADLINE_SECONDS
+        deadline = time.monotonic() + timeout
+        # Keep the earlier deadline if we are nested inside another request
+        outer = _deadline.get()
+        if outer is not None:
+            deadline = min(deadline, outer)
+
+        if rate_limit is None:
+            rate_limit = priority == PRIORITY_INTERACTIVE
+        if user_id and rate_limit:
+            with self._lock:
+                self._check_user_rate(user_id)
+        self._acquire(priority, deadline)
+        token = _deadline.set(deadline)
+        try:
+            yield
+        except AdmissionRejected as e:
+            # Deadline hit mid-request (remaining_time() in the body)
+            if not e.counted:
+                with self._lock:
+                    self._rejected[e.reason] += 1
+                e.counted = True
+            raise
+        finally:
+            _deadline.reset(token)
+            self._release()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight": self._in_flight,
+                "user_buckets": len(self._user_buckets),
+                "queue_depth": len(self._queue),
+                "queue_depth_interactive": sum(1 for w in self._queue if w.priority == PRIORITY_INTERACTIVE),
+                "queue_depth_background": sum(1 for w in self._queue if w.priority == PRIORITY_BACKGROUND),
+                "admitted_interactive": self._admitted[PRIORITY_INTERACTIVE],
+                "admitted_background": self._admitted[PRIORITY_BACKGROUND],
+                "rejected": dict(self._rejected),
+            }
+
+    def render_metrics(self) -> str:
+        """
+        Metrics in Prometheus text format.
+        """
+        m = self.metrics()
+        lines = [
+            f"admission_in_flight {m['in_flight']}",
+            f'admission_queue_depth{{priority="interactive"}} {m["queue_depth_interactive"]}',
+            f'admission_queue_depth{{priority="background"}} {m["queue_depth_background"]}',
+            f'admission_admitted_total{{priority="interactive"}} {m["admitted_interactive"]}',
+            f'admission_admitted_total{{priority="background"}} {m["admitted_background"]}',
+        ]
+        lines += [f'admission_rejected_total{{reason="{r}"}} {n}' for r, n in m["rejected"].items()]
+        return "\n".join(lines) + "\n"
+
+
+admission = AdmissionController()
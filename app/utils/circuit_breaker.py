@@ -0,0 +1,234 @@
+import os
+import time
+import threading
+from types import SimpleNamespace
+from app.utils.ledger import usage_ledger
+from app.utils.tracing import record_call
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling a dependency whose breaker is open.
+    """
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"{name} unavailable (circuit open, retry in {retry_in:.0f}s)")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Per-dependency circuit breaker.
+
+    closed    -> calls go through; failure_threshold consecutive failures open it
+    open      -> calls fail immediately with CircuitOpenError for reset_timeout seconds
+    half_open -> up to half_open_max_calls probe calls go through; a success
+                 closes the breaker, a failure re-opens it
+    is_failure(exc) decides which exceptions count (e.g. not client-side 4xx).
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 half_open_max_calls: int = 1, is_failure=None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.is_failure = is_failure or (lambda exc: True)
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._rejected = 0
+        self._opened_count = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def _maybe_half_open(self) -> None:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probes = 0
+
+    def _open(self) -> None:
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._opened_count += 1
+        print(f"[Breaker] ⚠ {self.name} circuit OPEN after {self._failures} failures")
+
+    def _before_call(self) -> None:
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == OPEN:
+                self._rejected += 1
+                raise CircuitOpenError(self.name, self.reset_timeout - (time.monotonic() - self._opened_at))
+            if self._state == HALF_OPEN:
+                if self._probes >= self.half_open_max_calls:
+                    self._rejected += 1
+                    raise CircuitOpenError(self.name, 0)
+                self._probes += 1
+
+    def _on_success(self) -> None:
+        with self._lock:
+            if self._state == HALF_OPEN:
+                print(f"[Breaker] ✓ {self.name} circuit closed (probe succeeded)")
+            self._state = CLOSED
+            self._failures = 0
+            self._probes = 0
+
+    def _on_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._open()
+
+    def call(self, fn, *args, **kwargs):
+        self._before_call()
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            elapsed = time.perf_counter() - start
+            record_call(self.name, elapsed)
+            usage_ledger.record_call(self.name, elapsed, error=True)
+            if self.is_failure(e):
+                self._on_failure()
+            else:
+                self._on_success()
+            raise
+        elapsed = time.perf_counter() - start
+        record_call(self.name, elapsed, result)
+        usage_ledger.record_call(self.name, elapsed, result)
+        self._on_success()
+        return result
+
+    def call_stream(self, fn, *args, **kwargs):
+        """
+        call() for a function returning a stream: yields its chunks and
+        records the call when the stream ends, so wall time covers the whole
+        stream and an error mid-stream counts like a failed call. The last
+        chunk carrying `usage` is reported as the call's usage.
+        """
+        self._before_call()
+        start = time.perf_counter()
+        usage = None
+        try:
+            for chunk in fn(*args, **kwargs):
+                usage = getattr(chunk, "usage", None) or usage
+                yield chunk
+        except GeneratorExit:
+            # The consumer stopped reading (client gone): not the dependency's fault
+            elapsed = time.perf_counter() - start
+            record_call(self.name, elapsed, SimpleNamespace(usage=usage))
+            usage_ledger.record_call(self.name, elapsed, SimpleNamespace(usage=usage))
+            self._on_success()
+            raise
+        except Exception as e:
+            elapsed = time.perf_counter() - start
+            record_call(self.name, elapsed, SimpleNamespace(usage=usage))
+            usage_ledger.record_call(self.name, elapsed, SimpleNamespace(usage=usage), error=True)
+            if self.is_failure(e):
+                self._on_failure()
+            else:
+                self._on_success()
+            raise
+        elapsed = time.perf_counter() - start
+        record_call(self.name, elapsed, SimpleNamespace(usage=usage))
+        usage_ledger.record_call(self.name, elapsed, SimpleNamespace(usage=usage))
+        self._on_success()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            self._maybe_half_open()
+            return {
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "opened_total": self._opened_count,
+                "rejected_total": self._rejected,
+            }
+
+
+_BUILDER_METHODS = ("execute", "table", "select", "insert", "update", "upsert", "delete")
+
+
+class GuardedClient:
+    """
+    Wraps a fluent query client (e.g. Supabase) so every .execute() goes
+    through a circuit breaker. Builder calls are passed through untouched.
+    """
+
+    def __init__(self, target, breaker: CircuitBreaker):
+        self._target = target
+        self._breaker = breaker
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name == "execute":
+            return lambda *a, **kw: self._breaker.call(attr, *a, **kw)
+        if not callable(attr):
+            return attr
+
+        def wrapped(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if any(hasattr(result, m) for m in _BUILDER_METHODS):
+                return GuardedClient(result, self._breaker)
+            return result
+        return wrapped
+
+
+def _is_openai_failure(exc: Exception) -> bool:
+    # Client-side errors (bad request, auth) do not mean the service is down
+    status = getattr(exc, "status_code", None)
+    return status is None or status >= 500 or status in (408, 429)
+
+
+# PostgREST error codes the caller caused: SQLSTATE classes 22 (bad data), 23 (constraint,
+# e.g. the unique violation of a lost insert race), 28 (auth), 42 (undefined column/table,
+# a missing migration), P0 (raised by a function), and PGRST1xx-3xx request/schema/JWT errors
+_SUPABASE_CLIENT_ERRORS = ("22", "23", "28", "42", "P0", "PGRST1", "PGRST2", "PGRST3")
+
+
+def _is_supabase_failure(exc: Exception) -> bool:
+    # Connection errors and timeouts carry no code and count as outages
+    code = str(getattr(exc, "code", None) or "")
+    if code.isdigit() and len(code) == 3:
+        # Non-JSON error responses (e.g. a gateway 502) report the HTTP status as the code
+        status = int(code)
+        return status >= 500 or status in (408, 429)
+    return not code.startswith(_SUPABASE_CLIENT_ERRORS)
+
+
+supabase_breaker = CircuitBreaker(
+    "supabase",
+    failure_threshold=int(os.getenv("SUPABASE_BREAKER_THRESHOLD", "3")),
+    reset_timeout=float(os.getenv("SUPABASE_BREAKER_RESET_SECONDS", "15")),
+    is_failure=_is_supabase_failure,
+)
+openai_breaker = CircuitBreaker(
+    "openai",
+    failure_threshold=int(os.getenv("OPENAI_BREAKER_THRESHOLD", "5")),
+    reset_timeout=float(os.getenv("OPENAI_BREAKER_RESET_SECONDS", "30")),
+    is_failure=_is_openai_failure,
+)
+
+
+def render_breaker_metrics() -> str:
+    """
+    Breaker states in Prometheus text format (1 = open, 0.5 = half-open, 0 = closed).
+    """
+    lines = []
+    for breaker in (supabase_breaker, openai_breaker):
+        m = breaker.metrics()
+        value = {CLOSED: 0, HALF_OPEN: 0.5, OPEN: 1}[m["state"]]
+        lines.append(f'circuit_breaker_open{{dependency="{breaker.name}"}} {value}')
+        lines.append(f'circuit_breaker_opened_total{{dependency="{breaker.name}"}} {m["opened_total"]}')
+        lines.append(f'circuit_breaker_rejected_total{{dependency="{breaker.name}"}} {m["rejected_total"]}')
+    return "\n".join(lines) + "\n"
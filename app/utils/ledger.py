@@ -0,0 +1,162 @@
+import os
+import time
+import atexit
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# USAGE_LEDGER=0 turns accounting off
+USAGE_LEDGER = os.getenv("USAGE_LEDGER", "1") == "1"
+# How often aggregated counters are written to the usage_ledger table
+USAGE_LEDGER_FLUSH_SECONDS = float(os.getenv("USAGE_LEDGER_FLUSH_SECONDS", "300"))
+
+COUNTERS = ("calls", "retries", "errors", "prompt_tokens", "completion_tokens", "cached_tokens", "wall_ms")
+
+# (user_id, call_type, retry) of the work running in this context
+_context = contextvars.ContextVar("usage_context", default=(None, "other", False))
+
+
+@contextmanager
+def usage_context(user_id: str = None, call_type: str = None, retry: bool = None):
+    """
+    Attributes LLM calls made inside the block to user_id / call_type.
+    Unset arguments are inherited from the enclosing context; retry=True
+    marks the calls as retries.
+    """
+    current_user, current_type, current_retry = _context.get()
+    token = _context.set((
+        user_id if user_id is not None else current_user,
+        call_type or current_type,
+        current_retry if retry is None else retry,
+    ))
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def _usage_counts(usage) -> dict:
+    """
+    Token counts from an OpenAI usage object (or the dict form in batch results).
+    """
+    def get(obj, name):
+        return (obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)) if obj is not None else None
+
+    details = get(usage, "prompt_tokens_details")
+    return {
+        "prompt_tokens": get(usage, "prompt_tokens") or 0,
+        "completion_tokens": get(usage, "completion_tokens") or 0,
+        "cached_tokens": get(details, "cached_tokens") or 0,
+    }
+
+
+def _save_rows(rows: list[dict]) -> None:
+    # Imported lazily: the DB client itself goes through the circuit breakers
+    from app.db.usage_repo import insert_usage_rows
+    insert_usage_rows(rows)
+
+
+class UsageLedger:
+    """
+    In-memory per-user accounting of LLM usage, rolled up per
+    (day, user_id, call_type). Recording is a dict update under a lock;
+    flush() writes one row per key that saw traffic since the last flush.
+    """
+
+    def __init__(self, sink=None, enabled: bool = True):
+        self.sink = sink or _save_rows
+        self.enabled = enabled
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def _add(self, user_id, call_type, counts: dict) -> None:
+        day = datetime.now(timezone.utc).date().isoformat()
+        key = (day, user_id or "_unknown", call_type)
+        with self._lock:
+            entry = self._totals.setdefault(key, dict.fromkeys(COUNTERS, 0))
+            for name, value in counts.items():
+                entry[name] += value
+
+    def record_call(self, dependency: str, elapsed: float, result=None, error: bool = False) -> None:
+        """
+        One dependency call; called by the circuit breakers. Only OpenAI calls are counted.
+        """
+        if not self.enabled or dependency != "openai":
+            return
+        user_id, call_type, retry = _context.get()
+        counts = _usage_counts(getattr(result, "usage", None))
+        counts.update(calls=1, retries=int(retry), errors=int(error), wall_ms=elapsed * 1000)
+        self._add(user_id, call_type, counts)
+
+    def add_usage(self, usage, user_id: str = None, call_type: str = None,
+                  calls: int = 0, errors: int = 0) -> None:
+        """
+        Token usage that arrives outside a call result (Batch API output).
+        Counted against the current context unless given; calls/errors count
+        requests that never went through a breaker (one per batch item).
+        """
+        if not self.enabled or (usage is None and not calls):
+            return
+        current_user, current_type, _ = _context.get()
+        counts = _usage_counts(usage)
+        counts.update(calls=calls, errors=errors)
+        self._add(user_id or current_user, call_type or current_type, counts)
+
+    def snapshot(self) -> list[dict]:
+        """
+        Unflushed totals as rows.
+        """
+        with self._lock:
+            return [
+                {"day": day, "user_id": user_id, "call_type": call_type, **counts}
+                for (day, user_id, call_type), counts in self._totals.items()
+            ]
+
+    def flush(self) -> int:
+        """
+        Writes the rolled-up rows and resets the counters. On failure the
+        counts are merged back and retried on the next flush.
+        Returns the number of rows written.
+        """
+        with self._lock:
+            totals, self._totals = self._totals, {}
+        if not totals:
+            return 0
+        rows = [
+            {"day": day, "user_id": user_id, "call_type": call_type, **counts,
+             "wall_ms": round(counts["wall_ms"], 1)}
+            for (day, user_id, call_type), counts in totals.items()
+        ]
+        try:
+            self.sink(rows)
+            return len(rows)
+        except Exception as e:
+            print(f"[Ledger] ✗ Flush failed, keeping {len(rows)} rows for next time: {e}")
+            with self._lock:
+                for key, counts in totals.items():
+                    entry = self._totals.setdefault(key, dict.fromkeys(COUNTERS, 0))
+                    for name, value in counts.items():
+                        entry[name] += value
+            return 0
+
+
+usage_ledger = UsageLedger(enabled=USAGE_LEDGER)
+
+
+def start_usage_flusher(interval: float = None, ledger: UsageLedger = None) -> threading.Thread:
+    """
+    Starts a daemon thread that flushes the ledger periodically, plus a final flush at exit.
+    """
+    ledger = ledger or usage_ledger
+    interval = interval or USAGE_LEDGER_FLUSH_SECONDS
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            ledger.flush()
+
+    thread = threading.Thread(target=loop, name="usage-ledger-flusher", daemon=True)
+    thread.start()
+    atexit.register(ledger.flush)
+    return thread
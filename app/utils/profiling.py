@@ -0,0 +1,152 @@
+import os
+import sys
+import time
+import random
+import functools
+import threading
+import tracemalloc
+from collections import Counter
+
+# APP_PROFILE=1 turns on sampling of decorated endpoints
+APP_PROFILE = os.getenv("APP_PROFILE", "0") == "1"
+# Fraction of calls that get profiled
+APP_PROFILE_SAMPLE_RATE = float(os.getenv("APP_PROFILE_SAMPLE_RATE", "0.1"))
+# Stack sampling interval in milliseconds
+APP_PROFILE_INTERVAL_MS = float(os.getenv("APP_PROFILE_INTERVAL_MS", "5"))
+# Output directory for <endpoint>.folded and <endpoint>.alloc.txt
+APP_PROFILE_DIR = os.getenv("APP_PROFILE_DIR", "profiles")
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}"
+
+
+class _StackSampler:
+    """
+    Samples the stack of one thread at a fixed interval from a helper thread.
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            if labels:
+                # Collapsed-stack format: root first, ';'-separated
+                self.stacks[";".join(reversed(labels))] += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+class Profiler:
+    """
+    Sampling profiler for selected endpoints.
+
+    A sampled call gets a statistical stack sampler; stacks are accumulated per
+    endpoint and written as collapsed stacks (<endpoint>.folded, input for
+    flamegraph.pl / speedscope). Endpoints marked trace_allocations also get a
+    tracemalloc diff of the call appended to <endpoint>.alloc.txt.
+    """
+
+    def __init__(self, enabled: bool = False, sample_rate: float = 0.1,
+                 interval_ms: float = 5.0, output_dir: str = "profiles"):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.interval = interval_ms / 1000.0
+        self.output_dir = output_dir
+        self._lock = threading.Lock()
+        self._stacks = {}  # endpoint -> Counter
+        self._tracing = 0
+
+    def should_sample(self) -> bool:
+        return self.enabled and random.random() < self.sample_rate
+
+    def _start_tracemalloc(self):
+        with self._lock:
+            if self._tracing == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start(10)
+            self._tracing += 1
+
+    def _stop_tracemalloc(self):
+        with self._lock:
+            self._tracing -= 1
+            if self._tracing == 0 and tracemalloc.is_tracing():
+                tracemalloc.stop()
+
+    def _write_stacks(self, endpoint: str, stacks: Counter) -> None:
+        with self._lock:
+            total = self._stacks.setdefault(endpoint, Counter())
+            total.update(stacks)
+            os.makedirs(self.output_dir, exist_ok=True)
+            path = os.path.join(self.output_dir, f"{endpoint}.folded")
+            with open(path, "w", encoding="utf-8") as f:
+                for stack, count in total.most_common():
+                    f.write(f"{stack} {count}\n")
+
+    def _write_alloc_report(self, endpoint: str, before, after, elapsed: float, top: int = 15) -> None:
+        diff = after.compare_to(before, "lineno")
+        grown = [d for d in diff if d.size_diff > 0][:top]
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [
+            f"=== {endpoint} @ {time.strftime('%Y-%m-%d %H:%M:%S')} ({elapsed * 1000:.1f} ms)",
+            f"traced current={current / 1024:.1f} KiB peak={peak / 1024:.1f} KiB",
+        ]
+        lines += [f"{d.size_diff / 1024:+.1f} KiB ({d.count_diff:+d} blocks) {d.traceback[0]}" for d in grown]
+        with self._lock:
+            os.makedirs(self.output_dir, exist_ok=True)
+            with open(os.path.join(self.output_dir, f"{endpoint}.alloc.txt"), "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n\n")
+
+    def run(self, endpoint: str, fn, args, kwargs, trace_allocations: bool = False):
+        if trace_allocations:
+            self._start_tracemalloc()
+            before = tracemalloc.take_snapshot()
+        start = time.perf_counter()
+        try:
+            with _StackSampler(threading.get_ident(), self.interval) as sampler:
+                return fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            try:
+                self._write_stacks(endpoint, sampler.stacks)
+                if trace_allocations:
+                    self._write_alloc_report(endpoint, before, tracemalloc.take_snapshot(), elapsed)
+            except Exception as e:
+                print(f"[Profile] ✗ Could not write profile for {endpoint}: {e}")
+            finally:
+                if trace_allocations:
+                    self._stop_tracemalloc()
+
+
+profiler = Profiler(APP_PROFILE, APP_PROFILE_SAMPLE_RATE, APP_PROFILE_INTERVAL_MS, APP_PROFILE_DIR)
+
+
+def profiled(endpoint: str, trace_allocations: bool = False):
+    """
+    Decorator: profiles a sampled fraction of calls when APP_PROFILE=1.
+    Unsampled calls only pay for one attribute check and a random().
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not profiler.should_sample():
+                return fn(*args, **kwargs)
+            return profiler.run(endpoint, fn, args, kwargs, trace_allocations)
+        return wrapper
+    return decorator
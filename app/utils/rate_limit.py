@@ -0,0 +1,63 @@
+import time
+import threading
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` permits per second, bursts up to `capacity`.
+    pause() stops handing out permits for a while (e.g. after a 429 from the API).
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self._paused_until or self._tokens < tokens:
+                return False
+            self._tokens -= tokens
+            return True
+
+    def acquire(self, tokens: float = 1.0, timeout: float = None) -> bool:
+        """
+        Blocks until a permit is available. Returns False if timeout expires first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._paused_until and self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = max(self._paused_until - now, (tokens - self._tokens) / self.rate if self.rate else 1.0)
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(max(wait, 0.001))
+
+    def is_idle(self) -> bool:
+        """
+        True once the bucket has refilled and is not paused.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            return now >= self._paused_until and self._tokens >= self.capacity
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
@@ -0,0 +1,10 @@
+import math
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate (~4 characters per token for English text).
+    Good enough for thresholds and budgets; not for billing.
+    """
+    if not text:
+        return 0
+    return math.ceil(len(text) / 4)
@@ -0,0 +1,134 @@
+import os
+import json
+import time
+import hashlib
+import inspect
+import functools
+import threading
+import contextvars
+
+# APP_TRACE=1 records a trace event for every decorated endpoint call
+APP_TRACE = os.getenv("APP_TRACE", "0") == "1"
+# Append-only NDJSON file, one compact event per line
+APP_TRACE_PATH = os.getenv("APP_TRACE_PATH", "traces/trace.ndjson")
+# Secret salt for hashing user ids; required: tracing stays off without it, since an
+# unsalted hash of a user id (e.g. "alice") is reversed with a dictionary lookup
+APP_TRACE_SALT = os.getenv("APP_TRACE_SALT", "")
+
+# Dependency (circuit breaker name) -> event field prefix
+_DEPENDENCY_KEYS = {"openai": "llm", "supabase": "db"}
+
+# Counters of the endpoint call running in this context, if it is being traced
+_span = contextvars.ContextVar("trace_span", default=None)
+
+
+def anonymize(user_id, salt: str = "") -> str | None:
+    if not user_id:
+        return None
+    return hashlib.sha256(f"{salt}:{user_id}".encode("utf-8")).hexdigest()[:12]
+
+
+def record_call(dependency: str, elapsed: float, result=None) -> None:
+    """
+    Adds one dependency call (latency, token usage) to the current span.
+    Called by the circuit breakers; a no-op outside a traced call.
+    """
+    span = _span.get()
+    if span is None:
+        return
+    key = _DEPENDENCY_KEYS.get(dependency, dependency)
+    span[f"{key}_ms"] = span.get(f"{key}_ms", 0.0) + elapsed * 1000
+    span[f"{key}_n"] = span.get(f"{key}_n", 0) + 1
+    usage = getattr(result, "usage", None)
+    if usage is not None:
+        span["pt"] = span.get("pt", 0) + (getattr(usage, "prompt_tokens", 0) or 0)
+        span["ct"] = span.get("ct", 0) + (getattr(usage, "completion_tokens", 0) or 0)
+
+
+class TraceRecorder:
+    """
+    Writes anonymized endpoint traces: timing, payload sizes, dependency
+    latencies and token counts. User ids are hashed and no message content
+    is stored. Each event is a single O_APPEND write, so several worker
+    processes can share one file.
+    """
+
+    def __init__(self, path: str = "traces/trace.ndjson", enabled: bool = False, salt: str = ""):
+        if enabled and not salt:
+            print("[Trace] ✗ APP_TRACE_SALT is not set; tracing disabled (unsalted user ids are reversible)")
+            enabled = False
+        self.path = path
+        self.enabled = enabled
+        self.salt = salt
+        self._fd = None
+        self._lock = threading.Lock()
+
+    def write(self, event: dict) -> None:
+        line = (json.dumps(event, separators=(",", ":")) + "\n").encode("utf-8")
+        with self._lock:
+            if self._fd is None:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            os.write(self._fd, line)
+
+    def run(self, op: str, fn, args, kwargs, user_id, describe=None):
+        span = {}
+        token = _span.set(span)
+        ts = time.time()
+        start = time.perf_counter()
+        ok, result = False, None
+        try:
+            result = fn(*args, **kwargs)
+            ok = True
+            return result
+        finally:
+            _span.reset(token)
+            event = {"ts": round(ts, 3), "op": op, "u": anonymize(user_id, self.salt),
+                     "ms": round((time.perf_counter() - start) * 1000, 2), "ok": int(ok)}
+            for key, value in span.items():
+                event[key] = round(value, 2) if isinstance(value, float) else value
+            try:
+                if describe is not None:
+                    event.update(describe(result))
+                self.write(event)
+            except Exception as e:
+                print(f"[Trace] ✗ Could not record {op}: {e}")
+
+
+recorder = TraceRecorder(APP_TRACE_PATH, APP_TRACE, APP_TRACE_SALT)
+
+
+def traced(op: str, user_arg: str = "user_id", describe=None):
+    """
+    Decorator: records a trace event per call when APP_TRACE=1.
+    describe(arguments, result) returns extra size fields for the event, where
+    arguments maps parameter names to the call's values.
+    Untraced calls only pay for one attribute check.
+    """
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not recorder.enabled:
+                return fn(*args, **kwargs)
+            arguments = signature.bind_partial(*args, **kwargs).arguments
+            describe_result = (lambda result: describe(arguments, result)) if describe else None
+            return recorder.run(op, fn, args, kwargs, arguments.get(user_arg), describe_result)
+        return wrapper
+    return decorator
+
+
+def load_trace(path: str) -> list[dict]:
+    """
+    Reads a trace file; skips a torn last line from a crashed writer.
+    """
+    events = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                events.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    events.sort(key=lambda e: e["ts"])
+    return events
@@ -0,0 +1,48 @@
+"""
+Episodic-memory retrieval latency at tens of thousands of turns per user.
+
+    python -m benchmarks.bench_episodic --turns 50000
+"""
+import time
+import random
+import argparse
+import tempfile
+from app.memory.episodic import EpisodicMemory, HashingEmbedder
+
+WORDS = ("deck investor hiring runway launch blocker sleep gym cofounder pricing churn roadmap "
+         "board meeting deadline stress focus anxious email sales demo").split()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=256)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as root:
+        memory = EpisodicMemory(root, HashingEmbedder(args.dim))
+        start = time.perf_counter()
+        batch = []
+        for i in range(args.turns):
+            batch.append({"role": "user", "content": " ".join(rng.choices(WORDS, k=20))})
+            if len(batch) == 1000:
+                memory.add_turns("bench", batch)
+                batch = []
+        if batch:
+            memory.add_turns("bench", batch)
+        print(f"indexed {args.turns} turns in {time.perf_counter() - start:.2f}s")
+
+        latencies = []
+        for _ in range(args.queries):
+            query = " ".join(rng.choices(WORDS, k=8))
+            t0 = time.perf_counter()
+            memory.retrieve("bench", query, min_score=0)
+            latencies.append((time.perf_counter() - t0) * 1000)
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2]
+        p99 = latencies[int(len(latencies) * 0.99) - 1]
+        print(f"retrieve: p50={p50:.2f} ms p99={p99:.2f} ms over {args.queries} queries")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+LLM calls and tokens per session: classic mode (reply + periodic memory
+updates) vs fused mode (reply + state delta in one call).
+
+Runs chat turns against a fake OpenAI client and an in-memory database,
+so it measures call/token volume, not model quality.
+
+    python -m benchmarks.bench_fused_mode --turns 40
+"""
+import os
+import json
+import random
+import argparse
+from types import SimpleNamespace
+from unittest.mock import patch
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+os.environ.setdefault("SUPABASE_URL", "https://bench.supabase.co")
+os.environ.setdefault("SUPABASE_ANON_KEY", "bench-key")
+
+import app.db.shared_cache as shared_cache
+import app.core.chat as chat
+from app.db.memory_client import InMemorySupabase
+from app.db.shared_cache import InMemoryCache
+from app.memory import delta as delta_module
+from app.memory.autosave import AutosavePolicy
+from app.utils.admission import AdmissionController
+from app.utils.tokens import estimate_tokens
+
+WORDS = ("investor deck hiring runway launch blocker sleep cofounder pricing churn roadmap board "
+         "meeting deadline stress focus anxious email sales demo tomorrow friday ship").split()
+
+
+class FakeCompletions:
+    """
+    Counts calls and estimated tokens per call kind.
+    """
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.stats = {}
+
+    def _reply(self) -> str:
+        return " ".join(self.rng.choices(WORDS, k=220))
+
+    def create(self, model, messages, temperature=1, response_format=None, timeout=None, **kwargs):
+        kind = "coach"
+        if response_format and response_format["type"] == "json_schema":
+            kind = "fused"
+            # Most turns state nothing new, and the schema lets them return null
+            delta = None
+            if self.rng.random() < 0.3:
+                delta = {k: [] for k in ("add_goals", "add_next_actions", "completed_actions",
+                                         "add_blockers", "resolved_blockers")}
+                delta.update({k: None for k in ("current_focus", "session_note", "mood_label", "valence",
+                                                "arousal", "stress_level", "confidence_level")})
+                delta["add_next_actions"] = [" ".join(self.rng.choices(WORDS, k=5))]
+            content = json.dumps({"reply": self._reply(), "state_delta": delta})
+        elif response_format:
+            kind = "memory_update"
+            # The updater returns the whole state, so echo OLD_COACH_STATE back
+            prompt = messages[-1]["content"]
+            old_state = prompt[len("OLD_COACH_STATE: "):prompt.index("\n\nDIALOGUE_CHUNK")]
+            content = json.dumps(json.loads(old_state))
+        else:
+            content = self._reply()
+
+        prompt_tokens = estimate_tokens(json.dumps(messages))
+        completion_tokens = estimate_tokens(content)
+        entry = self.stats.setdefault(kind, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+        entry["calls"] += 1
+        entry["prompt_tokens"] += prompt_tokens
+        entry["completion_tokens"] += completion_tokens
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens),
+        )
+
+
+def run_session(fused: bool, turns: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    completions = FakeCompletions(rng)
+    fake_client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    db = InMemorySupabase()
+    shared_cache._cache = InMemoryCache()
+    policy = AutosavePolicy(cache=shared_cache._cache)
+    admission = AdmissionController(max_concurrency=4, max_queue=4, user_rate=1e9, user_burst=1e9)
+
+    with patch("app.llm.responder.client", fake_client), \
+         patch("app.memory.updater.client", fake_client), \
+         patch("app.db.coach_state_repo.supabase", db), \
+         patch("app.db.recent_turns_repo.supabase", db), \
+         patch("app.db.emotion_series_repo.supabase", db), \
+         patch("app.core.chat.autosave_policy", policy), \
+         patch("app.core.chat.admission", admission), \
+         patch("app.memory.updater.admission", admission), \
+         patch("app.core.chat.COACH_FUSED_MODE", fused), \
+         patch("builtins.print", lambda *a, **k: None):
+        for _ in range(turns):
+            message = " ".join(rng.choices(WORDS, k=40))
+            chat.chat_turn("bench_user", message)
+        # Session end flushes the remaining backlog, as the sweeper would
+        policy.end_session("bench_user")
+        policy.process_due()
+        delta_module._executor.submit(lambda: None).result()
+
+    totals = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    for entry in completions.stats.values():
+        for key in totals:
+            totals[key] += entry[key]
+    return {"by_kind": completions.stats, "total": totals}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    classic = run_session(False, args.turns, args.seed)
+    fused = run_session(True, args.turns, args.seed)
+
+    for name, result in (("classic", classic), ("fused", fused)):
+        print(f"{name:8s} total: {result['total']}")
+        for kind, entry in sorted(result["by_kind"].items()):
+            print(f"{'':8s} {kind:14s} {entry}")
+
+    def saving(key):  # percent saved by fused mode
+        before, after = classic["total"][key], fused["total"][key]
+        return 100.0 * (before - after) / before if before else 0.0
+
+    for key in ("calls", "prompt_tokens", "completion_tokens"):
+        print(f"{key}: {classic['total'][key]} -> {fused['total'][key]} ({-saving(key):+.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Precision/recall of the memory-update change detector on labeled dialogue
+chunks, and the share of updater LLM calls it would save.
+
+Positive class = "a memory update is warranted". Recall is the number to
+watch: a false negative defers a real state change until the next update.
+
+    python -m benchmarks.eval_change_detector
+    python -m benchmarks.eval_change_detector --threshold 1.5 --show-errors
+"""
+import json
+import argparse
+from pathlib import Path
+
+from app.memory.change_detector import assess_dialogue, MEMORY_CHANGE_THRESHOLD
+
+DEFAULT_FIXTURES = Path(__file__).resolve().parent.parent / "tests" / "fixtures" / "memory_change_labels.jsonl"
+
+
+def load_examples(path) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def evaluate(examples: list[dict], threshold: float = None) -> dict:
+    tp = fp = fn = tn = 0
+    errors = []
+    for example in examples:
+        predicted = assess_dialogue(example["chunk"], threshold)
+        if predicted["warranted"] and example["update"]:
+            tp += 1
+        elif predicted["warranted"]:
+            fp += 1
+            errors.append(("false_positive", example["id"], predicted["signals"]))
+        elif example["update"]:
+            fn += 1
+            errors.append(("false_negative", example["id"], predicted["signals"]))
+        else:
+            tn += 1
+    total = len(examples)
+    return {
+        "examples": total,
+        "precision": tp / (tp + fp) if tp + fp else 1.0,
+        "recall": tp / (tp + fn) if tp + fn else 1.0,
+        # Updater calls avoided, relative to calling the LLM for every chunk
+        "calls_saved": (tn + fn) / total if total else 0.0,
+        "missed_updates": fn,
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fixtures", default=str(DEFAULT_FIXTURES))
+    parser.add_argument("--threshold", type=float, default=MEMORY_CHANGE_THRESHOLD)
+    parser.add_argument("--show-errors", action="store_true")
+    args = parser.parse_args()
+
+    result = evaluate(load_examples(args.fixtures), args.threshold)
+    print(f"examples={result['examples']} threshold={args.threshold}")
+    print(f"precision={result['precision']:.2f} recall={result['recall']:.2f} "
+          f"calls_saved={result['calls_saved']:.0%} missed_updates={result['missed_updates']}")
+    if args.show_errors:
+        for kind, example_id, signals in result["errors"]:
+            print(f"  {kind}: {example_id} {signals}")
+
+
+if __name__ == "__main__":
+    main()
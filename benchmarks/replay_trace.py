@@ -0,0 +1,242 @@
+"""
+Replays a recorded trace (APP_TRACE=1) against the app with fake LLM and
+database stand-ins that reproduce the recorded latencies and token counts.
+
+Every traced user becomes one or more virtual users (--clones) that repeat
+the user's calls on the recorded schedule, compressed by --speed. Admission
+control, autosave, caching and the rest of the request path run for real.
+
+    python -m benchmarks.replay_trace traces/trace.ndjson --speed 20 --clones 5
+"""
+import os
+import json
+import time
+import random
+import argparse
+import threading
+import contextvars
+from types import SimpleNamespace
+from unittest.mock import patch
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+os.environ.setdefault("SUPABASE_URL", "https://bench.supabase.co")
+os.environ.setdefault("SUPABASE_ANON_KEY", "bench-key")
+
+import app.db.shared_cache as shared_cache
+import app.core.chat as chat
+from app.db.memory_client import InMemorySupabase
+from app.db.shared_cache import InMemoryCache
+from app.utils.admission import admission
+from app.utils.tracing import load_trace
+
+WORDS = ("investor deck hiring runway launch blocker sleep cofounder pricing churn roadmap board "
+         "meeting deadline stress focus anxious email sales demo tomorrow friday ship").split()
+
+# Trace event being replayed by the current virtual user
+_event = contextvars.ContextVar("replay_event", default={})
+
+
+def _per_call_ms(event: dict, key: str, latency_scale: float) -> float:
+    calls = event.get(f"{key}_n") or 0
+    return (event.get(f"{key}_ms", 0.0) / calls) * latency_scale if calls else 0.0
+
+
+def _text(rng, chars: int) -> str:
+    words = []
+    while sum(len(w) + 1 for w in words) < chars:
+        words.append(rng.choice(WORDS))
+    return " ".join(words)[:max(chars, 1)]
+
+
+class FakeCompletions:
+    """
+    OpenAI stand-in: sleeps for the recorded per-call LLM latency and returns
+    a reply of the recorded size with matching usage.
+    """
+
+    def __init__(self, latency_scale: float, seed: int):
+        self.latency_scale = latency_scale
+        self.rng = random.Random(seed)
+
+    def create(self, model, messages, temperature=1, response_format=None, timeout=None, **kwargs):
+        event = _event.get()
+        time.sleep(_per_call_ms(event, "llm", self.latency_scale) / 1000)
+        calls = event.get("llm_n") or 1
+        completion_tokens = (event.get("ct") or 0) // calls or 50
+
+        if response_format and response_format["type"] == "json_schema":
+            delta = {k: [] for k in ("add_goals", "add_next_actions", "completed_actions",
+                                     "add_blockers", "resolved_blockers")}
+            delta.update({k: None for k in ("current_focus", "session_note", "mood_label", "valence",
+                                            "arousal", "stress_level", "confidence_level")})
+            content = json.dumps({"reply": _text(self.rng, completion_tokens * 4), "state_delta": delta})
+        elif response_format:
+            # Memory updater: echo OLD_COACH_STATE back as the new state
+            prompt = messages[-1]["content"]
+            content = prompt[len("OLD_COACH_STATE: "):prompt.index("\n\nDIALOGUE_CHUNK")]
+        else:
+            content = event.get("out") and _text(self.rng, event["out"]) or _text(self.rng, completion_tokens * 4)
+
+        usage = SimpleNamespace(prompt_tokens=(event.get("pt") or 0) // calls, completion_tokens=completion_tokens)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=usage)
+
+
+class SlowQuery:
+    """
+    Wraps the in-memory database so every .execute() takes the recorded
+    per-call DB latency of the event being replayed.
+    """
+
+    def __init__(self, target, latency_scale: float):
+        self._target = target
+        self._latency_scale = latency_scale
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name == "execute":
+            def execute(*args, **kwargs):
+                time.sleep(_per_call_ms(_event.get(), "db", self._latency_scale) / 1000)
+                return attr(*args, **kwargs)
+            return execute
+        if not callable(attr):
+            return attr
+
+        def wrapped(*args, **kwargs):
+            return SlowQuery(attr(*args, **kwargs), self._latency_scale)
+        return wrapped
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+class Replayer:
+    """
+    Drives the core chat pipeline from a trace with concurrent virtual users.
+    """
+
+    def __init__(self, events: list[dict], speed: float = 1.0, clones: int = 1,
+                 latency_scale: float = 1.0, jitter: float = 1.0, seed: int = 0):
+        self.events = events
+        self.speed = speed
+        self.clones = clones
+        self.latency_scale = latency_scale
+        self.jitter = jitter
+        self.seed = seed
+        self.results = []  # (op, latency_ms, ok, lag_ms)
+        self._lock = threading.Lock()
+
+    def _virtual_users(self) -> dict[str, list[dict]]:
+        by_user = {}
+        for event in self.events:
+            by_user.setdefault(event.get("u") or "anon", []).append(event)
+        return {f"replay-{u}-{i}": events for u, events in by_user.items() for i in range(self.clones)}
+
+    def _call(self, user_id: str, event: dict, rng) -> bool:
+        op = event["op"]
+        if op == "load_user_state":
+            chat.load_user(user_id)
+        elif op == "process_message":
+            chat.chat_turn(user_id, _text(rng, event.get("in", 80)))
+        elif op == "update_memory":
+            return chat.run_memory_update(user_id)[0]
+        return True
+
+    def _run_user(self, user_id: str, events: list[dict], start: float, base_ts: float) -> None:
+        rng = random.Random(f"{self.seed}:{user_id}")
+        offset = rng.uniform(0, self.jitter)
+        for event in events:
+            due = start + offset + (event["ts"] - base_ts) / self.speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            token = _event.set(event)
+            began = time.perf_counter()
+            try:
+                ok = self._call(user_id, event, rng)
+            except Exception:
+                ok = False
+            finally:
+                _event.reset(token)
+            elapsed = (time.perf_counter() - began) * 1000
+            with self._lock:
+                self.results.append((event["op"], elapsed, ok, max(0.0, began - due) * 1000))
+
+    def run(self) -> dict:
+        fake_client = SimpleNamespace(chat=SimpleNamespace(
+            completions=FakeCompletions(self.latency_scale, self.seed)
+        ))
+        db = SlowQuery(InMemorySupabase(), self.latency_scale)
+        shared_cache._cache = InMemoryCache()
+        base_ts = self.events[0]["ts"] if self.events else 0.0
+
+        with patch("app.llm.responder.client", fake_client), \
+             patch("app.memory.updater.client", fake_client), \
+             patch("app.db.coach_state_repo.supabase", db), \
+             patch("app.db.recent_turns_repo.supabase", db), \
+             patch("app.db.emotion_series_repo.supabase", db), \
+             patch("builtins.print", lambda *a, **k: None):
+            start = time.perf_counter()
+            threads = [
+                threading.Thread(target=self._run_user, args=(user_id, events, start, base_ts), daemon=True)
+                for user_id, events in self._virtual_users().items()
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            wall = time.perf_counter() - start
+
+        return self.report(wall, len(threads))
+
+    def report(self, wall: float, virtual_users: int) -> dict:
+        by_op = {}
+        for op, latency, ok, lag in self.results:
+            entry = by_op.setdefault(op, {"latencies": [], "errors": 0, "lags": []})
+            entry["latencies"].append(latency)
+            entry["lags"].append(lag)
+            entry["errors"] += not ok
+        span = (self.events[-1]["ts"] - self.events[0]["ts"]) if self.events else 0.0
+        return {
+            "virtual_users": virtual_users,
+            "calls": len(self.results),
+            "trace_seconds": round(span, 1),
+            "wall_seconds": round(wall, 2),
+            "throughput_per_s": round(len(self.results) / wall, 2) if wall else 0.0,
+            "ops": {
+                op: {
+                    "calls": len(e["latencies"]),
+                    "errors": e["errors"],
+                    "p50_ms": round(_percentile(e["latencies"], 50), 1),
+                    "p95_ms": round(_percentile(e["latencies"], 95), 1),
+                    "p99_ms": round(_percentile(e["latencies"], 99), 1),
+                    "max_ms": round(max(e["latencies"]), 1),
+                    # How far behind schedule calls started (client-side saturation)
+                    "p95_lag_ms": round(_percentile(e["lags"], 95), 1),
+                }
+                for op, e in sorted(by_op.items())
+            },
+            "admission": admission.metrics(),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("trace", help="NDJSON trace recorded with APP_TRACE=1")
+    parser.add_argument("--speed", type=float, default=1.0, help="time compression, e.g. 1-100")
+    parser.add_argument("--clones", type=int, default=1, help="virtual users per traced user")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="multiplier for recorded LLM/DB latency")
+    parser.add_argument("--jitter", type=float, default=1.0, help="max start offset per virtual user (seconds)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    events = load_trace(args.trace)
+    replayer = Replayer(events, args.speed, args.clones, args.latency_scale, args.jitter, args.seed)
+    print(json.dumps(replayer.run(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
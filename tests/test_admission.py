@@ -0,0 +1,129 @@
+import time
+import threading
+import unittest
+from app.utils.admission import (
+    AdmissionController, AdmissionRejected, remaining_time, timeout_kwargs, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+)
+from unittest.mock import MagicMock, patch
+
+class TestAdmission(unittest.TestCase):
+    def _hold_slot(self, controller, release: threading.Event):
+        started = threading.Event()
+
+        def worker():
+            with controller.admit(timeout=5):
+                started.set()
+                release.wait()
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        started.wait()
+        return thread
+
+    def test_queue_full_rejects_fast(self):
+        controller = AdmissionController(max_concurrency=1, max_queue=0, user_rate=100)
+        release = threading.Event()
+        holder = self._hold_slot(controller, release)
+
+        with self.assertRaises(AdmissionRejected) as ctx:
+            with controller.admit("u1"):
+                pass
+        self.assertEqual(ctx.exception.reason, "queue_full")
+        release.set()
+        holder.join()
+        self.assertEqual(controller.metrics()["rejected"]["queue_full"], 1)
+
+    def test_queued_request_past_deadline_is_rejected(self):
+        controller = AdmissionController(max_concurrency=1, max_queue=4, user_rate=100)
+        release = threading.Event()
+        holder = self._hold_slot(controller, release)
+
+        start = time.monotonic()
+        with self.assertRaises(AdmissionRejected) as ctx:
+            with controller.admit("u1", timeout=0.05):
+                pass
+        self.assertEqual(ctx.exception.reason, "deadline")
+        self.assertLess(time.monotonic() - start, 1.0)
+        release.set()
+        holder.join()
+        self.assertEqual(controller.metrics()["queue_depth"], 0)
+
+    def test_interactive_served_before_background(self):
+        controller = AdmissionController(max_concurrency=1, max_queue=4, user_rate=100)
+        release = threading.Event()
+        holder = self._hold_slot(controller, release)
+        order = []
+
+        def run(name, priority):
+            with controller.admit(priority=priority, timeout=5):
+                order.append(name)
+
+        background = threading.Thread(target=run, args=("memory", PRIORITY_BACKGROUND))
+        background.start()
+        while controller.metrics()["queue_depth"] < 1:
+            time.sleep(0.001)
+        interactive = threading.Thread(target=run, args=("chat", PRIORITY_INTERACTIVE))
+        interactive.start()
+        while controller.metrics()["queue_depth"] < 2:
+            time.sleep(0.001)
+
+        release.set()
+        for t in (holder, background, interactive):
+            t.join()
+        self.assertEqual(order, ["chat", "memory"])
+
+    def test_per_user_rate_limit(self):
+        controller = AdmissionController(max_concurrency=4, max_queue=4, user_rate=0.001, user_burst=2)
+        for _ in range(2):
+            with controller.admit("u1"):
+                pass
+        with self.assertRaises(AdmissionRejected) as ctx:
+            with controller.admit("u1"):
+                pass
+        self.assertEqual(ctx.exception.reason, "rate_limited")
+        # Other users are unaffected
+        with controller.admit("u2"):
+            pass
+        # A manual memory update is interactive but not a message: no rate check
+        with controller.admit("u1", rate_limit=False):
+            pass
+
+    def test_deadline_propagates(self):
+        controller = AdmissionController(max_concurrency=1, max_queue=0, user_rate=100)
+        self.assertIsNone(remaining_time())
+        with controller.admit(timeout=10):
+            self.assertTrue(0 < remaining_time() <= 10)
+
+    def test_timeout_kwargs_omit_timeout_without_deadline(self):
+        # timeout=None would switch the OpenAI client timeout off
+        self.assertEqual(timeout_kwargs(), {})
+        controller = AdmissionController(max_concurrency=1, max_queue=0, user_rate=100)
+        with controller.admit(timeout=10):
+            self.assertTrue(0 < timeout_kwargs()["timeout"] <= 10)
+
+    @patch('app.llm.responder.client')
+    def test_non_admitted_completion_keeps_client_timeout(self, mock_client):
+        from app.llm.responder import get_message_completion
+        mock_client.chat.completions.create.return_value = MagicMock()
+        get_message_completion([{"role": "user", "content": "hi"}])
+        self.assertNotIn("timeout", mock_client.chat.completions.create.call_args.kwargs)
+
+    def test_deadline_hit_inside_request_is_counted(self):
+        controller = AdmissionController(max_concurrency=1, max_queue=0, user_rate=100)
+        with self.assertRaises(AdmissionRejected):
+            with controller.admit(timeout=0.01):
+                time.sleep(0.02)
+                remaining_time()
+        self.assertEqual(controller.metrics()["rejected"]["deadline"], 1)
+
+    def test_idle_user_buckets_are_evicted(self):
+        controller = AdmissionController(max_concurrency=4, max_queue=4, user_rate=1000, user_burst=1)
+        with patch('app.utils.admission.ADMISSION_BUCKET_SWEEP_SECONDS', 0):
+            for i in range(50):
+                with controller.admit(f"u{i}"):
+                    pass
+                time.sleep(0.002)
+            self.assertLess(controller.metrics()["user_buckets"], 5)
+
+if __name__ == '__main__':
+    unittest.main()
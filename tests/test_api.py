@@ -0,0 +1,76 @@
+import json
+import unittest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from app.api.server import create_api_app
+from app.db.coach_state_repo import INITIAL_STATE
+from app.utils.admission import AdmissionController
+
+def _sse_events(text):
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+@patch('app.core.chat.save_turn_pair')
+@patch('app.core.chat.load_recent_turns', return_value=[])
+@patch('app.core.chat.get_or_create_coach_state', return_value=INITIAL_STATE)
+@patch('app.core.chat.autosave_policy')
+class TestChatAPI(unittest.TestCase):
+    def setUp(self):
+        self.client = TestClient(create_api_app())
+        patcher = patch('app.core.chat.get_trend_summary', return_value="")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch('app.core.chat.get_message_completion', return_value="Ship it today.")
+    def test_json_message(self, mock_completion, mock_policy, _state, _turns, mock_save):
+        response = self.client.post("/api/users/u1/messages", json={"message": "What next?"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"reply": "Ship it today."})
+        mock_save.assert_called_once_with("u1", "What next?", "Ship it today.", archive=None)
+        mock_policy.record_turn.assert_called_once()
+        # Prompt ends with the new message; no client-side history is needed
+        self.assertEqual(mock_completion.call_args[0][0][-1], {"role": "user", "content": "What next?"})
+
+    @patch('app.core.chat.stream_message_completion', return_value=iter(["Ship ", "it."]))
+    def test_sse_stream(self, _stream, mock_policy, _state, _turns, mock_save):
+        response = self.client.post("/api/users/u1/messages", json={"message": "Hi", "stream": True})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/event-stream"))
+        self.assertEqual(_sse_events(response.text), [
+            ("token", {"text": "Ship "}), ("token", {"text": "it."}), ("done", {"reply": "Ship it."})
+        ])
+        mock_save.assert_called_once_with("u1", "Hi", "Ship it.", archive=None)
+
+    @patch('app.core.chat.get_message_completion', return_value="ok")
+    def test_rate_limited_maps_to_429(self, _completion, mock_policy, _state, _turns, mock_save):
+        limited = AdmissionController(max_concurrency=2, max_queue=2, user_rate=0.001, user_burst=1)
+        with patch('app.core.chat.admission', limited):
+            self.assertEqual(self.client.post("/api/users/u1/messages", json={"message": "a"}).status_code, 200)
+            response = self.client.post("/api/users/u1/messages", json={"message": "b"})
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("too quickly", response.json()["detail"])
+
+    @patch('app.core.chat.perform_memory_update', return_value=(True, "✓ Memory updated"))
+    def test_state_and_memory_update(self, _update, mock_policy, _state, _turns, mock_save):
+        mock_policy.wait_for_claim.return_value = True
+        with patch('app.api.server.get_or_create_coach_state', return_value=INITIAL_STATE):
+            state = self.client.get("/api/users/u1/state").json()
+        self.assertEqual(state["state"]["goals"], [])
+        self.assertFalse(state["degraded"])
+
+        result = self.client.post("/api/users/u1/memory-update").json()
+        self.assertEqual(result, {"success": True, "message": "✓ Memory updated"})
+        mock_policy.release.assert_called_once_with("u1", processed=True)
+
+        # A running update for the same user is not duplicated
+        mock_policy.wait_for_claim.return_value = False
+        result = self.client.post("/api/users/u1/memory-update").json()
+        self.assertFalse(result["success"])
+        self.assertIn("already in progress", result["message"])
+        _update.assert_called_once()
+
+if __name__ == '__main__':
+    unittest.main()
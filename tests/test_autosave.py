@@ -1,23 +1,103 @@
+import time
+import threading
 import unittest
 from unittest.mock import patch
-from app.memory.autosave import check_and_trigger_autosave
+from app.db.shared_cache import InMemoryCache
+from app.memory.autosave import AutosavePolicy, TRIGGER_TOKENS, TRIGGER_IDLE, TRIGGER_SESSION_END
 
 class TestAutosave(unittest.TestCase):
+    def setUp(self):
+        self.policy = AutosavePolicy(cache=InMemoryCache(), token_threshold=100, idle_seconds=60)
+
     @patch('app.memory.autosave.perform_memory_update')
     def test_trigger_logic(self, mock_perform):
         mock_perform.return_value = (True, "Success")
-        
-        # 9 messages -> 10 (trigger)
-        new_count = check_and_trigger_autosave("user", 9, threshold=10)
-        self.assertEqual(new_count, 0) # Should reset
-        mock_perform.assert_called_once()
-        
-        mock_perform.reset_mock()
-        
-        # 5 messages -> 6 (no trigger)
-        new_count = check_and_trigger_autosave("user", 5, threshold=10)
-        self.assertEqual(new_count, 6)
+
+        # Small exchange stays pending (no trigger)
+        self.assertIsNone(self.policy.record_turn("user", "hi", "hello"))
         mock_perform.assert_not_called()
 
+        # Crossing the token threshold triggers inline and clears the backlog
+        reason = self.policy.record_turn("user", "x" * 400, "y" * 400)
+        self.assertEqual(reason, TRIGGER_TOKENS)
+        mock_perform.assert_called_once_with("user")
+        self.assertEqual(self.policy.pending("user")["turns"], 0)
+
+    @patch('app.memory.autosave.perform_memory_update')
+    def test_failed_update_keeps_pending(self, mock_perform):
+        mock_perform.return_value = (False, "LLM down")
+        self.policy.record_turn("user", "x" * 400, "y" * 400)
+        record = self.policy.pending("user")
+        self.assertEqual(record["turns"], 1)
+        self.assertIsNone(record["claimed_at"])
+
+    def test_covered_turns_wait_for_volume(self):
+        # Fused-mode turns already applied their delta: ending the session is not a reason to update
+        self.policy.record_turn("user", "hi", "hello", token_weight=0.05, covered=True)
+        self.policy.end_session("user")
+        self.assertEqual(self.policy.due_users(now=time.time() + 3600), [])
+
+        # One uncovered turn (unparseable fused output) makes the backlog due again
+        self.policy.record_turn("user", "hi", "hello")
+        self.policy.end_session("user")
+        self.assertEqual([reason for _, reason, _ in self.policy.due_users()], [TRIGGER_SESSION_END])
+
+    def test_counter_shared_across_policies(self):
+        # A reload or second tab uses the same server-side record
+        cache = InMemoryCache()
+        AutosavePolicy(cache=cache, token_threshold=10_000).record_turn("user", "a", "b")
+        AutosavePolicy(cache=cache, token_threshold=10_000).record_turn("user", "c", "d")
+        self.assertEqual(AutosavePolicy(cache=cache).pending("user")["turns"], 2)
+
+    def test_due_on_idle_and_session_end(self):
+        self.policy.record_turn("idle_user", "hi", "hello")
+        self.policy.record_turn("leaving_user", "hi", "hello")
+        self.policy.end_session("leaving_user")
+
+        due = {u: r for u, r, _ in self.policy.due_users()}
+        self.assertEqual(due, {"leaving_user": TRIGGER_SESSION_END})
+
+        idle_at = self.policy.pending("idle_user")["last_activity"] + 61
+        due = {u: r for u, r, _ in self.policy.due_users(now=idle_at)}
+        self.assertEqual(due["idle_user"], TRIGGER_IDLE)
+
+    def test_claim_is_exclusive(self):
+        self.policy.record_turn("user", "hi", "hello")
+        self.assertTrue(self.policy.claim("user"))
+        self.assertFalse(self.policy.claim("user"))
+        self.policy.release("user", processed=True)
+        self.assertEqual(self.policy.pending("user")["turns"], 0)
+
+    def test_manual_claim_waits_for_running_update(self):
+        # Manual updates may claim with nothing pending, but not while held
+        self.assertFalse(self.policy.claim("user"))
+        self.assertTrue(self.policy.wait_for_claim("user", timeout=0))
+        self.assertFalse(self.policy.wait_for_claim("user", timeout=0.05))
+        threading.Timer(0.05, self.policy.release, args=("user", False)).start()
+        self.assertTrue(self.policy.wait_for_claim("user", timeout=2))
+
+    def test_process_due_runs_users_as_a_batch(self):
+        running, peak = [0], [0]
+        lock = threading.Lock()
+
+        def updater(user_id):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+            return True, "ok"
+
+        policy = AutosavePolicy(cache=InMemoryCache(), token_threshold=10_000, updater=updater)
+        for i in range(6):
+            policy.record_turn(f"user{i}", "hi", "hello")
+            policy.end_session(f"user{i}")
+        results = policy.process_due(workers=3)
+        self.assertEqual(len(results), 6)
+        self.assertTrue(all(success for _, success, _ in results))
+        self.assertEqual(peak[0], 3)
+        self.assertEqual(policy.due_users(), [])
+
 if __name__ == '__main__':
     unittest.main()
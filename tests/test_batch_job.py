@@ -0,0 +1,100 @@
+import json
+import time
+import unittest
+from unittest.mock import patch
+from app.db.shared_cache import InMemoryCache
+from app.memory.autosave import AutosavePolicy
+from app.memory.batch_job import (
+    find_pending_users, run_batch, in_batch_window, InlineSubmitter, BatchAPISubmitter, LocalBatchAPI
+)
+from app.utils.rate_limit import TokenBucket
+from datetime import datetime, timezone
+
+class RateLimitError(Exception):
+    status_code = 429
+
+class TestBatchJob(unittest.TestCase):
+    def setUp(self):
+        self.policy = AutosavePolicy(cache=InMemoryCache(), token_threshold=10_000)
+
+    @patch('app.memory.batch_job.count_pending_turns')
+    def test_pending_users_prioritized_by_volume(self, mock_count):
+        mock_count.return_value = [
+            {"user_id": "big", "pending": 30},
+            {"user_id": "small", "pending": 2},
+            {"user_id": "done", "pending": 0},
+        ]
+        self.policy.record_turn("idle", "hi", "hello")
+        self.policy.end_session("idle")
+
+        pending = find_pending_users(self.policy)
+        self.assertEqual(pending, [("big", 30), ("small", 2), ("idle", 1)])
+        mock_count.assert_called_once_with(1000)
+
+    def test_inline_submitter_retries_rate_limits(self):
+        calls = []
+
+        def updater(user_id):
+            calls.append(user_id)
+            if len(calls) == 1:
+                raise RateLimitError("slow down")
+            return True, "ok"
+
+        submitter = InlineSubmitter(max_workers=2, limiter=TokenBucket(1000), backoff=0.01, updater=updater)
+        results = submitter.submit(["u1"])
+        self.assertEqual(results, {"u1": (True, "ok")})
+        self.assertEqual(calls, ["u1", "u1"])
+
+    @patch('app.memory.batch_job.apply_memory_update')
+    @patch('app.memory.batch_job.prepare_memory_update')
+    def test_batch_api_submitter_applies_results(self, mock_prepare, mock_apply):
+        mock_prepare.side_effect = lambda user_id: ({"goals": []}, "User: I'll ship the beta on Friday.", ("t1", 7), 3, False) if user_id == "u1" else ({}, "", None, None, False)
+        mock_apply.return_value = (True, "saved")
+        api = LocalBatchAPI(completion_fn=lambda body: {
+            "choices": [{"message": {"content": json.dumps({"goals": ["new"]})}}]
+        })
+
+        results = BatchAPISubmitter(api, poll_interval=0).submit(["u1", "u2"])
+        self.assertEqual(results["u1"], (True, "saved"))
+        self.assertFalse(results["u2"][0])
+        mock_apply.assert_called_once_with("u1", {"goals": ["new"]}, ("t1", 7), 3)
+
+    @patch('app.memory.batch_job.count_pending_turns', return_value=[])
+    def test_run_batch_clears_policy_backlog(self, mock_count):
+        self.policy.record_turn("u1", "hi", "hello")
+        self.policy.end_session("u1")
+        submitter = InlineSubmitter(limiter=TokenBucket(1000), updater=lambda user_id: (True, "ok"))
+
+        results = run_batch(submitter=submitter, policy=self.policy)
+        self.assertEqual(results, {"u1": (True, "ok")})
+        self.assertEqual(self.policy.pending("u1")["turns"], 0)
+
+    @patch('app.memory.batch_job.count_pending_turns')
+    def test_run_batch_holds_claims_for_long_jobs(self, mock_count):
+        mock_count.return_value = [{"user_id": "u1", "pending": 4}, {"user_id": "busy", "pending": 3}]
+        policy = AutosavePolicy(cache=InMemoryCache(), claim_timeout=0.15)
+        self.assertTrue(policy.claim("busy", allow_empty=True))
+        retaken = []
+
+        def slow_update(user_id):
+            # Outlive the claim timeout several times over
+            for _ in range(4):
+                time.sleep(0.1)
+                retaken.append(policy.claim(user_id, allow_empty=True))
+            return True, "ok"
+
+        submitter = InlineSubmitter(limiter=TokenBucket(1000), updater=slow_update)
+        results = run_batch(submitter=submitter, policy=policy)
+        self.assertEqual(results, {"u1": (True, "ok")})
+        self.assertEqual(retaken, [False] * 4)
+        self.assertTrue(policy.claim("u1", allow_empty=True))
+
+    def test_batch_window(self):
+        at = lambda h: datetime(2026, 1, 1, h, 0, tzinfo=timezone.utc)
+        self.assertTrue(in_batch_window("", at(12)))
+        self.assertTrue(in_batch_window("01:00-06:00", at(3)))
+        self.assertFalse(in_batch_window("01:00-06:00", at(12)))
+        self.assertTrue(in_batch_window("22:00-04:00", at(23)))
+
+if __name__ == '__main__':
+    unittest.main()
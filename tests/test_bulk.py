@@ -0,0 +1,144 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from app.db.bulk import Checkpoint, export_all_turns, export_states, import_file
+from app.db.coach_state_repo import INITIAL_STATE
+from app.db.memory_client import InMemorySupabase
+from app.db.shared_cache import InMemoryCache
+from app.memory.backfill import backfill_user, run_backfill
+from app.utils.admission import remaining_time
+from app.utils.rate_limit import TokenBucket
+
+def _seed(db, users=3, turns=5):
+    for u in range(users):
+        user_id = f"user{u}"
+        db.table("coach_state").insert({"user_id": user_id, "state_json": dict(INITIAL_STATE, current_focus=user_id),
+                                        "version": 2}).execute()
+        for t in range(turns):
+            db.table("recent_turns").insert({"user_id": user_id, "role": "user" if t % 2 == 0 else "assistant",
+                                             "content": f"{user_id} message {t}",
+                                             "created_at": f"2026-01-01T00:00:{t:02d}+00:00"}).execute()
+
+class TestBulk(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = patch('app.db.coach_state_repo.get_shared_cache', return_value=InMemoryCache())
+        self.cache.start()
+        self.sync_sequence = patch('app.db.bulk.sync_turn_id_sequence', return_value=15)
+        self.mock_sync = self.sync_sequence.start()
+
+    def tearDown(self):
+        self.sync_sequence.stop()
+        self.cache.stop()
+        self.tmp.cleanup()
+
+    def _path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def _use(self, db):
+        return patch('app.db.coach_state_repo.supabase', db), patch('app.db.recent_turns_repo.supabase', db)
+
+    def test_export_import_roundtrip_is_idempotent(self):
+        source, target = InMemorySupabase(), InMemorySupabase()
+        _seed(source)
+        a, b = self._use(source)
+        with a, b:
+            self.assertEqual(export_states(self._path("states.ndjson.gz"), page_size=2), 3)
+            written, failed = export_all_turns(self._path("turns.ndjson"), ["user0", "user1", "user2"], workers=2)
+        self.assertEqual((written, failed), (15, []))
+
+        a, b = self._use(target)
+        with a, b:
+            import_file("coach_state", self._path("states.ndjson.gz"), batch_size=2, workers=2)
+            for _ in range(2):
+                import_file("recent_turns", self._path("turns.ndjson"), batch_size=4, workers=3)
+        self.assertEqual(len(target.rows("recent_turns")), 15)
+        # Imported ids are explicit, so the id sequence is moved past them after each import
+        self.assertEqual(self.mock_sync.call_count, 2)
+        states = {r["user_id"]: r for r in target.rows("coach_state")}
+        self.assertEqual(states["user1"]["state_json"]["current_focus"], "user1")
+        self.assertEqual(states["user1"]["version"], 2)
+
+    def test_checkpoint_resumes_import(self):
+        source = InMemorySupabase()
+        _seed(source, users=2, turns=4)
+        a, b = self._use(source)
+        with a, b:
+            export_all_turns(self._path("turns.ndjson"), ["user0", "user1"])
+
+        checkpoint_path = self._path("import.ckpt")
+        checkpoint = Checkpoint(checkpoint_path)
+        checkpoint.mark("0")
+        target = InMemorySupabase()
+        a, b = self._use(target)
+        with a, b:
+            written, _ = import_file("recent_turns", self._path("turns.ndjson"), batch_size=4,
+                                     checkpoint=Checkpoint(checkpoint_path))
+        # Batch 0 (user0's turns) was skipped
+        self.assertEqual(written, 4)
+        self.assertEqual({r["user_id"] for r in target.rows("recent_turns")}, {"user1"})
+        self.assertIn("1", Checkpoint(checkpoint_path))
+
+    @patch('app.memory.backfill.safe_update_coach_state')
+    def test_backfill_chains_windows_and_checkpoints(self, mock_update):
+        db = InMemorySupabase()
+        _seed(db, users=2, turns=5)
+        windows = []
+
+        def update(state, chunk):
+            # Each window runs admitted, under the memory-update deadline
+            self.assertIsNotNone(remaining_time())
+            windows.append(chunk)
+            return dict(state, last_session_summary=chunk.splitlines()[-1]), True, "Success"
+        mock_update.side_effect = update
+
+        checkpoint = Checkpoint(self._path("backfill.ckpt"))
+        a, b = self._use(db)
+        with a, b, patch('app.db.emotion_series_repo.supabase', db), \
+                patch('app.db.emotion_series_repo.get_shared_cache', return_value=InMemoryCache()):
+            results = run_backfill(["user0", "user1"], workers=2, from_scratch=True,
+                                   checkpoint=checkpoint, limiter=TokenBucket(1000))
+            self.assertTrue(all(success for success, _ in results.values()))
+            # Rerun skips checkpointed users
+            self.assertEqual(run_backfill(["user0", "user1"], checkpoint=checkpoint, limiter=TokenBucket(1000)), {})
+
+        self.assertEqual(len(windows), 2)  # 5 turns per user fit in one 40-turn window
+        saved = {r["user_id"]: r["state_json"] for r in db.rows("coach_state")}
+        self.assertEqual(saved["user0"]["last_session_summary"], "User: user0 message 4")
+        # The last turn read is the processed-turn watermark, not the save time
+        last_turn = [r for r in db.rows("recent_turns") if r["user_id"] == "user0"][-1]
+        state_row = next(r for r in db.rows("coach_state") if r["user_id"] == "user0")
+        self.assertEqual((state_row["processed_turn_at"], state_row["processed_turn_id"]),
+                         (last_turn["created_at"], last_turn["id"]))
+        # Each window lands in the emotional time series at the time of its last turn, not today
+        self.assertEqual(sorted((r["user_id"], r["resolution"], r["bucket"]) for r in db.rows("emotion_series")),
+                         [("user0", "day", "2026-01-01"), ("user0", "week", "2025-12-29"),
+                          ("user1", "day", "2026-01-01"), ("user1", "week", "2025-12-29")])
+        day = next(r for r in db.rows("emotion_series") if r["resolution"] == "day")
+        self.assertEqual(day["ts"], ["2026-01-01T00:00:04+00:00"])
+
+    @patch('app.memory.backfill.safe_update_coach_state')
+    def test_backfill_windows_fit_the_chunk_budget(self, mock_update):
+        db = InMemorySupabase()
+        _seed(db, users=1, turns=0)
+        db.table("recent_turns").insert([
+            {"user_id": "user0", "role": "user", "content": f"turn {t:02d} " + "x" * 400,
+             "created_at": f"2026-01-01T00:00:{t:02d}+00:00"}
+            for t in range(30)
+        ]).execute()
+        windows = []
+        mock_update.side_effect = lambda state, chunk: (windows.append(chunk) or dict(state), True, "Success")
+
+        a, b = self._use(db)
+        with a, b, patch('app.memory.backfill.record_state_snapshot'):
+            success, _ = backfill_user("user0", TokenBucket(1000), from_scratch=True)
+        self.assertTrue(success)
+        # 30 turns of ~410 characters: a 40-turn window would overrun 6000 characters
+        self.assertEqual(len(windows), 3)
+        self.assertTrue(all(len(chunk) <= 6000 for chunk in windows))
+        seen = [line[len("User: "):len("User: turn 00")] for chunk in windows for line in chunk.splitlines()]
+        self.assertEqual(seen, [f"turn {t:02d}" for t in range(30)])
+
+if __name__ == '__main__':
+    unittest.main()
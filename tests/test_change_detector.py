@@ -0,0 +1,56 @@
+import unittest
+from unittest.mock import patch
+from app.memory.change_detector import assess_dialogue, should_update
+from app.memory.updater import perform_memory_update
+
+class TestChangeDetector(unittest.TestCase):
+    def test_signals_come_from_user_lines_only(self):
+        chunk = "User: ok\nAssistant: Set a goal to launch by Friday and hire a designer.\nUser: sure"
+        self.assertFalse(should_update(chunk))
+
+        result = assess_dialogue("User: I'm stuck, the launch slipped and I'm anxious.\nAssistant: Let's look at it.")
+        self.assertTrue(result["warranted"])
+        self.assertEqual(set(result["signals"]), {"blocker", "goal", "emotion"})
+
+    def test_date_alone_is_not_enough(self):
+        self.assertFalse(should_update("User: see you tomorrow\nAssistant: See you!"))
+
+    def test_long_backlog_always_updates(self):
+        chunk = "\n".join(["User: lol", "Assistant: :)"] * 20)
+        self.assertEqual(assess_dialogue(chunk)["signals"], {"backlog": 40})
+        self.assertTrue(should_update(chunk))
+
+    def test_typographic_apostrophes_match(self):
+        self.assertEqual(assess_dialogue("User: I’ll call the bank")["signals"], {"commitment": 1})
+
+    def test_keywords_match_whole_words_only(self):
+        self.assertFalse(should_update("User: our relationship is fine, just a shipment of books"))
+        self.assertEqual(assess_dialogue("User: we shipped it")["signals"], {"progress": 1})
+
+    def test_continuation_lines_keep_their_speaker(self):
+        chunk = "User: ok\nthough I can't sleep lately\nAssistant: hmm\nlet's set a goal and launch"
+        self.assertEqual(assess_dialogue(chunk)["signals"], {"blocker": 1, "emotion": 1})
+
+    def test_each_signal_scores_once(self):
+        result = assess_dialogue("User: see you tomorrow, and friday too, 12/03")
+        self.assertEqual(result["signals"], {"date": 2})
+        self.assertEqual(result["score"], 0.5)
+        self.assertFalse(result["warranted"])
+
+    @patch('app.memory.updater.advance_turn_watermark')
+    @patch('app.memory.updater.safe_update_coach_state')
+    @patch('app.memory.updater.prepare_memory_update', return_value=({"goals": []}, "User: thanks!\nAssistant: Anytime.", ("t1", 1), 1, False))
+    def test_updater_skips_small_talk_unless_forced(self, _prepare, mock_update, mock_advance):
+        success, message = perform_memory_update("u1")
+        self.assertTrue(success)
+        self.assertIn("skipped", message)
+        mock_update.assert_not_called()
+        # The skipped turns count as processed
+        mock_advance.assert_called_once_with("u1", ("t1", 1))
+
+        mock_update.return_value = ({"goals": []}, False, "invalid")
+        perform_memory_update("u1", force=True)
+        mock_update.assert_called_once()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import time
+import socket
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+from app.db import coach_state_repo
+from app.db.coach_state_repo import (
+    FallbackStateError, INITIAL_STATE, get_or_create_coach_state, is_fallback_state, save_coach_state
+)
+from app.db.memory_client import InMemorySupabase
+from app.db.shared_cache import InMemoryCache
+from postgrest.exceptions import APIError
+from app.utils.circuit_breaker import (
+    CircuitBreaker, CircuitOpenError, GuardedClient, CLOSED, OPEN, HALF_OPEN, _is_supabase_failure
+)
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_opens_after_threshold_and_fails_fast(self):
+        breaker = CircuitBreaker("dep", failure_threshold=2, reset_timeout=60)
+        failing = MagicMock(side_effect=TimeoutError("slow"))
+        for _ in range(2):
+            with self.assertRaises(TimeoutError):
+                breaker.call(failing)
+        self.assertEqual(breaker.state, OPEN)
+
+        with self.assertRaises(CircuitOpenError):
+            breaker.call(failing)
+        # The dependency is not called while open
+        self.assertEqual(failing.call_count, 2)
+        self.assertEqual(breaker.metrics()["rejected_total"], 1)
+
+    def test_half_open_probe_closes_or_reopens(self):
+        breaker = CircuitBreaker("dep", failure_threshold=1, reset_timeout=0.01)
+        with self.assertRaises(ValueError):
+            breaker.call(MagicMock(side_effect=ValueError()))
+        time.sleep(0.02)
+        self.assertEqual(breaker.state, HALF_OPEN)
+
+        with self.assertRaises(ValueError):
+            breaker.call(MagicMock(side_effect=ValueError()))
+        self.assertEqual(breaker.state, OPEN)
+
+        time.sleep(0.02)
+        self.assertEqual(breaker.call(lambda: "ok"), "ok")
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_non_failures_do_not_trip(self):
+        breaker = CircuitBreaker("dep", failure_threshold=1, is_failure=lambda e: not isinstance(e, KeyError))
+        with self.assertRaises(KeyError):
+            breaker.call(MagicMock(side_effect=KeyError()))
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_supabase_client_errors_are_not_outages(self):
+        for code in ("23505", "42703", "PGRST204", "400"):
+            self.assertFalse(_is_supabase_failure(APIError({"code": code, "message": "x"})), code)
+        for exc in (APIError({"code": "PGRST000", "message": "x"}), APIError({"code": "503", "message": "x"}),
+                    APIError({"code": "57014", "message": "statement timeout"}), ConnectionError("reset")):
+            self.assertTrue(_is_supabase_failure(exc), exc)
+
+    def test_guarded_client_routes_execute_through_breaker(self):
+        db = InMemorySupabase()
+        breaker = CircuitBreaker("db", failure_threshold=1, reset_timeout=60)
+        client = GuardedClient(db, breaker)
+        client.table("t").insert({"user_id": "u"}).execute()
+        self.assertEqual(len(client.table("t").select("*").eq("user_id", "u").execute().data), 1)
+
+        breaker._on_failure()
+        with self.assertRaises(CircuitOpenError):
+            client.table("t").select("*").execute()
+
+class TestFallbackState(unittest.TestCase):
+    def setUp(self):
+        coach_state_repo._last_known_good.clear()
+
+    @patch('app.db.coach_state_repo.get_shared_cache', return_value=InMemoryCache())
+    def test_fallback_serves_last_known_good_and_refuses_save(self, _cache):
+        db = InMemorySupabase()
+        state = dict(INITIAL_STATE, current_focus="Hiring")
+        db.table("coach_state").insert({"user_id": "u1", "state_json": state, "version": 1}).execute()
+
+        with patch('app.db.coach_state_repo.supabase', db):
+            self.assertFalse(is_fallback_state(get_or_create_coach_state("u1")))
+
+        down = MagicMock()
+        down.table.side_effect = CircuitOpenError("supabase", 10)
+        with patch('app.db.coach_state_repo.get_shared_cache', return_value=InMemoryCache()), \
+             patch('app.db.coach_state_repo.supabase', down):
+            fallback = get_or_create_coach_state("u1")
+            self.assertTrue(is_fallback_state(fallback))
+            self.assertEqual(fallback["current_focus"], "Hiring")
+            self.assertTrue(is_fallback_state(get_or_create_coach_state("unknown")))
+
+            with self.assertRaises(FallbackStateError):
+                save_coach_state("u1", fallback)
+            down.table.assert_called()
+            self.assertEqual(down.table.call_count, 2)
+
+    def test_last_known_good_is_bounded(self):
+        with patch('app.db.coach_state_repo.COACH_STATE_FALLBACK_MAX_USERS', 2):
+            for user_id in ("u1", "u2", "u3"):
+                coach_state_repo._remember(user_id, dict(INITIAL_STATE, current_focus=user_id))
+            coach_state_repo._remember("u2", dict(INITIAL_STATE, current_focus="u2 again"))
+            coach_state_repo._remember("u4", dict(INITIAL_STATE, current_focus="u4"))
+        self.assertEqual(list(coach_state_repo._last_known_good), ["u2", "u4"])
+        self.assertEqual(coach_state_repo._fallback("u1")["current_focus"], "")
+
+class TestOpenAITimeout(unittest.TestCase):
+    def test_non_admitted_call_times_out_and_feeds_breaker(self):
+        from openai import APITimeoutError
+        from app.llm.client import client, OPENAI_MAX_RETRIES
+        from app.llm.responder import get_message_completion
+
+        # A server that accepts connections and never answers
+        server = socket.socket()
+        server.bind(("127.0.0.1", 0))
+        server.listen(8)
+        accepted = []
+        threading.Thread(target=lambda: [accepted.append(server.accept()) for _ in range(4)], daemon=True).start()
+        self.addCleanup(server.close)
+
+        self.assertEqual(client.max_retries, OPENAI_MAX_RETRIES)
+        hanging = client.with_options(base_url=f"http://127.0.0.1:{server.getsockname()[1]}/v1", timeout=0.3)
+        breaker = CircuitBreaker("openai", failure_threshold=1)
+        with patch('app.llm.responder.client', hanging), patch('app.llm.responder.openai_breaker', breaker):
+            start = time.monotonic()
+            with self.assertRaises(APITimeoutError):
+                get_message_completion([{"role": "user", "content": "hi"}])
+        # One attempt at the client timeout, not the 600s SDK default or 3x retries
+        self.assertLess(time.monotonic() - start, 0.3 * (OPENAI_MAX_RETRIES + 1) + 1.0)
+        self.assertEqual(breaker.state, OPEN)
+
+if __name__ == '__main__':
+    unittest.main()
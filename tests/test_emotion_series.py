@@ -0,0 +1,115 @@
+import copy
+import unittest
+from datetime import date, datetime, timedelta, timezone
+from unittest.mock import patch
+from app.db.coach_state_repo import INITIAL_STATE
+from app.db.emotion_series_repo import (
+    append_emotion_snapshot, get_trend_summary, iter_emotion_points, load_rollups,
+    record_state_snapshot, snapshot_from_state, summarize_trends
+)
+from app.db.memory_client import InMemorySupabase
+from app.db.shared_cache import InMemoryCache
+
+def _state(valence, stress):
+    state = copy.deepcopy(INITIAL_STATE)
+    state["last_emotional_state"]["valence"] = valence
+    state["pattern_analysis"]["stress_level"] = stress
+    state["pattern_analysis"]["confidence_level"] = None
+    return state
+
+class TestEmotionSeries(unittest.TestCase):
+    def setUp(self):
+        self.db = InMemorySupabase()
+        self.cache = InMemoryCache()
+        for target, value in (('supabase', self.db), ('get_shared_cache', lambda: self.cache)):
+            patcher = patch(f'app.db.emotion_series_repo.{target}', value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.monday = datetime(2026, 3, 2, 9, tzinfo=timezone.utc)
+
+    def _append(self, days_after_monday, valence, stress):
+        at = self.monday + timedelta(days=days_after_monday)
+        append_emotion_snapshot("u1", snapshot_from_state(_state(valence, stress)), at=at)
+
+    def test_snapshot_skips_missing_values(self):
+        self.assertEqual(snapshot_from_state(_state(0.5, 7)),
+                         {"valence": 0.5, "arousal": 0.0, "stress_level": 7.0})
+        self.assertIsNone(snapshot_from_state({"goals": []}))
+        self.assertFalse(record_state_snapshot("u1", {"goals": []}))
+
+    def test_day_rows_hold_columnar_points_and_rollups(self):
+        self._append(0, 0.2, 4)
+        self._append(0, 0.4, 6)
+        self._append(8, -0.5, 9)  # following week
+
+        [day] = load_rollups("u1", "day", "2026-03-02")[:1]
+        self.assertEqual((day["bucket"], day["n"]), ("2026-03-02", 2))
+        self.assertEqual(day["sum"]["stress_level"], 10.0)
+        self.assertEqual((day["min"]["stress_level"], day["max"]["stress_level"]), (4.0, 6.0))
+        raw = next(r for r in self.db.rows("emotion_series") if r["resolution"] == "day" and r["n"] == 2)
+        self.assertEqual(raw["stress_level"], [4.0, 6.0])
+        self.assertEqual(raw["confidence_level"], [None, None])
+
+        weeks = load_rollups("u1", "week", "2026-01-01")
+        self.assertEqual([(w["bucket"], w["n"]) for w in weeks], [("2026-03-02", 2), ("2026-03-09", 1)])
+        self.assertNotIn("stress_level", weeks[0])
+
+        points = list(iter_emotion_points("u1"))
+        self.assertEqual([p["valence"] for p in points], [0.2, 0.4, -0.5])
+
+    def test_concurrent_append_is_not_lost(self):
+        self._append(0, 0.2, 4)
+        real_table = self.db.table
+        raced = []
+
+        def table(name):
+            query = real_table(name)
+            real_update = query.update
+
+            def update(values):
+                if not raced:
+                    # Another worker appends between this read and this write
+                    raced.append(True)
+                    self._append(0, 0.6, 5)
+                return real_update(values)
+            query.update = update
+            return query
+
+        with patch.object(self.db, 'table', table):
+            self._append(0, 0.4, 6)
+        day = next(r for r in self.db.rows("emotion_series") if r["resolution"] == "day")
+        week = next(r for r in self.db.rows("emotion_series") if r["resolution"] == "week")
+        self.assertEqual((day["n"], week["n"]), (3, 3))
+        self.assertEqual(sorted(day["valence"]), [0.2, 0.4, 0.6])
+
+    def test_trend_summary_from_rollups(self):
+        for week, stress in enumerate((3, 4, 6, 8)):
+            self._append(7 * week, 0.5, stress)
+        summary = summarize_trends("u1", weeks=4, today=date(2026, 3, 23))
+        self.assertIn("stress_level: weekly avg 3.0, 4.0, 6.0, 8.0 (rising)", summary)
+        self.assertIn("last 7 days avg 8.0, range 8.0-8.0", summary)
+        self.assertIn("valence: weekly avg 0.5, 0.5, 0.5, 0.5 (steady)", summary)
+        self.assertNotIn("confidence_level", summary)
+        self.assertEqual(summarize_trends("nobody", today=date(2026, 3, 23)), "")
+
+    def test_cached_summary_is_invalidated_by_new_snapshot(self):
+        self.assertEqual(get_trend_summary("u1"), "")
+        # The empty summary is cached: no query per chat turn for new users
+        with patch('app.db.emotion_series_repo.summarize_trends') as mock_summarize:
+            get_trend_summary("u1")
+        mock_summarize.assert_not_called()
+
+        self.assertTrue(record_state_snapshot("u1", _state(0.1, 5)))
+        self.assertIn("stress_level: weekly avg 5.0", get_trend_summary("u1"))
+
+    @patch('app.core.chat.load_recent_turns', return_value=[])
+    @patch('app.core.chat.get_or_create_coach_state', return_value=INITIAL_STATE)
+    def test_prompt_includes_trends(self, _state_mock, _turns):
+        from app.core.chat import build_messages
+        self.assertFalse(any("EMOTIONAL_TRENDS" in m["content"] for m in build_messages("u1", "hi")))
+        record_state_snapshot("u1", _state(0.1, 5))
+        messages = build_messages("u1", "hi")
+        self.assertTrue(messages[3]["content"].startswith("EMOTIONAL_TRENDS:\n"))
+
+if __name__ == '__main__':
+    unittest.main()
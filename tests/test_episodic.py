@@ -0,0 +1,121 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from app.db.bulk import Checkpoint
+from app.db.memory_client import InMemorySupabase
+from app.db.recent_turns_repo import iter_turns, prune_recent_turns
+from app.memory.backfill import index_episodic_history
+from app.memory.episodic import EpisodicMemory, HashingEmbedder, VectorIndex
+
+class TestEpisodicMemory(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.memory = EpisodicMemory(self.tmpdir.name, HashingEmbedder(dim=128))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_retrieves_relevant_old_turn(self):
+        self.memory.add_turns("u1", [
+            {"role": "user", "content": "My blocker is the investor deck for Acme, I keep procrastinating on it"},
+            {"role": "user", "content": "I went running this morning"},
+            {"role": "user", "content": "Lunch was great today"},
+        ])
+        hits = self.memory.retrieve("u1", "any progress on the investor deck blocker?", min_score=0.1)
+        self.assertTrue(hits)
+        self.assertIn("investor deck", hits[0]["content"])
+
+    def test_exclude_and_token_budget(self):
+        long_turn = "deck " * 400
+        self.memory.add_turns("u1", [
+            {"role": "user", "content": "deck review tomorrow"},
+            {"role": "user", "content": long_turn},
+        ])
+        hits = self.memory.retrieve("u1", "deck", token_budget=50, exclude={"deck review tomorrow"}, min_score=0)
+        self.assertEqual(hits, [])
+
+    def test_users_are_isolated(self):
+        self.memory.add_turns("u1", [{"role": "user", "content": "secret launch plan"}])
+        self.assertEqual(self.memory.retrieve("u2", "launch plan", min_score=0), [])
+
+    def test_retrieve_does_not_create_an_index(self):
+        self.assertEqual(self.memory.retrieve("nobody", "anything", min_score=0), [])
+        self.assertEqual(os.listdir(self.tmpdir.name), [])
+
+    def test_least_recently_used_index_is_closed(self):
+        memory = EpisodicMemory(self.tmpdir.name, HashingEmbedder(dim=32), max_open=2)
+        for user_id in ("u1", "u2", "u3"):
+            memory.add_turns(user_id, [{"role": "user", "content": f"{user_id} shipped the deck"}])
+        self.assertEqual(list(memory._indexes), ["u2", "u3"])
+        # An evicted user's index is reopened from disk
+        self.assertEqual(memory.retrieve("u1", "shipped the deck", min_score=0)[0]["content"], "u1 shipped the deck")
+        self.assertEqual(list(memory._indexes), ["u3", "u1"])
+
+    def test_closed_index_maps_the_file_again(self):
+        embedder = HashingEmbedder(dim=16)
+        index = VectorIndex(self.tmpdir.name + "/idx", 16, initial_capacity=2)
+        index.append(embedder.embed(["first turn"]), [{"role": "user", "content": "first turn"}])
+        index.close()
+        self.assertIsNone(index._matrix)
+        index.append(embedder.embed(["second turn"]), [{"role": "user", "content": "second turn"}])
+        self.assertEqual(index.search(embedder.embed(["second turn"])[0], 1)[0][0], 1)
+
+    def test_index_grows_and_reopens(self):
+        embedder = HashingEmbedder(dim=16)
+        index = VectorIndex(self.tmpdir.name + "/idx", 16, initial_capacity=2)
+        texts = [f"turn number {i}" for i in range(5)]
+        index.append(embedder.embed(texts), [{"role": "user", "content": t} for t in texts])
+
+        reopened = VectorIndex(self.tmpdir.name + "/idx", 16, initial_capacity=2)
+        self.assertEqual(len(reopened), 5)
+        row, score = reopened.search(embedder.embed(["turn number 3"])[0], 1)[0]
+        self.assertEqual(reopened.meta[row]["content"], "turn number 3")
+        self.assertAlmostEqual(score, 1.0, places=5)
+
+class TestEpisodicIndexing(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.memory = EpisodicMemory(self.tmpdir.name, HashingEmbedder(dim=64))
+        self.db = InMemorySupabase()
+        for t in range(7):
+            self.db.table("recent_turns").insert({"user_id": "u1", "role": "user", "content": f"old turn {t}",
+                                                  "created_at": f"2026-01-01T00:00:{t:02d}+00:00"}).execute()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_indexing_pass_is_idempotent(self):
+        self.memory.add_turns("u1", [{"role": "user", "content": "old turn 6"}])
+        with patch('app.db.recent_turns_repo.supabase', self.db):
+            first = index_episodic_history(["u1"], memory=self.memory, workers=1,
+                                           checkpoint=Checkpoint(), page_size=3)
+            second = index_episodic_history(["u1"], memory=self.memory, workers=1,
+                                            checkpoint=Checkpoint(), page_size=3)
+        self.assertEqual(first, {"u1": 6})
+        self.assertEqual(second, {"u1": 0})
+        self.assertEqual(len(self.memory._index("u1")), 7)
+
+    def test_pruned_turns_are_archived_into_the_index(self):
+        archive = lambda rows: self.memory.add_turns("u1", rows, skip_indexed=True)
+        with patch('app.db.recent_turns_repo.supabase', self.db):
+            prune_recent_turns("u1", keep_last=2, archive=archive)
+        self.assertEqual(len(self.db.rows("recent_turns")), 2)
+        indexed = [m["content"] for m in self.memory._index("u1").meta]
+        self.assertEqual(indexed, [f"old turn {t}" for t in range(5)])
+
+    def test_prune_keeps_turns_when_the_archive_read_fails(self):
+        def failing_pages(user_id, **kwargs):
+            # A strict stream raises on a failed page instead of ending early
+            self.assertTrue(kwargs.get("strict"))
+            yield from list(iter_turns(user_id, strict=True))[:2]
+            raise RuntimeError("timeout")
+
+        archive = lambda rows: self.memory.add_turns("u1", rows, skip_indexed=True)
+        with patch('app.db.recent_turns_repo.supabase', self.db), \
+                patch('app.db.recent_turns_repo.iter_turns', side_effect=failing_pages):
+            prune_recent_turns("u1", keep_last=2, archive=archive)
+        self.assertEqual(len(self.db.rows("recent_turns")), 7)
+
+if __name__ == '__main__':
+    unittest.main()
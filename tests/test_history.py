@@ -0,0 +1,140 @@
+import json
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+from fastapi.testclient import TestClient
+from app.api.server import create_api_app
+from app.core.history import SessionHistory, SessionStore
+from app.db.coach_state_repo import INITIAL_STATE
+from app.db.memory_client import InMemorySupabase
+
+class TestSessionHistory(unittest.TestCase):
+    def test_window_and_load_earlier(self):
+        history = SessionHistory("u1", window=4, max_messages=10)
+        for i in range(6):
+            history.append({"role": "user", "content": f"q{i}"}, {"role": "assistant", "content": f"a{i}"})
+        # Only the bounded tail is kept and rendered
+        self.assertEqual(len(history.messages), 10)
+        self.assertEqual([m["content"] for m in history.visible()], ["q4", "a4", "q5", "a5"])
+        self.assertTrue(history.has_earlier())
+
+        self.assertEqual(len(history.load_earlier()), 8)
+        self.assertEqual(len(history.load_earlier()), 10)
+        self.assertFalse(history.has_earlier())
+
+        # A new turn scrolls back to the newest window
+        history.append({"role": "user", "content": "q6"})
+        self.assertEqual([m["content"] for m in history.visible()], ["a4", "q5", "a5", "q6"])
+
+    def test_concurrent_append_and_read(self):
+        history = SessionHistory("u1", window=4, max_messages=50)
+        errors = []
+
+        def write():
+            for i in range(2000):
+                history.append({"role": "user", "content": f"q{i}"})
+
+        def read():
+            try:
+                for _ in range(2000):
+                    history.visible()
+                    history.load_earlier()
+            except RuntimeError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=write), threading.Thread(target=read)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+
+class TestSessionStore(unittest.TestCase):
+    def test_least_recently_used_is_evicted(self):
+        store = SessionStore(max_sessions=2)
+        store.start("a", "u1")
+        store.start("b", "u2")
+        store.get("a")
+        store.start("c", "u3")
+        self.assertEqual(len(store), 2)
+        self.assertIsNone(store.get("b"))
+        self.assertIsNotNone(store.get("a"))
+
+    @patch('app.core.history.time.monotonic')
+    def test_idle_sessions_expire(self, mock_now):
+        store = SessionStore(idle_seconds=60)
+        mock_now.return_value = 1000.0
+        store.start("u1", "u1")
+        store.start("u2", "u2")
+        mock_now.return_value = 1050.0
+        self.assertIsNotNone(store.get("u2"))
+        mock_now.return_value = 1100.0
+        self.assertIsNone(store.get("u1"))
+        self.assertIsNotNone(store.get("u2"))
+        self.assertEqual(len(store), 1)
+
+@patch('app.ui.gradio_app.chat_turn', side_effect=lambda user_id, message: f"re: {message}")
+class TestWindowedChat(unittest.TestCase):
+    def setUp(self):
+        from app.ui import gradio_app
+        self.ui = gradio_app
+        self.store = SessionStore(window=6)
+        patcher = patch('app.ui.gradio_app.session_store', self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.request = MagicMock(session_hash="tab-1")
+
+    def test_payload_stays_flat(self, _chat):
+        with patch('app.ui.gradio_app.load_user', return_value=INITIAL_STATE):
+            user_id, window, _, _ = self.ui.load_user_state("u1", self.request)
+        self.assertEqual(window, [])
+
+        sizes = []
+        for i in range(50):
+            window, cleared, earlier = self.ui.process_message(f"msg {i}", user_id, self.request)
+            sizes.append(len(json.dumps(window)))
+        self.assertEqual(cleared, "")
+        self.assertEqual(len(window), 6)
+        self.assertEqual(window[-1], {"role": "assistant", "content": "re: msg 49"})
+        self.assertTrue(earlier.visible)
+        # Response size is bounded by the window, not the session length
+        self.assertLess(max(sizes[10:]) - min(sizes[10:]), 10)
+
+        window, _ = self.ui.load_earlier(user_id, self.request)
+        self.assertEqual(window[0]["content"], "msg 44")
+        self.assertEqual(len(window), 12)
+
+    def test_sessions_are_isolated_and_dropped(self, _chat):
+        other = MagicMock(session_hash="tab-2")
+        self.ui.process_message("mine", "u1", self.request)
+        window, _, _ = self.ui.process_message("theirs", "u2", other)
+        self.assertEqual([m["content"] for m in window], ["theirs", "re: theirs"])
+
+        with patch('app.ui.gradio_app.end_session') as mock_end:
+            self.ui.end_user_session(self.request)
+        mock_end.assert_called_once_with("u1")
+        self.assertIsNone(self.store.get("tab-1"))
+
+class TestHistoryAPI(unittest.TestCase):
+    def test_paged_history(self):
+        db = InMemorySupabase()
+        db.table("recent_turns").insert([
+            {"user_id": "u1", "role": "user" if i % 2 == 0 else "assistant", "content": f"t{i}",
+             "created_at": f"2026-01-01T00:00:{i // 2:02d}+00:00"}
+            for i in range(9)
+        ]).execute()
+        client = TestClient(create_api_app())
+        with patch('app.db.recent_turns_repo.supabase', db):
+            pages, before = [], None
+            while True:
+                params = {"limit": 4, **({"before": before} if before else {})}
+                body = client.get("/api/users/u1/history", params=params).json()
+                pages.append([m["content"] for m in body["messages"]])
+                before = body["before"]
+                if not before:
+                    break
+            self.assertEqual(client.get("/api/users/u1/history", params={"before": "x"}).status_code, 400)
+        self.assertEqual(pages, [["t5", "t6", "t7", "t8"], ["t1", "t2", "t3", "t4"], ["t0"]])
+
+if __name__ == '__main__':
+    unittest.main()
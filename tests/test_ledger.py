@@ -0,0 +1,117 @@
+import time
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+from app.db.memory_client import InMemorySupabase
+from app.db.usage_repo import compact_usage_day, daily_totals, insert_usage_rows, top_consumers
+from app.utils.circuit_breaker import CircuitBreaker, OPEN
+from app.utils.ledger import UsageLedger, usage_context
+
+def _completion(prompt, completion, cached=0):
+    return SimpleNamespace(usage=SimpleNamespace(
+        prompt_tokens=prompt, completion_tokens=completion,
+        prompt_tokens_details=SimpleNamespace(cached_tokens=cached)
+    ))
+
+class TestUsageLedger(unittest.TestCase):
+    def setUp(self):
+        self.ledger = UsageLedger(sink=MagicMock())
+        self.patcher = patch('app.utils.circuit_breaker.usage_ledger', self.ledger)
+        self.patcher.start()
+        self.breaker = CircuitBreaker("openai", failure_threshold=100)
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def test_calls_roll_up_per_user_and_call_type(self):
+        with usage_context("u1", "chat"):
+            for _ in range(3):
+                self.breaker.call(lambda: _completion(100, 20, cached=64))
+        with usage_context("u1", "memory_update"):
+            self.breaker.call(lambda: _completion(500, 300))
+            with usage_context(retry=True):
+                self.breaker.call(lambda: _completion(520, 310))
+            with self.assertRaises(TimeoutError):
+                self.breaker.call(MagicMock(side_effect=TimeoutError()))
+        # Non-OpenAI dependencies are not accounted
+        CircuitBreaker("supabase").call(lambda: None)
+
+        rows = {r["call_type"]: r for r in self.ledger.snapshot()}
+        self.assertEqual(set(rows), {"chat", "memory_update"})
+        chat = rows["chat"]
+        self.assertEqual((chat["calls"], chat["prompt_tokens"], chat["completion_tokens"], chat["cached_tokens"]),
+                         (3, 300, 60, 192))
+        update = rows["memory_update"]
+        self.assertEqual((update["calls"], update["retries"], update["errors"]), (3, 1, 1))
+        self.assertEqual(update["prompt_tokens"], 1020)
+
+        self.assertEqual(self.ledger.flush(), 2)
+        [rows_written] = self.ledger.sink.call_args[0]
+        self.assertEqual(len(rows_written), 2)
+        self.assertEqual(self.ledger.snapshot(), [])
+
+    def test_failed_flush_keeps_counts(self):
+        self.ledger.sink.side_effect = ConnectionError("down")
+        with usage_context("u1", "chat"):
+            self.breaker.call(lambda: _completion(10, 5))
+        self.assertEqual(self.ledger.flush(), 0)
+        with usage_context("u1", "chat"):
+            self.breaker.call(lambda: _completion(10, 5))
+        [row] = self.ledger.snapshot()
+        self.assertEqual((row["calls"], row["prompt_tokens"]), (2, 20))
+
+    def test_streams_are_recorded_when_they_end(self):
+        def stream(fail=False):
+            yield SimpleNamespace(usage=None)
+            time.sleep(0.02)
+            if fail:
+                raise ConnectionError("reset mid-stream")
+            yield _completion(40, 12)
+
+        breaker = CircuitBreaker("openai", failure_threshold=1)
+        with usage_context("u1", "chat"):
+            self.assertEqual(len(list(breaker.call_stream(stream))), 2)
+            with self.assertRaises(ConnectionError):
+                list(breaker.call_stream(stream, fail=True))
+        [row] = self.ledger.snapshot()
+        self.assertEqual((row["calls"], row["errors"], row["prompt_tokens"]), (2, 1, 40))
+        # Wall time covers the whole stream, not just opening it
+        self.assertGreaterEqual(row["wall_ms"], 40)
+        self.assertEqual(breaker.state, OPEN)
+
+    def test_batch_usage_dicts(self):
+        self.ledger.add_usage({"prompt_tokens": 7, "completion_tokens": 3,
+                               "prompt_tokens_details": {"cached_tokens": 2}}, user_id="u9", call_type="batch")
+        self.ledger.add_usage(None, user_id="u9", call_type="batch", calls=1, errors=1)
+        [row] = self.ledger.snapshot()
+        self.assertEqual((row["user_id"], row["calls"], row["errors"], row["cached_tokens"]), ("u9", 1, 1, 2))
+
+class TestUsageQueries(unittest.TestCase):
+    @patch('app.db.usage_repo.datetime')
+    def test_top_consumers_daily_totals_and_compaction(self, mock_datetime):
+        from datetime import datetime, timezone
+        mock_datetime.now.return_value = datetime(2026, 3, 10, tzinfo=timezone.utc)
+        db = InMemorySupabase()
+        row = dict(calls=1, retries=0, errors=0, cached_tokens=0, wall_ms=100.0)
+        with patch('app.db.usage_repo.supabase', db):
+            insert_usage_rows([
+                dict(row, day="2026-03-10", user_id="heavy", call_type="chat", prompt_tokens=900, completion_tokens=100),
+                dict(row, day="2026-03-10", user_id="heavy", call_type="chat", prompt_tokens=900, completion_tokens=100),
+                dict(row, day="2026-03-09", user_id="light", call_type="chat", prompt_tokens=90, completion_tokens=10),
+                dict(row, day="2026-03-09", user_id="light", call_type="memory_update", prompt_tokens=50, completion_tokens=50),
+                dict(row, day="2026-01-01", user_id="old", call_type="chat", prompt_tokens=10 ** 6, completion_tokens=0),
+            ])
+            top = top_consumers(days=7)
+            self.assertEqual([(r["user_id"], r["total_tokens"]) for r in top], [("heavy", 2000), ("light", 200)])
+            self.assertEqual([r["user_id"] for r in top_consumers(days=7, call_type="memory_update")], ["light"])
+
+            daily = daily_totals(days=7)
+            self.assertEqual([(r["day"], r["call_type"], r["calls"]) for r in daily],
+                             [("2026-03-09", "chat", 1), ("2026-03-09", "memory_update", 1), ("2026-03-10", "chat", 2)])
+
+            self.assertEqual(compact_usage_day("2026-03-10"), 2)
+            [compacted] = [r for r in db.rows("usage_ledger") if r["day"] == "2026-03-10"]
+            self.assertEqual((compacted["calls"], compacted["prompt_tokens"]), (2, 1800))
+
+if __name__ == '__main__':
+    unittest.main()
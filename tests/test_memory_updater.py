@@ -1,6 +1,7 @@
 import unittest
 from unittest.mock import MagicMock, patch
-from app.memory.updater import safe_update_coach_state
+from app.memory.updater import perform_memory_update, safe_update_coach_state
+from app.utils.admission import AdmissionController
 
 class TestMemoryUpdater(unittest.TestCase):
     @patch('app.memory.updater.client')
@@ -58,5 +59,16 @@ class TestMemoryUpdater(unittest.TestCase):
         self.assertTrue(success)
         self.assertEqual(result["user_profile"]["name"], "Test")
 
+    @patch('app.memory.updater._save_updated_state', return_value=(True, "saved"))
+    @patch('app.memory.updater.safe_update_coach_state', return_value=({"goals": []}, True, "ok"))
+    @patch('app.memory.updater.prepare_memory_update', return_value=({"goals": []}, "User: hi", ("t1", 1), 1, False))
+    def test_manual_update_does_not_spend_the_message_rate(self, _prepare, _update, _save):
+        controller = AdmissionController(max_concurrency=2, max_queue=2, user_rate=0.001, user_burst=1)
+        with patch('app.memory.updater.admission', controller):
+            with controller.admit("u1"):
+                pass
+            # The user's one message token is gone; the manual save still runs
+            self.assertEqual(perform_memory_update("u1", force=True, interactive=True), (True, "saved"))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,39 @@
+import os
+import time
+import tempfile
+import unittest
+from unittest.mock import patch
+from app.utils.profiling import Profiler, profiled
+
+def busy_endpoint(n):
+    end = time.perf_counter() + 0.05
+    data = []
+    while time.perf_counter() < end:
+        data.append("x" * 100)
+    return n
+
+class TestProfiling(unittest.TestCase):
+    def test_sampled_call_writes_folded_stacks_and_alloc_report(self):
+        with tempfile.TemporaryDirectory() as out:
+            profiler = Profiler(enabled=True, sample_rate=1.0, interval_ms=1, output_dir=out)
+            with patch('app.utils.profiling.profiler', profiler):
+                wrapped = profiled("busy", trace_allocations=True)(busy_endpoint)
+                self.assertEqual(wrapped(7), 7)
+
+            with open(os.path.join(out, "busy.folded")) as f:
+                lines = f.read().splitlines()
+            self.assertTrue(lines)
+            self.assertTrue(any("busy_endpoint" in line for line in lines))
+            stack, count = lines[0].rsplit(" ", 1)
+            self.assertGreater(int(count), 0)
+            self.assertTrue(os.path.exists(os.path.join(out, "busy.alloc.txt")))
+
+    def test_disabled_profiler_writes_nothing(self):
+        with tempfile.TemporaryDirectory() as out:
+            profiler = Profiler(enabled=False, sample_rate=1.0, output_dir=out)
+            with patch('app.utils.profiling.profiler', profiler):
+                profiled("busy")(busy_endpoint)(1)
+            self.assertEqual(os.listdir(out), [])
+
+if __name__ == '__main__':
+    unittest.main()
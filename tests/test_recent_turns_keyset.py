@@ -0,0 +1,145 @@
+import io
+import json
+import unittest
+from unittest.mock import patch
+from app.db.memory_client import InMemorySupabase
+from app.db.coach_state_repo import INITIAL_STATE
+from app.db.recent_turns_repo import iter_turns, prune_recent_turns, export_turns, load_turns_after
+from app.db.shared_cache import InMemoryCache
+from app.memory.dialogue_chunk import build_dialogue_chunk, select_dialogue_turns
+from app.memory.updater import perform_memory_update, prepare_memory_update
+
+class TestRecentTurnsKeyset(unittest.TestCase):
+    def setUp(self):
+        self.db = InMemorySupabase()
+        patcher = patch('app.db.recent_turns_repo.supabase', self.db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # 25 turns; several share a created_at so the id tie-breaker matters
+        rows = [
+            {"user_id": "u1", "role": "user", "content": f"msg {i}", "created_at": f"2026-01-01T00:00:{i // 3:02d}+00:00"}
+            for i in range(25)
+        ]
+        self.db.table("recent_turns").insert(rows).execute()
+        self.db.table("recent_turns").insert({"user_id": "u2", "role": "user", "content": "other"}).execute()
+
+    def test_pages_cover_history_in_order(self):
+        for prefetch in (True, False):
+            contents = [t["content"] for t in iter_turns("u1", page_size=4, prefetch=prefetch)]
+            self.assertEqual(contents, [f"msg {i}" for i in range(25)])
+
+    def test_descending_resume_and_since(self):
+        newest = list(iter_turns("u1", page_size=7, descending=True))
+        self.assertEqual(newest[0]["content"], "msg 24")
+        self.assertEqual(len(newest), 25)
+
+        cursor = (newest[9]["created_at"], newest[9]["id"])
+        rest = list(iter_turns("u1", page_size=7, descending=True, after=cursor))
+        self.assertEqual([t["content"] for t in rest], [t["content"] for t in newest[10:]])
+
+        recent = list(iter_turns("u1", since="2026-01-01T00:00:06+00:00", columns="content"))
+        self.assertEqual(recent, [{"content": f"msg {i}"} for i in range(21, 25)])
+
+    def test_prune_keeps_exactly_newest_and_archives_rest(self):
+        archived = []
+        prune_recent_turns("u1", keep_last=10, archive=archived.extend)
+        remaining = [t["content"] for t in iter_turns("u1")]
+        self.assertEqual(remaining, [f"msg {i}" for i in range(15, 25)])
+        self.assertEqual([t["content"] for t in archived], [f"msg {i}" for i in range(15)])
+        # Other users untouched
+        self.assertEqual(len(list(iter_turns("u2"))), 1)
+
+    def test_export_and_streamed_dialogue_chunk(self):
+        out = io.StringIO()
+        self.assertEqual(export_turns("u1", out, page_size=6), 25)
+        first = json.loads(out.getvalue().splitlines()[0])
+        self.assertEqual((first["user_id"], first["content"]), ("u1", "msg 0"))
+
+        chunk = build_dialogue_chunk(iter_turns("u1", page_size=6), max_turns=3)
+        self.assertEqual(chunk, "User: msg 22\nUser: msg 23\nUser: msg 24")
+
+    def test_load_turns_after_is_bounded_and_exclusive(self):
+        oldest = load_turns_after("u1", limit=5)
+        self.assertEqual([t["content"] for t in oldest], [f"msg {i}" for i in range(5)])
+
+        all_turns = list(iter_turns("u1"))
+        cursor = (all_turns[21]["created_at"], all_turns[21]["id"])
+        self.assertEqual([t["content"] for t in load_turns_after("u1", after=cursor)], ["msg 22", "msg 23", "msg 24"])
+
+class TestUpdaterWatermark(unittest.TestCase):
+    def setUp(self):
+        self.db = InMemorySupabase()
+        for target in ('app.db.recent_turns_repo.supabase', 'app.db.coach_state_repo.supabase'):
+            patcher = patch(target, self.db)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for patcher in (patch('app.db.coach_state_repo.get_shared_cache', return_value=InMemoryCache()),
+                        patch('app.memory.updater.record_state_snapshot')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.db.table("coach_state").insert({"user_id": "u1", "state_json": INITIAL_STATE, "version": 1}).execute()
+        self._say("I'll ship the beta on Friday.")
+
+    def _say(self, text):
+        self.db.table("recent_turns").insert([
+            {"user_id": "u1", "role": "user", "content": text},
+            {"user_id": "u1", "role": "assistant", "content": "Noted."},
+        ]).execute()
+
+    @patch('app.memory.updater.safe_update_coach_state')
+    def test_turns_saved_during_update_are_not_lost(self, mock_update):
+        def update(old_state, dialogue_chunk):
+            # The user keeps chatting while the LLM call runs
+            self._say("Also, I'm hiring a designer next week.")
+            return dict(old_state, current_focus="beta"), True, "ok"
+        mock_update.side_effect = update
+
+        success, _ = perform_memory_update("u1", force=True)
+        self.assertTrue(success)
+        self.assertEqual(mock_update.call_args[0][1], "User: I'll ship the beta on Friday.\nAssistant: Noted.")
+
+        _, chunk, _, _, _ = prepare_memory_update("u1")
+        self.assertEqual(chunk, "User: Also, I'm hiring a designer next week.\nAssistant: Noted.")
+
+    def test_watermark_stops_at_the_last_turn_in_the_chunk(self):
+        self.db.table("recent_turns").delete().eq("user_id", "u1").execute()
+        self.db.table("recent_turns").insert([
+            {"user_id": "u1", "role": "user", "content": f"turn {i:02d} " + "x" * 400,
+             "created_at": f"2026-01-01T00:00:{i:02d}+00:00"}
+            for i in range(40)
+        ]).execute()
+        _, chunk, watermark, _, more = prepare_memory_update("u1")
+        self.assertLessEqual(len(chunk), 6000)
+        included = chunk.count("User: turn")
+        self.assertLess(included, 40)
+        self.assertIn(f"turn {included - 1:02d}", chunk.splitlines()[-1])
+        self.assertEqual(watermark[0], f"2026-01-01T00:00:{included - 1:02d}+00:00")
+
+        self.assertTrue(more)
+
+        # A forced update works through the backlog a chunk at a time
+        with patch('app.memory.updater.safe_update_coach_state',
+                   side_effect=lambda state, chunk: (dict(state), True, "ok")) as mock_update:
+            success, message = perform_memory_update("u1", force=True)
+        self.assertTrue(success)
+        chunks = [c.args[1] for c in mock_update.call_args_list]
+        self.assertEqual(chunks[0], chunk)
+        self.assertGreater(len(chunks), 1)
+        self.assertIn(f"({len(chunks)} chunks)", message)
+        seen = [line[len("User: "):len("User: turn 00")] for c in chunks for line in c.splitlines()]
+        self.assertEqual(seen, [f"turn {i:02d}" for i in range(40)])
+        self.assertEqual(prepare_memory_update("u1")[1], "")
+
+    def test_oversized_turn_is_truncated_not_stuck(self):
+        turns = [{"role": "user", "content": "y" * 9000}, {"role": "assistant", "content": "ok"}]
+        self.assertEqual(select_dialogue_turns(turns, max_chars=6000), turns[:1])
+        self.assertEqual(len(build_dialogue_chunk(turns, max_chars=6000)), 6000)
+
+    def test_read_errors_fail_the_update(self):
+        with patch('app.memory.updater.load_turns_after', side_effect=RuntimeError("timeout")):
+            success, message = perform_memory_update("u1", force=True)
+        self.assertFalse(success)
+        self.assertIn("could not load dialogue", message)
+
+if __name__ == '__main__':
+    unittest.main()
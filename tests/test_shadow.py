@@ -0,0 +1,152 @@
+import os
+import json
+import time
+import tempfile
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+from app.llm.shadow import ShadowTraffic, check_output, streamed_response
+from app.db.coach_state_repo import INITIAL_STATE
+
+def _response(content, prompt=100, completion=20):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+                           usage=SimpleNamespace(prompt_tokens=prompt, completion_tokens=completion))
+
+def _client(create):
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+def _wait(shadow, mirrored, timeout=2.0):
+    deadline = time.time() + timeout
+    while shadow.report()["mirrored"] < mirrored and time.time() < deadline:
+        time.sleep(0.01)
+
+class TestShadowTraffic(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.report_path = os.path.join(self.tmp.name, "shadow.json")
+        self.valid = json.dumps({k: v for k, v in INITIAL_STATE.items() if k != "updated_at"})
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_check_output(self):
+        self.assertTrue(check_output("memory_update", self.valid))
+        self.assertFalse(check_output("memory_update", '{"goals": []}'))
+        self.assertFalse(check_output("memory_update", "not json"))
+        self.assertIsNone(check_output("chat", "hi"))
+        self.assertTrue(check_output("fused_chat", '{"reply": "ok", "state_delta": null}'))
+        self.assertFalse(check_output("fused_chat", '{"reply": "ok", "state_delta": []}'))
+        self.assertFalse(check_output("fused_chat", '{"state_delta": {}}'))
+
+    def test_side_by_side_report(self):
+        good = MagicMock(return_value=_response(self.valid, completion=40))
+        bad = MagicMock(side_effect=[_response("{}"), TimeoutError("slow")])
+        shadow = ShadowTraffic(models=["good", "bad@http://local/v1"], sample_rate=1.0,
+                               report_path=self.report_path, report_every=2,
+                               clients={"good": _client(good), "bad@http://local/v1": _client(bad)})
+        request = {"model": "live", "messages": [{"role": "user", "content": "x"}],
+                   "response_format": {"type": "json_object"}}
+        for mirrored in range(1, 3):
+            self.assertTrue(shadow.mirror("memory_update", request, _response(self.valid), 12.0))
+            _wait(shadow, mirrored)
+        # The report is written by the shadow thread right after it counts the call
+        deadline = time.time() + 2.0
+        while not os.path.exists(self.report_path) and time.time() < deadline:
+            time.sleep(0.01)
+
+        # Candidates get the live request with their own model name
+        self.assertEqual(good.call_args.kwargs["model"], "good")
+        self.assertEqual(bad.call_args.kwargs["model"], "bad")
+        self.assertEqual(good.call_args.kwargs["response_format"], {"type": "json_object"})
+
+        with open(self.report_path) as f:
+            rows = json.load(f)["kinds"]["memory_update"]
+        self.assertEqual(rows["live"]["calls"], 2)
+        self.assertEqual(rows["live"]["p50_ms"], 12.0)
+        self.assertEqual(rows["live"]["schema_pass_rate"], 1.0)
+        self.assertEqual(rows["good"]["avg_completion_tokens"], 40.0)
+        self.assertEqual(rows["bad@http://local/v1"]["errors"], 1)
+        self.assertEqual(rows["bad@http://local/v1"]["schema_pass_rate"], 0.0)
+
+    def test_concurrency_is_bounded_and_excess_dropped(self):
+        release = threading.Event()
+        active, peak = [0], [0]
+        lock = threading.Lock()
+
+        def create(**kwargs):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            release.wait(2)
+            with lock:
+                active[0] -= 1
+            return _response("hello")
+
+        shadow = ShadowTraffic(models=["cand"], sample_rate=1.0, max_concurrency=2,
+                               report_path=self.report_path, clients={"cand": _client(create)})
+        request = {"model": "live", "messages": []}
+        mirrored = [shadow.mirror("chat", request, _response("hi"), 5.0) for _ in range(10)]
+        self.assertEqual(sum(mirrored), 2)
+        self.assertEqual(shadow.report()["dropped"], 8)
+        release.set()
+        _wait(shadow, 2)
+        self.assertLessEqual(peak[0], 2)
+        # Slots are free again once the shadow calls finish
+        self.assertTrue(shadow.mirror("chat", request, _response("hi"), 5.0))
+
+    def test_disabled_and_unsampled(self):
+        create = MagicMock()
+        off = ShadowTraffic(models=[], sample_rate=1.0, clients={})
+        self.assertFalse(off.mirror("chat", {"model": "live"}, _response("hi"), 1.0))
+        unsampled = ShadowTraffic(models=["cand"], sample_rate=0.0, clients={"cand": _client(create)})
+        self.assertFalse(unsampled.mirror("chat", {"model": "live"}, _response("hi"), 1.0))
+        create.assert_not_called()
+
+    @patch('app.llm.responder.shadow_traffic')
+    @patch('app.llm.responder.client')
+    def test_live_reply_is_mirrored(self, mock_client, mock_shadow):
+        from app.llm.responder import get_message_completion
+        mock_client.chat.completions.create.return_value = _response("reply")
+        self.assertEqual(get_message_completion([{"role": "user", "content": "hi"}]), "reply")
+        kind, request, response, _ = mock_shadow.mirror.call_args[0]
+        self.assertEqual((kind, request["model"], response.choices[0].message.content),
+                         ("chat", "gpt-5-nano", "reply"))
+        self.assertNotIn("timeout", request)
+
+    @patch('app.llm.responder.shadow_traffic')
+    @patch('app.llm.responder.client')
+    def test_stream_is_mirrored_once_finished(self, mock_client, mock_shadow):
+        from app.llm.responder import stream_message_completion
+        usage = SimpleNamespace(prompt_tokens=50, completion_tokens=2)
+        chunk = lambda text, usage=None: SimpleNamespace(
+            choices=[SimpleNamespace(delta=SimpleNamespace(content=text))] if text else [], usage=usage)
+        mock_client.chat.completions.create.return_value = iter([chunk("Ship "), chunk("it."), chunk(None, usage)])
+        stream = stream_message_completion([{"role": "user", "content": "hi"}])
+        self.assertEqual(next(stream), "Ship ")
+        mock_shadow.mirror.assert_not_called()
+        self.assertEqual(list(stream), ["it."])
+
+        kind, request, response, _ = mock_shadow.mirror.call_args[0]
+        self.assertEqual((kind, response.choices[0].message.content, response.usage), ("chat", "Ship it.", usage))
+        # Candidates replay it as a plain call
+        self.assertNotIn("stream", request)
+        self.assertNotIn("stream_options", request)
+
+    @patch('app.llm.responder.shadow_traffic')
+    @patch('app.llm.responder.client')
+    def test_fused_reply_is_mirrored(self, mock_client, mock_shadow):
+        from app.llm.responder import get_fused_completion
+        mock_client.chat.completions.create.return_value = _response('{"reply": "ok", "state_delta": null}')
+        self.assertEqual(get_fused_completion([{"role": "user", "content": "hi"}]), ("ok", {}))
+        kind, request, _, _ = mock_shadow.mirror.call_args[0]
+        self.assertEqual(kind, "fused_chat")
+        self.assertEqual(request["response_format"]["type"], "json_schema")
+
+    def test_streamed_response_reads_like_a_response(self):
+        response = streamed_response("hello")
+        self.assertEqual(response.choices[0].message.content, "hello")
+        self.assertIsNone(response.usage)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import os
+import tempfile
+import unittest
+from app.db.shared_cache import InMemoryCache, SharedCache
+from app.deploy.cluster import worker_for_user
+
+class TestSharedCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "cache.sqlite3")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_invalidation_visible_across_instances(self):
+        # Two instances on one file behave like two worker processes
+        worker_a = SharedCache(self.path)
+        worker_b = SharedCache(self.path)
+
+        worker_a.set("coach_state:u1", {"goals": ["ship"]})
+        self.assertEqual(worker_b.get("coach_state:u1"), {"goals": ["ship"]})
+
+        worker_b.invalidate("coach_state:u1")
+        self.assertIsNone(worker_a.get("coach_state:u1"))
+
+    def test_stale_generation_write_is_dropped(self):
+        for cache in (InMemoryCache(), SharedCache(self.path)):
+            gen = cache.generation("k")
+            cache.invalidate("k")  # a save happened while we were reading
+            self.assertFalse(cache.set("k", "old", generation=gen))
+            self.assertIsNone(cache.get("k"))
+            self.assertTrue(cache.set("k", "new", generation=cache.generation("k")))
+            self.assertEqual(cache.get("k"), "new")
+
+    def test_update_is_read_modify_write(self):
+        cache = SharedCache(self.path)
+        for _ in range(3):
+            cache.update("counter", lambda old: (old or 0) + 1)
+        self.assertEqual(cache.get("counter"), 3)
+
+class TestRouterAffinity(unittest.TestCase):
+    def test_user_sticks_to_worker(self):
+        first = worker_for_user("alice", 4)
+        self.assertEqual(worker_for_user("alice", 4), first)
+        # Users spread over all workers
+        picked = {worker_for_user(f"user{i}", 4) for i in range(200)}
+        self.assertEqual(picked, {0, 1, 2, 3})
+
+if __name__ == '__main__':
+    unittest.main()
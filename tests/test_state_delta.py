@@ -0,0 +1,119 @@
+import json
+import unittest
+from unittest.mock import MagicMock, patch
+from app.db import coach_state_repo
+from app.db.coach_state_repo import INITIAL_STATE
+from app.db.memory_client import InMemorySupabase
+from app.db.shared_cache import InMemoryCache
+from app.llm.responder import get_fused_completion
+from app.memory.delta import apply_state_delta, is_empty_delta, _apply_and_save
+from app.memory.updater import perform_memory_update
+
+EMPTY_DELTA = {
+    "add_goals": [], "add_next_actions": [], "completed_actions": [], "add_blockers": [],
+    "resolved_blockers": [], "current_focus": None, "session_note": None, "mood_label": None,
+    "valence": None, "arousal": None, "stress_level": None, "confidence_level": None
+}
+
+class TestStateDelta(unittest.TestCase):
+    def test_apply_delta_merges_without_duplicates(self):
+        state = dict(INITIAL_STATE, goals=["Raise seed round"], blockers=[{"title": "No CFO"}],
+                     next_actions=["Email investors", {"action": "Book demo", "status": "open"}, "Call Sam"])
+        delta = dict(EMPTY_DELTA,
+                     add_goals=["raise seed round", "Hire designer"],
+                     completed_actions=["email investors", "book demo"],
+                     resolved_blockers=["no cfo"],
+                     current_focus="Fundraising",
+                     stress_level=7, mood_label="tense")
+
+        new_state = apply_state_delta(state, delta)
+        self.assertEqual(new_state["goals"], ["Raise seed round", "Hire designer"])
+        # Items keep their type: a done string action leaves the list, a dict gets a status
+        self.assertEqual(new_state["next_actions"], [{"action": "Book demo", "status": "done"}, "Call Sam"])
+        self.assertEqual(new_state["blockers"], [])
+        self.assertEqual(new_state["current_focus"], "Fundraising")
+        self.assertEqual(new_state["pattern_analysis"]["stress_level"], 7)
+        self.assertEqual(new_state["last_emotional_state"]["mood_label"], "tense")
+        # Input state is not mutated
+        self.assertEqual(state["goals"], ["Raise seed round"])
+
+    def test_empty_delta(self):
+        self.assertTrue(is_empty_delta(EMPTY_DELTA))
+        self.assertTrue(is_empty_delta(None))
+        self.assertFalse(is_empty_delta(dict(EMPTY_DELTA, valence=0)))
+
+    @patch('app.llm.responder.client')
+    def test_fused_completion_splits_reply_and_delta(self, mock_client):
+        completion = MagicMock()
+        completion.choices = [MagicMock()]
+        completion.choices[0].message.content = json.dumps({"reply": "Do the thing.", "state_delta": EMPTY_DELTA})
+        mock_client.chat.completions.create.return_value = completion
+
+        reply, delta = get_fused_completion([{"role": "user", "content": "hi"}])
+        self.assertEqual(reply, "Do the thing.")
+        self.assertEqual(delta, EMPTY_DELTA)
+
+        completion.choices[0].message.content = json.dumps({"reply": "Nice.", "state_delta": None})
+        self.assertEqual(get_fused_completion([]), ("Nice.", {}))
+
+        completion.choices[0].message.content = "plain text"
+        self.assertEqual(get_fused_completion([]), ("plain text", None))
+
+class TestDeltaConcurrency(unittest.TestCase):
+    def setUp(self):
+        self.db = InMemorySupabase()
+        for patcher in (patch('app.db.coach_state_repo.supabase', self.db),
+                        patch('app.db.recent_turns_repo.supabase', self.db),
+                        patch('app.db.coach_state_repo.get_shared_cache', return_value=InMemoryCache()),
+                        patch('app.memory.updater.record_state_snapshot'),
+                        patch('app.db.emotion_series_repo.supabase', self.db),
+                        patch('app.db.emotion_series_repo.get_shared_cache', return_value=InMemoryCache())):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.db.table("coach_state").insert({"user_id": "u1", "state_json": INITIAL_STATE, "version": 1}).execute()
+        self.db.table("recent_turns").insert({"user_id": "u1", "role": "user", "content": "I'll ship Friday."}).execute()
+
+    def _state(self):
+        return self.db.rows("coach_state")[0]["state_json"]
+
+    @patch('app.memory.updater.safe_update_coach_state')
+    def test_delta_during_full_update_is_not_overwritten(self, mock_update):
+        def update(old_state, dialogue_chunk):
+            if mock_update.call_count == 1:
+                # A fused turn's delta lands while the LLM call runs
+                self.assertTrue(_apply_and_save("u1", dict(EMPTY_DELTA, add_goals=["Hire designer"])))
+            return dict(old_state, current_focus="Ship Friday"), True, "ok"
+        mock_update.side_effect = update
+
+        success, _ = perform_memory_update("u1", force=True)
+        self.assertTrue(success)
+        # The stale result was dropped and the update reran on the new state
+        self.assertEqual(mock_update.call_count, 2)
+        self.assertEqual((self._state()["goals"], self._state()["current_focus"]), (["Hire designer"], "Ship Friday"))
+
+    def test_delta_retries_after_a_concurrent_save(self):
+        real_save = coach_state_repo.save_coach_state
+        calls = []
+
+        def racing_save(user_id, new_state, watermark=None, expected_version=None):
+            if not calls:
+                # Another worker saves first
+                real_save(user_id, dict(INITIAL_STATE, current_focus="Other worker"))
+            calls.append(expected_version)
+            return real_save(user_id, new_state, watermark, expected_version)
+
+        with patch('app.memory.delta.save_coach_state', racing_save):
+            self.assertTrue(_apply_and_save("u1", dict(EMPTY_DELTA, add_goals=["Hire designer"])))
+        self.assertEqual(calls, [1, 2])
+        self.assertEqual((self._state()["goals"], self._state()["current_focus"]), (["Hire designer"], "Other worker"))
+
+    def test_emotional_delta_records_a_snapshot(self):
+        self.assertTrue(_apply_and_save("u1", dict(EMPTY_DELTA, add_goals=["Hire designer"])))
+        self.assertEqual(self.db.rows("emotion_series"), [])
+
+        self.assertTrue(_apply_and_save("u1", dict(EMPTY_DELTA, valence=-0.4, stress_level=8)))
+        day = next(r for r in self.db.rows("emotion_series") if r["resolution"] == "day")
+        self.assertEqual((day["valence"], day["stress_level"]), ([-0.4], [8.0]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+from app.utils.circuit_breaker import CircuitBreaker
+from app.utils.tracing import TraceRecorder, anonymize, load_trace, traced
+from benchmarks.replay_trace import Replayer
+
+class TestTraceRecorder(unittest.TestCase):
+    def test_records_anonymized_event_with_dependency_usage(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            recorder = TraceRecorder(os.path.join(tmp, "trace.ndjson"), enabled=True, salt="s")
+            llm = CircuitBreaker("openai")
+            usage = SimpleNamespace(usage=SimpleNamespace(prompt_tokens=120, completion_tokens=30))
+
+            @traced("chat", describe=lambda arguments, result: {"in": len(arguments["text"]), "out": len(result)})
+            def chat(text, user_id):
+                llm.call(lambda: usage)
+                return "reply"
+
+            with patch('app.utils.tracing.recorder', recorder):
+                self.assertEqual(chat("secret message", "alice"), "reply")
+
+            [event] = load_trace(recorder.path)
+            self.assertEqual(event["op"], "chat")
+            self.assertEqual(event["u"], anonymize("alice", "s"))
+            self.assertEqual((event["in"], event["out"], event["ok"]), (14, 5, 1))
+            self.assertEqual((event["pt"], event["ct"], event["llm_n"]), (120, 30, 1))
+            with open(recorder.path) as f:
+                raw = f.read()
+            self.assertNotIn("alice", raw)
+            self.assertNotIn("secret", raw)
+
+    def test_tracing_requires_a_salt(self):
+        self.assertFalse(TraceRecorder("unused.ndjson", enabled=True).enabled)
+        self.assertTrue(TraceRecorder("unused.ndjson", enabled=True, salt="s").enabled)
+
+    def test_disabled_recorder_is_passthrough(self):
+        recorder = TraceRecorder("unused.ndjson", enabled=False)
+
+        @traced("noop")
+        def noop(user_id):
+            return 1
+
+        with patch('app.utils.tracing.recorder', recorder):
+            self.assertEqual(noop("u"), 1)
+        self.assertFalse(os.path.exists("unused.ndjson"))
+
+class TestReplay(unittest.TestCase):
+    def test_replay_drives_app_with_virtual_users(self):
+        events = []
+        for u in ("a", "b"):
+            events.append({"ts": 0.0, "op": "load_user_state", "u": u, "db_ms": 1.0, "db_n": 1})
+            events.append({"ts": 1.0, "op": "process_message", "u": u, "in": 40, "out": 200,
+                           "llm_ms": 5.0, "llm_n": 1, "ct": 50, "pt": 500, "db_ms": 2.0, "db_n": 4})
+        replayer = Replayer(events, speed=100, clones=2, jitter=0.01)
+        report = replayer.run()
+
+        self.assertEqual(report["virtual_users"], 4)
+        self.assertEqual(report["ops"]["process_message"]["calls"], 4)
+        self.assertEqual(report["ops"]["process_message"]["errors"], 0)
+        self.assertEqual(report["ops"]["load_user_state"]["errors"], 0)
+        # Recorded LLM latency is reproduced
+        self.assertGreaterEqual(report["ops"]["process_message"]["p50_ms"], 5.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -14,6 +14,7 @@ from app.ui.gradio_app import load_user_state, process_message, update_memory
 from app.db.coach_state_repo import get_or_create_coach_state
 from app.db.recent_turns_repo import load_recent_turns, save_turn_pair, prune_recent_turns
 from app.db.supabase_client import supabase
+from app.memory.autosave import autosave_policy
 
 USER_ID = "test_user_verification_v5"
 
@@ -22,7 +23,7 @@ def test_chat_and_persistence():
     
     # 1. Load User State
     print("1. Loading User State...")
-    uid, _, _, status, count = load_user_state(USER_ID)
+    uid, _, status, _ = load_user_state(USER_ID)
     assert uid == USER_ID
     print(f"   Success: {status}")
     
@@ -31,45 +32,33 @@ def test_chat_and_persistence():
     initial_version = state_response.data[0]['version'] if state_response.data else 0
     print(f"   Initial Version: {initial_version}")
     
-    # 2. Send 10 messages to trigger auto-save
+    # 2. Send 10 messages; long enough dialogue crosses the autosave token threshold
     print("2. Sending 10 messages...")
-    history = []
     messages = [
         "Hello", "I am testing", "Is this working?", "Fourth message", "Fifth message",
         "Sixth", "Seventh", "Eighth", "Ninth", "Tenth message"
     ]
     
-    current_count = 0
-    
     for i, msg in enumerate(messages):
-        # Mock history for context
-        # We need to simulate the count increment.
-        # process_message returns new_count.
-        
         # Note: process_message signature: 
-        # (user_message, history, user_id, conv_history, user_msg_count)
+        # (user_message, user_id); history is kept server-side
         
-        history, _, _, new_count = process_message(msg, history, USER_ID, [], current_count)
+        history, _, _ = process_message(msg, USER_ID)
         
         # Verify response is generated (last item in history)
         last_exchange = history[-1]
         assert last_exchange['role'] == 'assistant'
         assert len(last_exchange['content']) > 0
         
-        current_count = new_count
-        print(f"   Sent msg {i+1}, new_count: {current_count}")
+        print(f"   Sent msg {i+1}, pending: {autosave_policy.pending(USER_ID)['tokens']} tokens")
         
-    # 3. Verify Auto-save triggered
-    # Logic: check_and_trigger_autosave resets count to 0 if threshold (10) reached.
-    # So if we sent 10 messages starting from 0, current_count should be 0.
-    assert current_count == 0, f"Expected count 0 after 10 messages, got {current_count}"
-    print("   Auto-save trigger logic (count verification) passed.")
+    # 3. Flush whatever is still pending as if the session ended
+    autosave_policy.end_session(USER_ID)
+    autosave_policy.process_due()
+    assert autosave_policy.pending(USER_ID)['turns'] == 0, "Expected no pending turns after session end"
+    print("   Auto-save trigger logic (pending verification) passed.")
     
     # Verify DB version incremented
-    # Note: process_message calls 'check_and_trigger_autosave'
-    # which calls 'perform_memory_update' (async task usually, but here it's synchronous in autosave.py?)
-    # Let's check imports in gradio_app.py: "from app.memory.autosave import check_and_trigger_autosave"
-    # We assume it runs synchronously or we wait a bit.
     
     updated_response = supabase.table("coach_state").select("version").eq("user_id", USER_ID).execute()
     new_version = updated_response.data[0]['version'] if updated_response.data else 0
@@ -85,7 +74,7 @@ def test_chat_and_persistence():
         
     # 4. Verify Manual Save
     print("4. Testing Manual Update...")
-    msg = update_memory(USER_ID, [])
+    msg = update_memory(USER_ID)
     print(f"   Manual Update Response: {msg}")
     
     final_response = supabase.table("coach_state").select("version").eq("user_id", USER_ID).execute()